@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Shared address dictionary
+
+AddressBook interns every Ethereum address once to an int32 code, in the
+order first seen, and keeps the address as 20 raw bytes in one (n, 20)
+uint8 array. Pipeline frames carry the codes instead of 42-char strings:
+comparisons with the mint or burn address are integer compares, and
+joins against a per-address column (names, followers) are a single take
+from a dense array indexed by code. Strings are only made again by hex,
+when writing results out.
+
+Code -1 means no address (NaN); every array made by table has one extra
+slot at the end so that indexing it with -1 gives the fill value.
+
+    book = AddressBook()
+    codes = book.intern(df["from"].values)
+    names = book.table(book.intern(mapping.Address.values), mapping.Name.values)
+    names[codes], book.hex(codes)
+"""
+
+import numpy as np
+import pandas as pd
+
+def _raw(address):
+    """20 bytes of an address given as 0x string, 20 bytes or a 32-byte topic"""
+    if isinstance(address, str):
+        raw = bytes.fromhex(address[2:] if address[:2] in ("0x", "0X") else address)
+    else:
+        raw = bytes(address)
+    if len(raw) == 32:
+        raw = raw[12:]
+    if len(raw) != 20:
+        raise ValueError("Not an address: {!r}".format(address))
+    return raw
+
+class AddressBook:
+    """
+    Parameters
+    ----------
+    capacity : int
+        addresses preallocated, storage grows by doubling.
+    """
+
+    def __init__(self, capacity=1024):
+        self.raw = np.zeros((max(capacity, 1), 20), dtype=np.uint8)
+        self._codes = {}
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    def memory_bytes(self):
+        """Bytes used by the raw storage actually filled"""
+        return self.n*20
+
+    def add(self, address):
+        """Code of one address, adding it if new"""
+        if isinstance(address, (int, np.integer)):
+            return int(address)
+        raw = _raw(address)
+        code = self._codes.get(raw)
+        if code is None:
+            if self.n == len(self.raw):
+                self.raw = np.concatenate([self.raw, np.zeros_like(self.raw)])
+            code = self._codes[raw] = self.n
+            self.raw[code] = np.frombuffer(raw, dtype=np.uint8)
+            self.n += 1
+        return code
+
+    def code(self, address):
+        """Code of one address, -1 if it isn't in the book"""
+        if isinstance(address, (int, np.integer)):
+            return int(address)
+        return self._codes.get(_raw(address), -1)
+
+    def _map(self, values, get):
+        """Codes of an array of addresses, each distinct value resolved once"""
+        values = np.asarray(values)
+        if values.dtype.kind in "iu":
+            return values.astype(np.int32)
+        codes, uniques = pd.factorize(values.astype(object))
+        mapping = np.array([get(x) for x in uniques] + [-1], dtype=np.int32)
+        return mapping[codes]
+
+    def intern(self, values):
+        """
+        Codes of an array of addresses, adding the new ones
+
+        Addresses can be 0x strings in any case, 20 raw bytes or 32-byte
+        topics; NaN/None give -1. Integer arrays are taken as codes already.
+
+        Returns
+        -------
+        ndarray of int32
+        """
+        return self._map(values, self.add)
+
+    def lookup(self, values):
+        """Codes of an array of addresses without adding any, -1 for unknown ones"""
+        return self._map(values, self.code)
+
+    def hex(self, codes):
+        """Lowercase 0x strings of an array of codes, NaN for -1"""
+        codes = np.asarray(codes, dtype=np.int64)
+        uniques, inverse = np.unique(codes, return_inverse=True)
+        strings = np.array(["0x" + self.raw[c].tobytes().hex() if c >= 0 else np.nan for c in uniques], dtype=object)
+        return strings[inverse.reshape(-1)]
+
+    def table(self, codes, values, fill=np.nan):
+        """
+        Dense per-address array: values at codes, fill everywhere else
+
+        Numeric values give a float64 array, anything else an object array.
+        Index it with a code column to join; it is sized for the addresses
+        in the book now.
+        """
+        values = np.asarray(values)
+        codes = np.asarray(codes)
+        out = np.full(self.n + 1, fill, dtype=np.float64 if values.dtype.kind in "biuf" else object)
+        keep = codes >= 0
+        out[codes[keep]] = values[keep]
+        return out
+
+    def save(self, path):
+        """Write the raw addresses to an .npy file, codes are positions"""
+        np.save(path, self.raw[:self.n])
+
+    @classmethod
+    def load(cls, path):
+        """Book saved with save, same codes"""
+        return cls.from_raw(np.load(path))
+
+    @classmethod
+    def from_raw(cls, raw):
+        """Book of an (n, 20) uint8 array, address i getting code i"""
+        book = cls(capacity=len(raw))
+        book.raw[:len(raw)] = raw
+        book.n = len(raw)
+        book._codes = {row.tobytes(): i for i, row in enumerate(book.raw[:book.n])}
+        return book
@@ -9,10 +9,24 @@ import dash
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
-import networkx as nx
-import pandas as pd
-import numpy as np
+import os
+import json
+import logging
+import threading
+import time
+import flask
+from layout import LAYOUTS, compute_layout, slice_layout
+from figure_cache import FigureCache
+from figure_builder import build_network_figure, decimate, DECIMATE_ABOVE, DECIMATE_TOP_K
+from graph_engine import localize
+from snapshot_store import SnapshotStore, default_sources
+from metrics import REGISTRY, configure_profiler, profiled
+from dataset_manager import DatasetManager
+
+#Per-request timings at debug level
+logger = logging.getLogger(__name__)
 
 ########
 # Data and Variables
@@ -24,144 +38,141 @@ myheading='Who is in your SuperRare Network?'
 githublink='https://github.com/kylejwaters/SuperRare-Network'
 sourceurl='https://superrare.co/'  
 kyletwitter = "https://twitter.com/kylewaters_"
+#Budget for radius 2+ networks: nodes, edges and neighbours followed per node at each hop
+multihop_max_nodes = 1000
+multihop_max_edges = 5000
+multihop_fanout = (None, 25, 10)
+#Output of snapshot.py, the csv above is only read if it is missing
+snapshot_path = os.environ.get("SR_SNAPSHOT_PATH", "superrare_network.srnet")
+#Output of precompute_layout.py
+layout_positions_path = os.environ.get("SR_LAYOUT_PATH", "layout_positions.npz")
+#Set to share rendered figures between gunicorn workers through local disk
+figure_cache_dir = os.environ.get("SR_FIGURE_CACHE_DIR")
+#Optional file naming the snapshot to serve, watched instead of the snapshot
+dataset_marker_path = os.environ.get("SR_DATASET_MARKER")
+#Seconds between checks for a new snapshot
+dataset_poll_seconds = float(os.environ.get("SR_DATASET_POLL_SECONDS", 30))
+#Set to dump the sampled stacks of figure builds slower than this many ms
+slow_request_ms = os.environ.get("SR_SLOW_REQUEST_MS")
+profile_dir = os.environ.get("SR_PROFILE_DIR", "slow_requests")
 
 ###########
 #Load data
 ###########
 
-df_collector_artist_pairs = pd.read_csv(url_github_SR_data)    
-#Create pairings
-df_pairs = pd.DataFrame()
-
-df_collector_artist_pairs["ArtistName"]=df_collector_artist_pairs["ArtistName"].str.replace("@","")
-df_collector_artist_pairs["CollectorName"]=df_collector_artist_pairs["CollectorName"].str.replace("@","")
-df_collector_artist_pairs["CollectorName"] = np.where(df_collector_artist_pairs["CollectorName"].apply(lambda x: len(x) > 40),df_collector_artist_pairs["CollectorName"].str[:5]+"..."+df_collector_artist_pairs["CollectorName"].str[-5:],df_collector_artist_pairs["CollectorName"])
+#Current dataset: node_index (follower counts, roles and hover text keyed by
+#node ID), graph (undirected artist/collector graph over the same node IDs),
+#ranked_graph, prefix_index and the precomputed layout. Memory-mapped from
+#the snapshot and shared by all workers, rebuilt in the background when a
+#new snapshot is published and swapped in whole
+datasets = DatasetManager(snapshot_path, url_github_SR_data, layout_positions_path,
+                          marker_path=dataset_marker_path, poll_interval=dataset_poll_seconds)
 
-#From is artist, to is collector
-df_pairs["From"] = df_collector_artist_pairs["ArtistName"]
-df_pairs["To"] = df_collector_artist_pairs["CollectorName"]
+#Rendered figures keyed by (sr_user, radius, layout mode, dataset version)
+figure_cache = FigureCache(directory=figure_cache_dir)
+figure_cache.set_version(datasets.current.version)
+datasets.on_swap.append(lambda dataset: figure_cache.set_version(dataset.version))
 
-#Remove duplicates
-df_pairs.drop_duplicates(inplace=True)
-#Remove cases where the artist is connected to him/herself 
-df_pairs = df_pairs[df_pairs.From != df_pairs.To].copy()
+#Dated snapshots for the network diff, read in the background from startup
+#(the latest one is downloaded from GitHub); a csv that failed is read
+#again the first time it is needed
+snapshot_store = SnapshotStore(default_sources())
+threading.Thread(target=snapshot_store.prefetch, name="snapshot-prefetch", daemon=True).start()
 
-G=nx.Graph()
-G=nx.from_pandas_edgelist(df_pairs, 'From', 'To')
+if slow_request_ms:
+    configure_profiler(float(slow_request_ms)/1e3, profile_dir)
 
 ##################    
 #Generate a graph from the dataframe
 ##################
-def get_network(sr_user):
-    
-    hub_ego = nx.ego_graph(G, sr_user, radius=1)
-    pos = nx.spring_layout(hub_ego)
-    
-    ## with help from https://plotly.com/python/network-graphs/ ##
-    
-    ###
-    #Edges 
-    ###
-    
-    Xv=[pos[k][0] for k in hub_ego.nodes if k != sr_user]
-    Yv=[pos[k][1] for k in hub_ego.nodes if k != sr_user]
-    Xed=[]
-    Yed=[]
-    for edge in hub_ego.edges:
-        Xed+=[pos[edge[0]][0],pos[edge[1]][0], None]
-        Yed+=[pos[edge[0]][1],pos[edge[1]][1], None]
-    
-    #Edges 
-    trace3=go.Scatter(x=Xed,
-                   y=Yed,
-                   mode='lines',
-                   line=dict(color='rgb(200,200,200)', width=1),
-                   hoverinfo='none'
-                   )
-    
-    colors=[]
-    node_iter = []
-    for k in hub_ego.nodes:
-        if k != sr_user:
-            node_iter.append(k)
-            try:
-                colors.append(int(df_collector_artist_pairs[(df_collector_artist_pairs.ArtistName == k)].iloc[0]["ArtistFollowers"]))
-            except:
-                try:
-                    colors.append(int(df_collector_artist_pairs[(df_collector_artist_pairs.CollectorName == k)].iloc[0]["CollectorFollowers"]))
-                except:
-                    colors.append(0)
-            
-    node_text = ["{} Followers:{}".format(x,colors[i]) for i,x in enumerate(node_iter) if x != sr_user] 
-    
-    profile = "https://superrare.co/{}".format(sr_user)
-    title_graph = "SR users connected to {}: <a href='{}'> {}</a>".format(sr_user,profile,profile)
-    mode_ = "markers+text"
-    
-    #Nodes
-    trace4=go.Scatter(x=Xv,
-                   y=Yv,
-                   mode=mode_,
-                   name='net',
-    marker=dict(
-        showscale=True,
-        # colorscale options
-        #'Greys' | 'YlGnBu' | 'Greens' | 'YlOrRd' | 'Bluered' | 'RdBu' |
-        #'Reds' | 'Blues' | 'Picnic' | 'Rainbow' | 'Portland' | 'Jet' |
-        #'Hot' | 'Blackbody' | 'Earth' | 'Electric' | 'Viridis' |
-        colorscale='Viridis',
-        reversescale=False,
-        color=colors,
-        size=8,
-        colorbar=dict(
-            thickness=15,
-            title='Number of Followers',
-            xanchor='left',
-            titleside='right'
-        ),line_width=2),
-                   text=["{}".format(x,colors[i]) for i,x in enumerate(node_iter) if x != sr_user] ,
-                   hovertext=node_text,
-                   hoverinfo='text',
-                   textposition="bottom center",
-                   )
- 
-    #SR user node
-    trace5=go.Scatter(x=[pos[sr_user][0]],
-                      y=[pos[sr_user][1]],
-                   mode=mode_,
-                   name='net',
-                   marker=dict(symbol='circle-dot',
-                                 size=20,
-                                 color='red',
-                                 line=dict(color='rgb(50,50,50)', width=0.5)
-                                 ),
-                   text=["{}".format(x[0]) for x in nx.degree(hub_ego) if x[0] == sr_user],
-                   hovertext=["{}\nDegree:{}".format(x[0],x[1]) for x in nx.degree(hub_ego) if x[0] == sr_user],
-                   hoverinfo='text'
-                   )
-    
-    #annot="This networkx.Graph has the ----- layout<br>Code:"+\
-    #"<a href='http://nbviewer.ipython.org/gist/empet/07ea33b2e4e0b84193bd'> [2]</a>"
-    
-    data1=[trace3, trace4, trace5]
-    fig1=go.Figure(data=data1,layout=go.Layout(
-                    title='<br>{}'.format(title_graph),
-                    titlefont_size=16,
-                    showlegend=False,
-                    hovermode='closest',
-                    margin=dict(b=20,l=5,r=5,t=40),
-                    #annotations=[ dict(
-                    #    #text="Python code: <a href='https://plotly.com/ipython-notebooks/network-graphs/'> https://plotly.com/ipython-notebooks/network-graphs/</a>",
-                    #    showarrow=False,
-                    #    xref="paper", yref="paper",
-                    #    x=0.005, y=-0.002 ) ],
-                    xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-                    yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
-                    )
-    #fig1['layout']['annotations'][0]['text']=annot
-    fig1.update_layout(transition_duration=500)
+def current_dataset():
+    """
+    Dataset of the current request
+
+    Taken from the manager the first time a request asks and kept for the
+    rest of it, so a request never mixes two versions.
+    """
+    datasets.start()
+    if not flask.has_request_context():
+        return datasets.current
+    if "dataset" not in flask.g:
+        flask.g.dataset = datasets.current
+    return flask.g.dataset
+
+def phase_timer(phase):
+    """Time a phase of get_network in the /metrics histograms"""
+    return REGISTRY.timer("sr_get_network_phase_seconds", phase=phase)
+
+def get_network(sr_user, layout_mode="auto", radius=1, top_k=None, dataset=None):
     
-    return fig1
+    dataset = dataset or current_dataset()
+    node_index, graph, ranked_graph, global_positions = dataset.node_index, dataset.graph, dataset.ranked_graph, dataset.positions
+    hub = node_index.node_id(sr_user)
+    if hub is None:
+        raise KeyError("{} is not in the SuperRare network".format(sr_user))
+    note = None
+    with phase_timer("ego"):
+        if radius == 1:
+            ego_nodes = graph.ego(hub, radius=1)
+            #Huge hubs only show their best-followed neighbours
+            if top_k is None and len(ego_nodes) - 1 > DECIMATE_ABOVE:
+                top_k = DECIMATE_TOP_K
+            ego_nodes, hidden = decimate(ego_nodes, node_index.followers[ego_nodes], top_k)
+            if hidden:
+                note = "top {} by followers shown, {} more not shown".format(len(ego_nodes) - 1, hidden)
+            #Edges as positions in ego_nodes, hub is 0
+            edge_u, edge_v = graph.local_edges(ego_nodes)
+        else:
+            #Bounded expansion, best-followed first, so big hubs can't stall a worker
+            sample = ranked_graph.ego_budget(hub, radius=radius, max_nodes=multihop_max_nodes,
+                                             max_edges=multihop_max_edges, fanout=multihop_fanout,
+                                             priority=node_index.followers)
+            ego_nodes = sample.nodes
+            edge_u, edge_v = localize(ego_nodes, sample.edge_u, sample.edge_v)
+            cut = sample.truncated
+            if cut["fanout"] or cut["nodes"] or cut["edges"]:
+                note = "{} hops, truncated: {} links not followed, {} users and {} links over budget".format(
+                    radius, cut["fanout"], cut["nodes"], cut["edges"])
+    with phase_timer("attrs"):
+        attrs = node_index.gather(ego_nodes[1:])
+    with phase_timer("layout"):
+        pos = None
+        if layout_mode in ("auto", "precomputed") and global_positions is not None:
+            pos = slice_layout(global_positions, ego_nodes)
+        if pos is None:
+            #Seeded by the hub so the same user always gets the same picture
+            pos, layout_mode = compute_layout("auto" if layout_mode == "precomputed" else layout_mode,
+                                              len(ego_nodes), edge_u, edge_v,
+                                              roles=node_index.roles[ego_nodes],
+                                              order=-node_index.followers[ego_nodes],
+                                              seed=hub)
+
+    with phase_timer("figure"):
+        return build_network_figure(sr_user, graph.degree(hub), pos, edge_u, edge_v, attrs, note=note)
+
+def get_not_found(sr_user):
+    """Cheap placeholder figure for a username that isn't in the dataset"""
+    suggestions = current_dataset().prefix_index.suggest(sr_user, limit=5)
+    message = "No SuperRare user named {}".format(sr_user)
+    if suggestions:
+        message += "<br>Did you mean: {}?".format(", ".join(suggestions))
+    fig = go.Figure(layout=go.Layout(
+                    annotations=[dict(text=message, showarrow=False, font=dict(size=16),
+                                      xref="paper", yref="paper", x=0.5, y=0.5)],
+                    xaxis=dict(visible=False),
+                    yaxis=dict(visible=False)))
+    return fig
+
+def render_diff(diff):
+    """Added and removed collectors/artists of a SnapshotStore.diff"""
+    sections = [("New collectors", diff["added_collectors"]),
+                ("Collectors gone", diff["removed_collectors"]),
+                ("Newly collected artists", diff["added_artists"]),
+                ("Artists no longer collected", diff["removed_artists"])]
+    children = [html.P("{} between {} and {}".format(diff["user"], diff["from"], diff["to"]))]
+    for title, names in sections:
+        children.append(html.Div([html.B("{} ({}): ".format(title, len(names))), ", ".join(names) or "none"]))
+    return children
 
 ########### Initiate the app
 app = dash.Dash(__name__)
@@ -174,13 +185,34 @@ app.layout = html.Div(children=[
     html.H3("Enter your SuperRare username!",style={"font-family":"NeueMachina-Regular"}),
     html.Div([
         html.Div(["SR User: ",
-                  dcc.Input(id='sr-user', value='artnome', type='text')]),
+                  dcc.Input(id='sr-user', value='artnome', type='text', list='sr-user-suggestions'),
+                  html.Datalist(id='sr-user-suggestions')]),
+        html.Div(["Layout: ",
+                  dcc.Dropdown(id='layout-mode', value='auto', clearable=False,
+                               options=[{"label": x, "value": x} for x in ["auto", "precomputed"] + sorted(LAYOUTS)],
+                               style={"width": "200px", "display": "inline-block", "vertical-align": "middle"})]),
+        html.Div(["Degrees of separation: ",
+                  dcc.Dropdown(id='radius', value=1, clearable=False,
+                               options=[{"label": str(x), "value": x} for x in [1, 2, 3]],
+                               style={"width": "200px", "display": "inline-block", "vertical-align": "middle"})]),
         
     html.Br(),
     
     dcc.Graph(
-        id='User SuperRare Network')
+        id='User SuperRare Network'),
+    html.Div(id='render-stats', style={"font-size": "small", "color": "grey"})
     ]),
+    html.H3("How has your network changed?",style={"font-family":"NeueMachina-Regular"}),
+    html.Div(["From: ",
+              dcc.Dropdown(id='diff-from', value=snapshot_store.dates[0], clearable=False,
+                           options=[{"label": x, "value": x} for x in snapshot_store.dates],
+                           style={"width": "200px", "display": "inline-block", "vertical-align": "middle"}),
+              " To: ",
+              dcc.Dropdown(id='diff-to', value=snapshot_store.dates[-1], clearable=False,
+                           options=[{"label": x, "value": x} for x in snapshot_store.dates],
+                           style={"width": "200px", "display": "inline-block", "vertical-align": "middle"})]),
+    html.Div(id='network-diff'),
+    html.Br(),
     html.A('Code on Github', href=githublink),
     html.Br(),
     html.A('Created by Kyle Waters', href=kyletwitter),
@@ -190,11 +222,107 @@ app.layout = html.Div(children=[
 style={"font-family":"NeueMachina-Regular"})
 
 @app.callback(
-    Output('User SuperRare Network', 'figure'),
+    Output('sr-user-suggestions', 'children'),
     [Input(component_id='sr-user', component_property='value')]
 )
-def update_network(sr_user):
-    return get_network(sr_user)
+def update_suggestions(prefix):
+    return [html.Option(value=x) for x in current_dataset().prefix_index.suggest(prefix or "")]
+
+@app.callback(
+    [Output('User SuperRare Network', 'figure'),
+     Output('render-stats', 'children')],
+    [Input(component_id='sr-user', component_property='value'),
+     Input(component_id='sr-user', component_property='n_submit'),
+     Input(component_id='layout-mode', component_property='value'),
+     Input(component_id='radius', component_property='value')]
+)
+def update_network(sr_user, n_submit, layout_mode, radius=1):
+    sr_user = (sr_user or "").strip()
+    #Typing only re-renders on an exact match, Enter always answers
+    submitted = "sr-user.n_submit" in [x["prop_id"] for x in dash.callback_context.triggered]
+    dataset = current_dataset()
+    node_index = dataset.node_index
+    if sr_user not in node_index:
+        hub = dataset.prefix_index.lookup(sr_user) if submitted else None
+        if hub is None:
+            if submitted:
+                return get_not_found(sr_user), ""
+            raise PreventUpdate
+        sr_user = node_index.names[hub]
+    t0 = time.perf_counter()
+    key = (sr_user, radius, layout_mode, dataset.version)
+    fig_json = figure_cache.get(key)
+    source = "cached"
+    if fig_json is None:
+        with profiled("{}_r{}_{}".format(sr_user, radius, layout_mode)):
+            fig = get_network(sr_user, layout_mode, radius, dataset=dataset)
+            with phase_timer("serialize"):
+                fig_json = fig.to_json()
+        figure_cache.put(key, fig_json)
+        source = "built"
+    elapsed = time.perf_counter() - t0
+    REGISTRY.observe("sr_callback_seconds", elapsed, callback="update_network", source=source)
+    stats = "{} in {:.0f} ms, {:.1f} kB, dataset {}".format(source, elapsed*1e3, len(fig_json)/1e3, dataset.version)
+    logger.debug("%s: %s", sr_user, stats)
+    return json.loads(fig_json), stats
+
+@app.callback(
+    Output('network-diff', 'children'),
+    [Input(component_id='sr-user', component_property='value'),
+     Input(component_id='diff-from', component_property='value'),
+     Input(component_id='diff-to', component_property='value')]
+)
+def update_network_diff(sr_user, date_from, date_to):
+    sr_user = (sr_user or "").strip()
+    #Users who left the network are only known once older snapshots are read
+    if sr_user not in current_dataset().node_index and sr_user not in snapshot_store.ids:
+        raise PreventUpdate
+    try:
+        diff = snapshot_store.diff(sr_user, date_from, date_to)
+    except OSError as e:
+        return html.P(str(e))
+    return render_diff(diff)
+
+@server.route('/suggest')
+def suggest():
+    prefix = flask.request.args.get("q", "")
+    try:
+        limit = int(flask.request.args.get("limit", 10))
+    except ValueError:
+        return flask.jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, 100))
+    return flask.jsonify(current_dataset().prefix_index.suggest(prefix, limit=limit))
+
+@server.route('/cache-stats')
+def cache_stats():
+    return flask.jsonify(figure_cache.stats())
+
+@server.route('/dataset')
+def dataset_status():
+    return flask.jsonify(datasets.status())
+
+@server.after_request
+def add_dataset_version(response):
+    dataset = flask.g.get("dataset") or datasets.current
+    response.headers["X-Dataset-Version"] = dataset.version
+    return response
+
+@server.route('/metrics')
+def prometheus_metrics():
+    return flask.Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@server.route('/api/network-diff')
+def network_diff():
+    args = flask.request.args
+    user = args.get("user", "").strip()
+    date_from = args.get("from", snapshot_store.dates[0])
+    date_to = args.get("to", snapshot_store.dates[-1])
+    if date_from not in snapshot_store.sources or date_to not in snapshot_store.sources:
+        return flask.jsonify({"error": "unknown date", "dates": snapshot_store.dates}), 400
+    try:
+        return flask.jsonify(snapshot_store.diff(user, date_from, date_to))
+    except OSError as e:
+        return flask.jsonify({"error": str(e)}), 503
 
 if __name__ == '__main__':
     app.run_server()
\ No newline at end of file
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Name join of the creator/owner pairs in query_SR_data.main, before (two
+pd.merge passes on 42-char address strings) and after (AddressBook codes
+and per-address arrays), with the memory of the address columns
+
+Pairs come from synthetic.synthetic_pairs, scale 25 (500000 tokens) by
+default.
+
+Usage: python benchmarks/bench_address_join.py [scale]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from address_book import AddressBook
+from synthetic import synthetic_pairs
+
+def address_join_fixture(scale, seed=0):
+    """
+    Creator/owner pairs and the address -> name mapping of
+    synthetic.synthetic_pairs, collectors without a username left out of
+    the mapping
+    """
+    df = synthetic_pairs(scale, seed)
+    pairs = pd.DataFrame({"Creator": df["ArtistAdr"].values, "CurrentOwner": df["CollectorAdr"].values,
+                          "tokenID": df["tokenID"].values})
+    columns = ["Address", "Name", "Followers"]
+    artists = df[["ArtistAdr", "ArtistName", "ArtistFollowers"]].rename(columns=dict(zip(["ArtistAdr", "ArtistName", "ArtistFollowers"], columns)))
+    collectors = df[["CollectorAdr", "CollectorName", "CollectorFollowers"]].rename(columns=dict(zip(["CollectorAdr", "CollectorName", "CollectorFollowers"], columns)))
+    people = pd.concat([artists, collectors], ignore_index=True).drop_duplicates("Address")
+    mapping = people[people["Name"] != people["Address"]].reset_index(drop=True)
+    mapping["Followers"] = mapping["Followers"].astype(float)
+    return pairs, mapping
+
+def join_merge(pairs, mapping):
+    """Name join as main did it"""
+    df = pd.merge(pairs, mapping, left_on="Creator", right_on="Address", how='left')
+    df = pd.merge(df, mapping, left_on="CurrentOwner", right_on="Address", how='left')
+    df.drop(["Address_x", "Address_y"], axis=1, inplace=True)
+    df.columns = ["ArtistAdr", "CollectorAdr", "tokenID", "ArtistName", "ArtistFollowers", "CollectorName", "CollectorFollowers"]
+    return df
+
+def join_codes(book, pairs, mapping):
+    """Name join on codes: one take per column"""
+    mapped = book.intern(mapping["Address"].values)
+    names = book.table(mapped, mapping["Name"].values)
+    followers = book.table(mapped, mapping["Followers"].values)
+    artists, collectors = pairs["Creator"].values, pairs["CurrentOwner"].values
+    return pd.DataFrame({"ArtistAdr": artists, "CollectorAdr": collectors, "tokenID": pairs["tokenID"].values,
+                         "ArtistName": names[artists], "ArtistFollowers": followers[artists],
+                         "CollectorName": names[collectors], "CollectorFollowers": followers[collectors]})
+
+def main(scale=25):
+    pairs, mapping = address_join_fixture(scale)
+    n_tokens = len(pairs)
+    book = AddressBook()
+    coded = pd.DataFrame({"Creator": book.intern(pairs["Creator"].values),
+                          "CurrentOwner": book.intern(pairs["CurrentOwner"].values),
+                          "tokenID": pairs["tokenID"].values})
+
+    t0 = time.perf_counter()
+    merged = join_merge(pairs, mapping)
+    t_merge = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    joined = join_codes(book, coded, mapping)
+    t_codes = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    exported = book.hex(joined["ArtistAdr"].values), book.hex(joined["CollectorAdr"].values)
+    t_export = time.perf_counter() - t0
+
+    assert (exported[0] == merged["ArtistAdr"].values).all() and (exported[1] == merged["CollectorAdr"].values).all()
+    assert joined["ArtistName"].fillna("").tolist() == merged["ArtistName"].fillna("").tolist()
+    assert np.allclose(joined["CollectorFollowers"].fillna(-1), merged["CollectorFollowers"].fillna(-1))
+
+    strings = pairs[["Creator", "CurrentOwner"]].memory_usage(deep=True, index=False).sum()
+    codes = coded[["Creator", "CurrentOwner"]].memory_usage(index=False).sum() + book.memory_bytes()
+    print("{} tokens, {} addresses".format(n_tokens, len(book)))
+    print("{:<22}{:>12}".format("join", "time (s)"))
+    print("{:<22}{:>12.3f}".format("pd.merge x2", t_merge))
+    print("{:<22}{:>12.3f}".format("codes", t_codes))
+    print("{:<22}{:>12.3f}".format("export to strings", t_export))
+    print("address columns: strings {:.1f} MB, codes + book {:.1f} MB".format(strings/1e6, codes/1e6))
+
+if __name__ == '__main__':
+    main(*[float(x) for x in sys.argv[1:2]])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Transfer log decoding, before (decode_event_logs: per-event topic hashing,
+try/except token lookup, dict keyed by txhash + tokenID, DataFrame
+transpose) and after (transfer_decoder.decode_transfer_logs)
+
+Logs are synthetic, half SuperRare V1 style (token ID in data) and half
+V2 style (token ID as the fourth topic), as in contracts.py, formatted
+like w3.eth.get_logs results.
+
+Usage: python benchmarks/bench_decode_transfers.py [n_logs]
+"""
+
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+from eth_utils import to_checksum_address, to_hex, to_int
+from hexbytes import HexBytes
+from web3 import Web3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from contracts import get_contracts
+from transfer_decoder import decode_transfer_logs, TRANSFER_TOPIC
+
+
+def synthetic_logs(n_logs, n_addresses=20000, seed=0):
+    rng = random.Random(seed)
+    v1, v2 = (to_checksum_address(x.address) for x in get_contracts(names=["superrare_v1", "superrare_v2"]))
+    addresses = [HexBytes(bytes(12) + rng.getrandbits(160).to_bytes(20, "big")) for _ in range(n_addresses)]
+    logs = []
+    for i in range(n_logs):
+        token = rng.randrange(40000)
+        topics = [HexBytes(TRANSFER_TOPIC), rng.choice(addresses), rng.choice(addresses)]
+        data = "0x"
+        if i % 2:
+            #V2: indexed token ID
+            contract = v2
+            topics.append(HexBytes(token.to_bytes(32, "big")))
+        else:
+            #V1: token ID in data
+            contract = v1
+            data = "0x{:064x}".format(token)
+        logs.append({"address": contract,
+                     "topics": topics,
+                     "data": data,
+                     "transactionHash": HexBytes(rng.getrandbits(256).to_bytes(32, "big")),
+                     "blockNumber": 5000000 + i//4,
+                     "transactionIndex": rng.randrange(200),
+                     "logIndex": i % 300})
+    return logs
+
+def decode_legacy(logs):
+    """decode_event_logs and the DataFrame conversion as get_transfer_data did it"""
+    event_data = {}
+    for i,event in enumerate(logs):
+        topic = to_hex(event["topics"][0])
+        if topic == to_hex(Web3.keccak(text="Transfer(address,address,uint256)")):
+            from_ = "0x" + to_hex(event["topics"][1])[26:]
+            to_   = "0x" + to_hex(event["topics"][2])[26:]
+            try:
+                tknid = to_int(event["topics"][3])
+            except:
+                tknid = int(event["data"],16)
+            txhash = event["transactionHash"]
+            event_data[to_int(txhash)+tknid] = {"txhash":txhash, "from":from_,"to":to_,"tokenID":tknid,'blockNumber':event["blockNumber"],'transactionIndex':event["transactionIndex"]}
+    return pd.DataFrame(event_data).transpose()
+
+def decode_batch(logs):
+    return decode_transfer_logs(logs).to_frame()
+
+def main(n_logs=300000):
+    logs = synthetic_logs(n_logs)
+    print("{:<10}{:>12}{:>12}{:>14}".format("decoder", "rows", "time (s)", "logs/s"))
+    for name, func in [("legacy", decode_legacy), ("batch", decode_batch)]:
+        t0 = time.perf_counter()
+        df = func(logs)
+        elapsed = time.perf_counter() - t0
+        print("{:<10}{:>12}{:>12.2f}{:>14.0f}".format(name, len(df), elapsed, n_logs/elapsed))
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:2]])
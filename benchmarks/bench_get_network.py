@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Callback latency of get_network's follower lookups for the largest hubs,
+before (per-neighbour DataFrame scans) and after (NodeIndex gather)
+
+Usage: python benchmarks/bench_get_network.py [pairs.csv] [n_hubs]
+"""
+
+import os
+import sys
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from network_data import load_collector_artist_pairs, get_pairs, url_github_SR_data
+from node_index import NodeIndex
+
+
+def colors_scan(df_collector_artist_pairs, hub_ego, sr_user):
+    """Follower lookup as get_network did it before the node index"""
+    colors=[]
+    for k in hub_ego.nodes:
+        if k != sr_user:
+            try:
+                colors.append(int(df_collector_artist_pairs[(df_collector_artist_pairs.ArtistName == k)].iloc[0]["ArtistFollowers"]))
+            except:
+                try:
+                    colors.append(int(df_collector_artist_pairs[(df_collector_artist_pairs.CollectorName == k)].iloc[0]["CollectorFollowers"]))
+                except:
+                    colors.append(0)
+    return colors
+
+def colors_index(node_index, hub_ego, sr_user):
+    """Follower lookup through the node index"""
+    node_iter = [k for k in hub_ego.nodes if k != sr_user]
+    return node_index.gather(node_index.encode(node_iter))["followers"]
+
+def timeit(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def main(path=url_github_SR_data, n_hubs=5):
+    df_collector_artist_pairs = load_collector_artist_pairs(path)
+    df_pairs = get_pairs(df_collector_artist_pairs)
+    G = nx.from_pandas_edgelist(df_pairs, 'From', 'To')
+
+    t0 = time.perf_counter()
+    node_index = NodeIndex.from_pairs(df_collector_artist_pairs)
+    print("NodeIndex build: {:.1f} ms for {} nodes".format((time.perf_counter() - t0)*1e3, len(node_index)))
+
+    hubs = sorted(G.degree, key=lambda x: x[1], reverse=True)[:n_hubs]
+    print("{:<24}{:>8}{:>14}{:>14}{:>10}".format("hub", "degree", "scan (ms)", "index (ms)", "speedup"))
+    for sr_user, degree in hubs:
+        hub_ego = nx.ego_graph(G, sr_user, radius=1)
+        t_scan, before = timeit(colors_scan, df_collector_artist_pairs, hub_ego, sr_user, repeat=1)
+        t_index, after = timeit(colors_index, node_index, hub_ego, sr_user)
+        assert list(before) == list(after)
+        print("{:<24}{:>8}{:>14.2f}{:>14.3f}{:>9.0f}x".format(sr_user, degree, t_scan*1e3, t_index*1e3, t_scan/t_index))
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*(args[:1] or [url_github_SR_data]), n_hubs=int(args[1]) if len(args) > 1 else 5)
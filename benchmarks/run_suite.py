@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite on synthetic data (see synthetic.py) at several scales
+
+Covers what a page view and a data refresh spend time on: loading the
+pairs (csv and snapshot), ego extraction, layout, figure building and
+serialization, transfer log decoding (decode_event_logs and
+decode_transfer_logs), get_creator_owners, and get_tx_value against a
+RecordedLogProvider serving the synthetic receipts.
+
+Every benchmark runs `repeat` times; the results (min and median seconds,
+items per second) are written as JSON with the versions and commit they
+were measured with. Given --baseline, a previous results file, a best
+time slower than the baseline's by more than its tolerance in
+thresholds.json, or a median over its budget there, is a regression and
+the exit status is 1. A benchmark that raises is recorded with its error
+and the others still run. Baselines only compare on the same machine, idle.
+
+Usage: python benchmarks/run_suite.py [--scales 1 10] [--data benchmark_data]
+           [--out benchmark_results.json] [--baseline old.json] [--only ego_hub ...]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from web3 import Web3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from event_store import formatted_log
+from figure_builder import build_network_figure, decimate, DECIMATE_ABOVE, DECIMATE_TOP_K
+from graph_engine import localize
+from layout import compute_layout
+from network_data import load_network
+from query_SR_data import decode_event_logs, get_creator_owners, get_tx_value, get_tx_values
+from receipt_service import ReceiptService
+from snapshot import build_snapshot, load_snapshot
+from stub_provider import RecordedLogProvider
+from synthetic import write_fixtures, CONTRACT
+from transfer_decoder import decode_transfer_logs
+
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+#app.py defaults
+MULTIHOP_MAX_NODES = 1000
+MULTIHOP_MAX_EDGES = 5000
+MULTIHOP_FANOUT = (None, 25, 10)
+
+N_SAMPLE_USERS = 50
+N_SALES = 500
+
+class Fixture:
+    """
+    Synthetic data of one scale, built on first use
+
+    Parameters
+    ----------
+    data_dir : str
+        where synthetic.write_fixtures puts its files, written if missing.
+    scale : int or float
+    """
+
+    def __init__(self, data_dir, scale, seed=0):
+        self.scale = scale
+        self.pairs_path = os.path.join(data_dir, "pairs_{}x.csv".format(scale))
+        self.logs_path = os.path.join(data_dir, "logs_{}x.json".format(scale))
+        self.receipts_path = os.path.join(data_dir, "receipts_{}x.json".format(scale))
+        if not os.path.exists(self.pairs_path):
+            write_fixtures(data_dir, [scale], seed)
+        self.tmp = tempfile.mkdtemp(prefix="sr_bench_")
+        self.snapshot_path = os.path.join(self.tmp, "bench.srnet")
+        self._cache = {}
+        self._rng = np.random.RandomState(seed)
+
+    def close(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _get(self, name, build):
+        if name not in self._cache:
+            self._cache[name] = build()
+        return self._cache[name]
+
+    @property
+    def has_chain(self):
+        return os.path.exists(self.logs_path)
+
+    @property
+    def network(self):
+        """pairs dataframe, node index, graph"""
+        return self._get("network", lambda: load_network(self.pairs_path))
+
+    @property
+    def ranked_graph(self):
+        _, node_index, graph = self.network
+        return self._get("ranked", lambda: graph.ranked(node_index.followers))
+
+    @property
+    def hub(self):
+        return self._get("hub", lambda: int(np.argmax(self.network[2].degree())))
+
+    @property
+    def sample_users(self):
+        """Users with at least one edge, at random"""
+        def sample():
+            degree = self.network[2].degree()
+            connected = np.flatnonzero(degree > 0)
+            return self._rng.choice(connected, min(N_SAMPLE_USERS, len(connected)), replace=False)
+        return self._get("sample", sample)
+
+    @property
+    def logs(self):
+        """Transfer logs as w3.eth.get_logs returns them"""
+        def read():
+            with open(self.logs_path) as f:
+                return [formatted_log(x) for x in json.load(f)]
+        return self._get("logs", read)
+
+    @property
+    def transfers(self):
+        return self._get("transfers", lambda: decode_transfer_logs(self.logs).to_frame())
+
+    @property
+    def provider(self):
+        def read():
+            with open(self.logs_path) as f:
+                logs = json.load(f)
+            with open(self.receipts_path) as f:
+                receipts = json.load(f)
+            return RecordedLogProvider(logs, receipts=receipts)
+        return self._get("provider", read)
+
+    @property
+    def sale_txhashes(self):
+        return list(self.provider.receipts)[:N_SALES]
+
+    def ego(self, hub):
+        """ego nodes and local edges as get_network builds them (radius 1)"""
+        _, node_index, graph = self.network
+        ego_nodes = graph.ego(hub, radius=1)
+        top_k = DECIMATE_TOP_K if len(ego_nodes) - 1 > DECIMATE_ABOVE else None
+        ego_nodes, _ = decimate(ego_nodes, node_index.followers[ego_nodes], top_k)
+        edge_u, edge_v = graph.local_edges(ego_nodes)
+        return ego_nodes, edge_u, edge_v
+
+    def layout(self, hub):
+        _, node_index, _ = self.network
+        ego_nodes, edge_u, edge_v = self.ego(hub)
+        pos, _ = compute_layout("auto", len(ego_nodes), edge_u, edge_v, roles=node_index.roles[ego_nodes],
+                                order=-node_index.followers[ego_nodes], seed=hub)
+        return pos
+
+    def figure_json(self, hub):
+        _, node_index, graph = self.network
+        ego_nodes, edge_u, edge_v = self._get(("ego", hub), lambda: self.ego(hub))
+        pos = self._get(("layout", hub), lambda: self.layout(hub))
+        attrs = node_index.gather(ego_nodes[1:])
+        return build_network_figure(node_index.names[hub], graph.degree(hub), pos, edge_u, edge_v, attrs).to_json()
+
+#name -> function(fixture) returning (callable to time, items it handles), None to skip
+BENCHMARKS = OrderedDict()
+
+def benchmark(func):
+    BENCHMARKS[func.__name__[len("bench_"):]] = func
+    return func
+
+@benchmark
+def bench_load_csv(fx):
+    return lambda: load_network(fx.pairs_path), len(fx.network[0])
+
+@benchmark
+def bench_build_snapshot(fx):
+    return lambda: build_snapshot(fx.pairs_path, fx.snapshot_path), len(fx.network[0])
+
+@benchmark
+def bench_load_snapshot(fx):
+    if not os.path.exists(fx.snapshot_path):
+        build_snapshot(fx.pairs_path, fx.snapshot_path)
+    return lambda: load_snapshot(fx.snapshot_path), len(fx.network[1])
+
+@benchmark
+def bench_ego_hub(fx):
+    return lambda: fx.ego(fx.hub), 1
+
+@benchmark
+def bench_ego_sample(fx):
+    return lambda: [fx.ego(x) for x in fx.sample_users], len(fx.sample_users)
+
+@benchmark
+def bench_ego_budget_hub(fx):
+    ranked_graph, followers = fx.ranked_graph, fx.network[1].followers
+
+    def run():
+        sample = ranked_graph.ego_budget(fx.hub, radius=2, max_nodes=MULTIHOP_MAX_NODES, max_edges=MULTIHOP_MAX_EDGES,
+                                         fanout=MULTIHOP_FANOUT, priority=followers)
+        return localize(sample.nodes, sample.edge_u, sample.edge_v)
+    return run, 1
+
+@benchmark
+def bench_layout_hub(fx):
+    return lambda: fx.layout(fx.hub), 1
+
+@benchmark
+def bench_layout_sample(fx):
+    return lambda: [fx.layout(x) for x in fx.sample_users], len(fx.sample_users)
+
+@benchmark
+def bench_figure_hub(fx):
+    return lambda: fx.figure_json(fx.hub), 1
+
+@benchmark
+def bench_decode_event_logs(fx):
+    if not fx.has_chain:
+        return None
+    w3 = Web3()
+    return lambda: pd.DataFrame(decode_event_logs(fx.logs, w3)).transpose(), len(fx.logs)
+
+@benchmark
+def bench_decode_transfer_logs(fx):
+    if not fx.has_chain:
+        return None
+    return lambda: decode_transfer_logs(fx.logs).to_frame(), len(fx.logs)
+
+@benchmark
+def bench_get_creator_owners(fx):
+    if not fx.has_chain:
+        return None
+    return lambda: get_creator_owners(fx.transfers, [CONTRACT]), len(fx.transfers)
+
+@benchmark
+def bench_get_tx_value(fx):
+    """One receipt request per transaction, as the per-row loop does"""
+    if not fx.has_chain:
+        return None
+    w3 = Web3(fx.provider)
+
+    def run():
+        receipts = ReceiptService(w3, ":memory:")
+        return [get_tx_value(w3, x, "SuperRare", receipts) for x in fx.sale_txhashes]
+    return run, len(fx.sale_txhashes)
+
+@benchmark
+def bench_get_tx_values(fx):
+    """The same transactions in batches"""
+    if not fx.has_chain:
+        return None
+    w3 = Web3(fx.provider)
+    return lambda: get_tx_values(fx.sale_txhashes, ReceiptService(w3, ":memory:")), len(fx.sale_txhashes)
+
+def measure(func, repeat):
+    """Seconds of each call, garbage collection off as in timeit"""
+    times = []
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t0)
+    finally:
+        if enabled:
+            gc.enable()
+    return times
+
+def run_suite(scales, data_dir, repeat=5, only=None):
+    """
+    Returns
+    -------
+    dict
+        scale label ("1x") -> benchmark name -> min, median, repeat, items
+        and per_second (items/median).
+    """
+    results = OrderedDict()
+    for scale in scales:
+        fx = Fixture(data_dir, scale)
+        label = "{}x".format(scale)
+        results[label] = OrderedDict()
+        try:
+            run_scale(fx, label, results[label], repeat, only)
+        finally:
+            fx.close()
+    return results
+
+def run_scale(fx, label, results, repeat, only):
+    """Benchmarks of one fixture into results"""
+    for name, setup in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        #A broken benchmark is recorded and the others still run
+        try:
+            prepared = setup(fx)
+            if prepared is None:
+                continue
+            func, items = prepared
+            #Warm up: imports, lazy fixtures, caches
+            func()
+            times = measure(func, repeat)
+        except Exception as e:
+            results[name] = {"error": "{}: {}".format(type(e).__name__, e)}
+            print("{:<6}{:<24}failed, {}".format(label, name, results[name]["error"]))
+            continue
+        median = float(np.median(times))
+        results[name] = {"min": min(times), "median": median, "repeat": repeat,
+                                "items": items, "per_second": items/median if median else None}
+        print("{:<6}{:<24}{:>12.4f}{:>12.4f}{:>14.0f}".format(label, name, min(times), median,
+                                                               results[name]["per_second"] or 0))
+
+def environment():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "pandas": pd.__version__, "machine": platform.machine(), "processor": platform.processor(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+def compare(results, baseline, thresholds):
+    """
+    Regressions of results against a baseline results dict and the budgets
+
+    thresholds.json holds "tolerance" (allowed slowdown of the best time,
+    0.25 is 25%), per benchmark overrides in "tolerances", "noise_floor"
+    (seconds, smaller slowdowns are ignored) and "budgets": scale label ->
+    benchmark -> maximum median seconds.
+
+    A benchmark that failed is a regression if it ran in the baseline.
+
+    Returns
+    -------
+    list of str
+        one line per regression, empty if there is none.
+    """
+    regressions = []
+    for label, benchmarks in results.items():
+        for name, result in benchmarks.items():
+            before = (baseline or {}).get(label, {}).get(name)
+            if "error" in result:
+                if before is not None and "error" not in before:
+                    regressions.append("{} {}: failed, {}".format(label, name, result["error"]))
+                continue
+            budget = thresholds.get("budgets", {}).get(label, {}).get(name)
+            if budget is not None and result["median"] > budget:
+                regressions.append("{} {}: {:.4f}s over the {:.4f}s budget".format(label, name, result["median"], budget))
+            if before is None or "error" in before:
+                continue
+            tolerance = thresholds.get("tolerances", {}).get(name, thresholds.get("tolerance", 0.25))
+            slower = result["min"] - before["min"]
+            if result["min"] > before["min"]*(1 + tolerance) and slower > thresholds.get("noise_floor", 0.0):
+                regressions.append("{} {}: {:.4f}s, {:.0%} slower than {:.4f}s (tolerance {:.0%})".format(
+                    label, name, result["min"], result["min"]/before["min"] - 1, before["min"], tolerance))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic SuperRare data")
+    parser.add_argument("--scales", nargs="+", type=float, default=[1, 10],
+                        help="dataset sizes, multiples of the snapshot (1, 10, 100)")
+    parser.add_argument("--data", default="benchmark_data", help="synthetic fixtures, generated if missing")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", help="results file to compare with")
+    parser.add_argument("--thresholds", default=THRESHOLDS_PATH)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run these benchmarks only")
+    args = parser.parse_args(argv)
+    scales = [int(x) if x == int(x) else x for x in args.scales]
+
+    print("{:<6}{:<24}{:>12}{:>12}{:>14}".format("scale", "benchmark", "min (s)", "median (s)", "items/s"))
+    results = run_suite(scales, args.data, args.repeat, args.only)
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, thresholds)
+    with open(args.out, "w") as f:
+        json.dump({"environment": environment(), "results": results, "regressions": regressions}, f, indent=1)
+
+    failed = ["{} {}".format(label, name) for label, benchmarks in results.items()
+              for name, result in benchmarks.items() if "error" in result]
+    if failed:
+        print("Failed: {}".format(", ".join(failed)))
+    for line in regressions:
+        print("REGRESSION {}".format(line))
+    print("{} regressions, results in {}".format(len(regressions), args.out))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
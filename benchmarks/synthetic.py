@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data at the scale of the SuperRare snapshot and beyond
+
+synthetic_pairs writes pair tables in the schema query_SR_data exports
+(ArtistAdr ... CollectorFollowers) with heavy-tailed artist output and
+collector activity, so a few hubs hold most of the edges as in the real
+network. synthetic_chain makes the ERC-721 side: raw JSON-RPC Transfer
+logs (a mint per token, then resales) and the receipts of the resales
+with their SuperRare Sold event, for RecordedLogProvider.
+
+Scale 1 is about the size of the 2021 snapshots: 20000 tokens, 1000
+artists and 3000 collectors, about 11000 artist/collector edges and a
+largest hub of a few hundred.
+
+Usage: python benchmarks/synthetic.py [out_dir] [scale ...]
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sale_decoders import SALE_DECODERS
+from transfer_decoder import TRANSFER_TOPIC_HEX
+
+BASE_TOKENS = 20000
+BASE_ARTISTS = 1000
+BASE_COLLECTORS = 3000
+#Unique artist/collector edges per token: collectors keep buying the same artists
+EDGES_PER_TOKEN = 0.55
+CONTRACT = "0xb932a70a57673d89f4acffbe830e8ed7f75fb9e0"
+SOLD_TOPIC = [k for k, v in SALE_DECODERS.items() if v.name == "Sold(address,address,uint256,uint256)"][0]
+
+PAIR_COLUMNS = ["ArtistAdr", "CollectorAdr", "tokenID", "contract_address", "NumTokensOwnedCollector",
+                "NumTokensCreatedArtist", "ArtistName", "ArtistFollowers", "CollectorName", "CollectorFollowers"]
+
+def _power_law_choice(rng, n, size, alpha):
+    """size draws of 0..n-1, the weight of each value Pareto(alpha) distributed"""
+    weights = rng.pareto(alpha, n) + 1
+    return rng.choice(n, size, p=weights/weights.sum()), weights
+
+def synthetic_pairs(scale=1, seed=0, unresolved=0.1, artists_collecting=0.2):
+    """
+    Pair table of scale x the snapshot size
+
+    Parameters
+    ----------
+    scale : float
+    unresolved : float
+        share of collectors without a username, named by their address.
+    artists_collecting : float
+        share of collectors who are also artists.
+
+    Returns
+    -------
+    DataFrame with PAIR_COLUMNS, one row per token
+    """
+    rng = np.random.RandomState(seed)
+    n_tokens, n_artists, n_collectors = (int(x*scale) for x in (BASE_TOKENS, BASE_ARTISTS, BASE_COLLECTORS))
+    #Edges first, then one token per edge and the rest spread by edge weight
+    n_edges = int(n_tokens*EDGES_PER_TOKEN)
+    edge_artist, artist_weight = _power_law_choice(rng, n_artists, n_edges, 2.0)
+    edge_collector, collector_weight = _power_law_choice(rng, n_collectors, n_edges, 2.0)
+    extra, _ = _power_law_choice(rng, n_edges, n_tokens - n_edges, 1.5)
+    edge_of = rng.permutation(np.concatenate([np.arange(n_edges), extra]))
+    artist_of, collector_of = edge_artist[edge_of], edge_collector[edge_of]
+
+    addresses = np.array(["0x{:040x}".format(x) for x in rng.randint(1, 2**62, n_artists + n_collectors)], dtype=object)
+    artist_names = np.array(["@artist{}".format(i) for i in range(n_artists)], dtype=object)
+    collector_names = np.array(["@collector{}".format(i) for i in range(n_collectors)], dtype=object)
+    collector_addresses = addresses[n_artists:].copy()
+    #Some collectors are artists, some never set a username
+    overlap = rng.rand(n_collectors) < artists_collecting
+    overlap_artist = rng.randint(0, n_artists, n_collectors)
+    collector_names[overlap] = artist_names[overlap_artist[overlap]]
+    collector_addresses[overlap] = addresses[overlap_artist[overlap]]
+    anonymous = ~overlap & (rng.rand(n_collectors) < unresolved)
+    collector_names[anonymous] = collector_addresses[anonymous]
+
+    #Followers grow with activity, with noise
+    artist_followers = np.round(artist_weight**0.8*rng.lognormal(3, 1, n_artists))
+    collector_followers = np.round(collector_weight**0.8*rng.lognormal(2, 1, n_collectors))
+    collector_followers[overlap] = artist_followers[overlap_artist[overlap]]
+    collector_followers[anonymous] = 0
+
+    df = pd.DataFrame({"ArtistAdr": addresses[artist_of],
+                       "CollectorAdr": collector_addresses[collector_of],
+                       "tokenID": np.arange(n_tokens),
+                       "contract_address": CONTRACT,
+                       "NumTokensOwnedCollector": np.bincount(collector_of, minlength=n_collectors)[collector_of],
+                       "NumTokensCreatedArtist": np.bincount(artist_of, minlength=n_artists)[artist_of],
+                       "ArtistName": artist_names[artist_of],
+                       "ArtistFollowers": artist_followers[artist_of],
+                       "CollectorName": collector_names[collector_of],
+                       "CollectorFollowers": collector_followers[collector_of]})
+    return df[PAIR_COLUMNS]
+
+def _word(value):
+    return "0x{:064x}".format(value)
+
+def synthetic_chain(n_tokens, n_addresses=None, resales=1.5, seed=0, contract=CONTRACT, first_block=5000000):
+    """
+    Transfer logs and sale receipts of n_tokens tokens
+
+    Parameters
+    ----------
+    n_addresses : int, optional
+        accounts trading, n_tokens//4 by default.
+    resales : float
+        mean number of sales per token after its mint (Poisson).
+
+    Returns
+    -------
+    logs : list of dict
+        raw JSON-RPC Transfer logs, in block order.
+    receipts : dict
+        tx hash -> raw JSON-RPC receipt, for every resale.
+    """
+    rng = np.random.RandomState(seed)
+    n_addresses = n_addresses or max(n_tokens//4, 10)
+    accounts = rng.randint(1, 2**62, n_addresses)
+    creators, _ = _power_law_choice(rng, n_addresses, n_tokens, 1.2)
+    n_sales = rng.poisson(resales, n_tokens)
+
+    #(block, token, from, to, price) in block order, mints first
+    events = []
+    block = first_block
+    for token in range(n_tokens):
+        block += rng.randint(0, 3)
+        events.append((block, token, 0, accounts[creators[token]], 0))
+    owners = accounts[creators].copy()
+    order = np.repeat(np.arange(n_tokens), n_sales)
+    rng.shuffle(order)
+    buyers, _ = _power_law_choice(rng, n_addresses, len(order), 1.0)
+    for token, buyer in zip(order, accounts[buyers]):
+        block += rng.randint(0, 3)
+        events.append((block, token, owners[token], buyer, int(rng.lognormal(0, 1)*1e18)))
+        owners[token] = buyer
+
+    logs, receipts = [], {}
+    previous_block = None
+    for i, (block, token, sender, receiver, price) in enumerate(events):
+        #One transaction per transfer, transactions and logs numbered within their block
+        if block != previous_block:
+            previous_block, tx_index, log_index = block, 0, 0
+        txhash = _word(int(rng.randint(1, 2**62))*2**64 + i)
+        transfer = {"address": contract, "topics": [TRANSFER_TOPIC_HEX, _word(sender), _word(receiver), _word(token)],
+                    "data": "0x", "blockNumber": hex(block), "blockHash": _word(block), "transactionHash": txhash,
+                    "transactionIndex": hex(tx_index), "logIndex": hex(log_index), "removed": False}
+        logs.append(transfer)
+        if price:
+            sold = dict(transfer, topics=[SOLD_TOPIC, _word(receiver), _word(sender), _word(token)],
+                        data=_word(price), logIndex=hex(log_index + 1))
+            receipts[txhash] = {"transactionHash": txhash, "blockNumber": hex(block), "blockHash": _word(block),
+                                "transactionIndex": hex(tx_index), "gasUsed": hex(120000), "status": "0x1",
+                                "logs": [transfer, sold]}
+        tx_index += 1
+        log_index += 2 if price else 1
+    return logs, receipts
+
+def write_fixtures(out_dir, scales=(1, 10, 100), seed=0, max_chain_scale=10, max_receipts=20000):
+    """
+    pairs_{scale}x.csv, logs_{scale}x.json and receipts_{scale}x.json for each scale
+
+    Logs and receipts stop at max_chain_scale, 100x would be gigabytes of
+    JSON, and only the first max_receipts receipts are kept.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for scale in scales:
+        pairs_path = os.path.join(out_dir, "pairs_{}x.csv".format(scale))
+        synthetic_pairs(scale, seed).to_csv(pairs_path, index=False)
+        paths[scale] = (pairs_path,)
+        if scale > max_chain_scale:
+            continue
+        logs, receipts = synthetic_chain(int(BASE_TOKENS*scale), seed=seed)
+        receipts = dict(list(receipts.items())[:max_receipts])
+        logs_path = os.path.join(out_dir, "logs_{}x.json".format(scale))
+        receipts_path = os.path.join(out_dir, "receipts_{}x.json".format(scale))
+        with open(logs_path, "w") as f:
+            json.dump(logs, f)
+        with open(receipts_path, "w") as f:
+            json.dump(receipts, f)
+        paths[scale] = (pairs_path, logs_path, receipts_path)
+    return paths
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    out_dir = args[0] if args else "benchmark_data"
+    scales = [float(x) if "." in x else int(x) for x in args[1:]] or [1, 10, 100]
+    for scale, paths in write_fixtures(out_dir, scales).items():
+        print("{}x: {}".format(scale, ", ".join(paths)))
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Block number -> timestamp index
+
+Known blocks are kept as two parallel sorted arrays (uint32 block numbers
+and uint32 unix timestamps), saved to an .npz file between runs. Lookups
+for a whole column are one searchsorted; blocks not in the index are
+fetched first, each distinct block once, with JSON-RPC batches of
+eth_getBlockByNumber.
+
+    index = BlockTimeIndex("block_times.npz")
+    df_transfers["timestamp"] = index.datetimes(df_transfers.blockNumber.values, w3)
+    index.save()
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from receipt_service import batch_request
+
+class BlockTimeIndex:
+    """
+    Parameters
+    ----------
+    path : str, optional
+        .npz file loaded if it exists, and written by save.
+    batch_size : int
+        blocks per JSON-RPC batch.
+    max_workers : int
+        batches in flight at once.
+    """
+
+    def __init__(self, path=None, batch_size=100, max_workers=4):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.blocks = np.zeros(0, dtype=np.uint32)
+        self.times = np.zeros(0, dtype=np.uint32)
+        self.fetched = 0
+        if path is not None and os.path.exists(path):
+            with np.load(path) as data:
+                self.blocks = data["blocks"]
+                self.times = data["times"]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def save(self, path=None):
+        """Write the index, next to the file then renamed into place"""
+        path = path or self.path
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, blocks=self.blocks, times=self.times)
+        os.replace(tmp, path)
+
+    def _positions(self, blocks):
+        """Positions of blocks in the index and whether each one is there"""
+        pos = np.searchsorted(self.blocks, blocks)
+        found = pos < len(self.blocks)
+        found[found] = self.blocks[pos[found]] == blocks[found]
+        return pos, found
+
+    def _fetch_batch(self, w3, blocks):
+        responses = batch_request(w3, [("eth_getBlockByNumber", [hex(int(b)), False]) for b in blocks])
+        times = np.empty(len(blocks), dtype=np.uint32)
+        for i, response in enumerate(responses):
+            if response.get("error") or response.get("result") is None:
+                raise ValueError("No block {}: {}".format(blocks[i], response.get("error")))
+            times[i] = int(response["result"]["timestamp"], 16)
+        return times
+
+    def fetch(self, w3, blocks):
+        """Add the blocks not yet in the index, fetched in batches"""
+        blocks = np.unique(np.asarray(blocks, dtype=np.int64))
+        _, found = self._positions(blocks)
+        missing = blocks[~found]
+        if not len(missing):
+            return
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            times = np.concatenate(list(pool.map(lambda x: self._fetch_batch(w3, x), batches)))
+        self.fetched += len(missing)
+
+        blocks = np.concatenate([self.blocks, missing.astype(np.uint32)])
+        times = np.concatenate([self.times, times])
+        order = np.argsort(blocks, kind="mergesort")
+        self.blocks = blocks[order]
+        self.times = times[order]
+
+    def timestamps(self, blocks, w3=None):
+        """
+        Unix timestamps of a column of block numbers
+
+        Blocks missing from the index are fetched through w3 if given,
+        otherwise they raise KeyError.
+
+        Returns
+        -------
+        ndarray of uint32
+        """
+        blocks = np.asarray(blocks, dtype=np.int64)
+        pos, found = self._positions(blocks)
+        if not found.all():
+            if w3 is None:
+                raise KeyError("{} blocks are not in the index".format(int((~found).sum())))
+            self.fetch(w3, blocks[~found])
+            pos, found = self._positions(blocks)
+        return self.times[pos]
+
+    def datetimes(self, blocks, w3=None):
+        """UTC datetimes of a column of block numbers"""
+        return pd.to_datetime(self.timestamps(blocks, w3).astype(np.int64), unit="s", utc=True)
+
+    def first_block_at(self, timestamp, w3, hi=None):
+        """
+        First block with a timestamp at or after timestamp (unix seconds)
+
+        Bisection over block numbers, starting from the tightest pair of
+        indexed blocks around timestamp; every block read on the way is
+        added to the index.
+
+        Returns
+        -------
+        int, or hi + 1 if no block up to hi is that late.
+        """
+        if hi is None:
+            hi = w3.eth.block_number
+        #Bracket: lo is before timestamp, hi at or after
+        lo = -1
+        i = np.searchsorted(self.times, timestamp)
+        if i > 0:
+            lo = int(self.blocks[i - 1])
+        if i < len(self.blocks) and self.blocks[i] <= hi:
+            hi = int(self.blocks[i])
+        elif self.timestamps([hi], w3)[0] < timestamp:
+            return hi + 1
+        while hi - lo > 1:
+            mid = (lo + hi)//2
+            if self.timestamps([mid], w3)[0] >= timestamp:
+                hi = mid
+            else:
+                lo = mid
+
+        return hi
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the NFT contracts ingested
+
+Each Contract records what ingestion needs to know about a token
+contract: its platform, address, deployment block (None: found with
+log_fetcher.find_deployment_block), where its Transfer event puts the
+token ID ("topic" when indexed, "data" otherwise) and the custodial
+addresses (auction houses, escrow markets) that hold tokens without
+owning them. ABIs live in abis/ as JSON files.
+
+    for contract in get_contracts(["SuperRare", "Foundation"]):
+        ...
+    excluded = excluded_addresses(get_contracts(["SuperRare"]))
+"""
+
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+ABI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abis")
+
+Contract = namedtuple("Contract", ["name", "platform", "address", "deployment_block", "token_id_in", "custodial", "abi"])
+
+CONTRACTS = OrderedDict()
+
+def register(contract):
+    """Add a contract to the registry, replacing one of the same name"""
+    if contract.token_id_in not in ("topic", "data"):
+        raise ValueError("token_id_in of {} must be 'topic' or 'data'".format(contract.name))
+    CONTRACTS[contract.name] = contract._replace(address=contract.address.lower(),
+                                                 custodial=tuple(x.lower() for x in contract.custodial))
+    return CONTRACTS[contract.name]
+
+def get_contracts(platforms=None, names=None):
+    """Registered contracts, of some platforms or with some names only if given"""
+    if names is not None:
+        return [CONTRACTS[x] for x in names]
+    if platforms is None:
+        return list(CONTRACTS.values())
+    unknown = set(platforms) - set(c.platform for c in CONTRACTS.values())
+    if unknown:
+        raise KeyError("No contract registered for {}".format(", ".join(sorted(unknown))))
+    return [c for c in CONTRACTS.values() if c.platform in platforms]
+
+def platforms():
+    """Platforms with a registered contract, in registry order"""
+    return list(OrderedDict.fromkeys(c.platform for c in CONTRACTS.values()))
+
+def excluded_addresses(contracts):
+    """Addresses whose tokens are not owned by anyone: the contracts and their custodial addresses"""
+    excluded = []
+    for contract in contracts:
+        excluded.append(contract.address)
+        excluded.extend(contract.custodial)
+    return list(OrderedDict.fromkeys(excluded))
+
+def load_abi(contract):
+    """ABI of a contract from abis/, None if it has none"""
+    if contract.abi is None:
+        return None
+    with open(os.path.join(ABI_DIR, contract.abi)) as f:
+        return json.load(f)
+
+register(Contract("superrare_v1", "SuperRare", "0x41a322b28d0ff354040e2cbc676f0320d8c8850d", None, "data",
+                  ("0x8c9f364bf7a56ed058fc63ef81c6cf09c833e656",), "superrare_v1.json"))
+register(Contract("superrare_v2", "SuperRare", "0xb932a70a57673d89f4acffbe830e8ed7f75fb9e0", None, "topic",
+                  ("0x8c9f364bf7a56ed058fc63ef81c6cf09c833e656",), "superrare_v2.json"))
+register(Contract("foundation", "Foundation", "0x3b3ee1931dc30c1957379fac9aba94d1c48a5405", None, "topic",
+                  ("0xcda72070e455bb31c7690a170224ce43623d0b6f",), None))
+register(Contract("knownorigin_v2", "KnownOrigin", "0xfbeef911dc5821886e1dda71586d90ed28174b7d", None, "topic", (), None))
+register(Contract("makersplace_v2", "MakersPlace", "0x2a46f2ffd99e19a89476e2f62270e0a35bbf0756", None, "topic", (), None))
+register(Contract("async_v1", "Async", "0x6c424c25e9f1fff9642cb5b7750b0db7312c29ad", None, "topic", (), None))
+register(Contract("async_v2", "Async", "0xb6dae651468e9593e4581705a09c10a76ac1e0c8", None, "topic", (), None))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Hot reload of the viewer dataset
+
+A Dataset bundles everything the app reads per request: the node index,
+the graph, the ranked neighbour lists, the username prefix index and the
+precomputed layout, with the dataset version. It is never modified after
+it is built. DatasetManager holds the current one and watches the
+snapshot file, or a version marker naming the snapshot to serve, from a
+background thread: on a change the new Dataset is built next to the old
+one and swapped in with a single reference assignment. Requests take the
+reference once, at their start, so requests in flight finish on the
+version they started with, which stays valid (the memory-mapped snapshot
+survives the file being replaced).
+
+Publishing a new snapshot is writing it (write_snapshot renames it into
+place) or, with a marker, writing the new file then the marker:
+
+    python snapshot.py pairs_2021-09-05.csv superrare_2021-09-05.srnet
+    echo superrare_2021-09-05.srnet > current_dataset.txt
+"""
+
+import os
+import threading
+import time
+from collections import namedtuple
+
+from layout import load_positions
+from metrics import REGISTRY
+from prefix_index import PrefixIndex
+from snapshot import load_dataset
+
+Dataset = namedtuple("Dataset", ["version", "node_index", "graph", "ranked_graph", "prefix_index",
+                                 "positions", "source", "loaded_at"])
+
+def build_dataset(snapshot_path, csv_path, layout_path=None):
+    """Dataset from a snapshot (the csv only if there is none), with its indexes"""
+    node_index, graph, version = load_dataset(snapshot_path, csv_path)
+    #Neighbour lists ordered by followers, for budgeted multi-hop queries
+    ranked_graph = graph.ranked(node_index.followers)
+    #Username autocomplete, ranked by followers then degree
+    prefix_index = PrefixIndex(node_index.names, node_index.followers, graph.degree())
+    #Precomputed global layout, NaN rows for nodes it doesn't cover
+    positions = None
+    if layout_path and os.path.exists(layout_path):
+        positions, layout_version = load_positions(layout_path, node_index)
+        if layout_version != version:
+            print("{} was computed for dataset {}, current is {}; using it for the nodes it covers".format(layout_path, layout_version, version))
+    source = snapshot_path if snapshot_path and os.path.exists(snapshot_path) else csv_path
+
+    return Dataset(version, node_index, graph, ranked_graph, prefix_index, positions, source, time.time())
+
+class DatasetManager:
+    """
+    Parameters
+    ----------
+    snapshot_path : str
+        .srnet snapshot, watched for changes.
+    csv_path : str
+        pairs csv (path or url), read only while there is no snapshot.
+    layout_path : str, optional
+        precompute_layout.py output, reloaded with the dataset.
+    marker_path : str, optional
+        version marker: a text file holding the snapshot path to serve
+        (relative to the marker's directory). Watched instead of
+        snapshot_path when given.
+    poll_interval : float
+        seconds between checks.
+    on_swap : list of callable
+        called with the new Dataset after every swap.
+    """
+
+    def __init__(self, snapshot_path, csv_path, layout_path=None, marker_path=None, poll_interval=30.0, on_swap=()):
+        self.snapshot_path = snapshot_path
+        self.csv_path = csv_path
+        self.layout_path = layout_path
+        self.marker_path = marker_path
+        self.poll_interval = poll_interval
+        self.on_swap = list(on_swap)
+        self.reloads = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._signature = self._current_signature()
+        self._current = build_dataset(self._snapshot(), csv_path, layout_path)
+
+    @property
+    def current(self):
+        """The Dataset to serve, read once per request"""
+        return self._current
+
+    def _snapshot(self):
+        """Snapshot path to load: the marker's, or snapshot_path"""
+        if self.marker_path and os.path.exists(self.marker_path):
+            with open(self.marker_path) as f:
+                name = f.read().strip()
+            if name:
+                return os.path.join(os.path.dirname(os.path.abspath(self.marker_path)), name)
+        return self.snapshot_path
+
+    def _current_signature(self):
+        """What changes when a new snapshot is published"""
+        path = self._snapshot()
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return (path, None)
+        return (path, stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def start(self):
+        """
+        Start watching, once per process
+
+        The thread is started again in a forked child (gunicorn --preload),
+        where the parent's thread does not exist.
+        """
+        if self._pid == os.getpid():
+            return self
+        with self._lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name="dataset-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self.check()
+
+    def check(self):
+        """Reload if the snapshot changed since the last load; True if a new version was swapped in"""
+        signature = self._current_signature()
+        if signature == self._signature or signature[1] is None:
+            return False
+        return self.reload(signature)
+
+    def reload(self, signature=None):
+        """
+        Build the dataset now, in the calling thread, and swap it in
+
+        A failed build keeps the current dataset (see last_error) and is
+        retried on the next change of the file only.
+        """
+        signature = signature or self._current_signature()
+        t0 = time.perf_counter()
+        try:
+            dataset = build_dataset(signature[0], self.csv_path, self.layout_path)
+        except Exception as e:
+            self._signature = signature
+            self.last_error = "{}: {}".format(type(e).__name__, e)
+            REGISTRY.inc("sr_dataset_reloads_total", result="error")
+            print("Dataset reload from {} failed, still serving {}: {}".format(signature[0], self._current.version, self.last_error))
+            return False
+        REGISTRY.observe("sr_dataset_build_seconds", time.perf_counter() - t0)
+        with self._lock:
+            self._signature = signature
+            if dataset.version == self._current.version:
+                return False
+            previous, self._current = self._current, dataset
+            self.reloads += 1
+            self.last_error = None
+        REGISTRY.inc("sr_dataset_reloads_total", result="swapped")
+        print("Dataset {} -> {} from {} in {:.1f}s".format(previous.version, dataset.version, dataset.source, time.perf_counter() - t0))
+        for callback in self.on_swap:
+            callback(dataset)
+        return True
+
+    def status(self):
+        dataset = self._current
+        return {"version": dataset.version,
+                "source": dataset.source,
+                "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(dataset.loaded_at)),
+                "nodes": len(dataset.node_index),
+                "edges": dataset.graph.n_edges,
+                "reloads": self.reloads,
+                "last_error": self.last_error,
+                "watching": self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()}
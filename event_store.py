@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Append-only on-disk store of contract event logs
+
+Each contract gets a directory holding one partition file per sync and a
+state file:
+
+    <directory>/<contract address>/000003_13012000_13050211.jsonl
+    <directory>/<contract address>/state.json
+
+A partition is the complete set of matching logs for its block range,
+one raw JSON-RPC log per line. state.json records the last synced block
+and the topics the store was built with. Every sync re-fetches the last
+reorg_depth blocks, so partitions overlap; when reading, a newer
+partition replaces older ones over the blocks it covers (logs dropped by
+a reorg disappear) and logs are deduplicated on (transactionHash,
+logIndex).
+
+Files are written next to their final path and renamed into place, and
+the state is only advanced after its partition is on disk, so an
+interrupted sync just repeats its range next time.
+"""
+
+import bisect
+import json
+import os
+import re
+
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+
+from log_fetcher import LogFetcher
+
+_PARTITION = re.compile(r"^(\d+)_(\d+)_(\d+)\.jsonl$")
+_INT_FIELDS = ("blockNumber", "logIndex", "transactionIndex")
+#data stays a hex string, as web3 returns it
+_BYTES_FIELDS = ("transactionHash", "blockHash")
+
+def _to_json(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (list, tuple)):
+        return [_to_json(x) for x in value]
+    return value
+
+def raw_log(log):
+    """JSON-RPC form of a log returned by w3.eth.get_logs (ints and bytes as hex)"""
+    return {k: _to_json(v) for k, v in dict(log).items()}
+
+def formatted_log(raw):
+    """Log in the form w3.eth.get_logs returns it (ints, HexBytes) from its JSON-RPC form"""
+    log = dict(raw)
+    for k in _INT_FIELDS:
+        if isinstance(log.get(k), str):
+            log[k] = int(log[k], 16)
+    for k in _BYTES_FIELDS:
+        if isinstance(log.get(k), str):
+            log[k] = HexBytes(log[k])
+    log["topics"] = [HexBytes(x) for x in log.get("topics", [])]
+    if "address" in log:
+        log["address"] = to_checksum_address(log["address"])
+    return log
+
+def _write_atomic(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def _uncovered(lo, hi, covered):
+    """Disjoint sub-ranges of [lo, hi] outside the sorted disjoint ranges covered"""
+    ranges = []
+    for start, end in covered:
+        if end < lo:
+            continue
+        if start > hi:
+            break
+        if start > lo:
+            ranges.append((lo, start - 1))
+        lo = max(lo, end + 1)
+    if lo <= hi:
+        ranges.append((lo, hi))
+    return ranges
+
+def _cover(covered, start, end):
+    """Sorted disjoint ranges covered plus [start, end], merged"""
+    merged = []
+    for lo, hi in sorted(covered + [(start, end)]):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+class EventStore:
+    """
+    Parameters
+    ----------
+    directory : str
+        root of the store, created if missing.
+    reorg_depth : int
+        blocks before the last synced block fetched again on every sync.
+    max_partitions : int
+        partitions of a contract above which sync compacts them into one.
+    """
+
+    def __init__(self, directory, reorg_depth=12, max_partitions=32):
+        self.directory = directory
+        self.reorg_depth = reorg_depth
+        self.max_partitions = max_partitions
+        os.makedirs(directory, exist_ok=True)
+
+    def _contract_dir(self, address):
+        return os.path.join(self.directory, address.lower())
+
+    def state(self, address):
+        """Saved state of a contract: last_block and topics, None if never synced"""
+        try:
+            with open(os.path.join(self._contract_dir(address), "state.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def last_block(self, address):
+        """Last block synced for a contract, None if never synced"""
+        state = self.state(address)
+        return None if state is None else state["last_block"]
+
+    def partitions(self, address):
+        """(sequence, start block, end block, path) of every partition, oldest first"""
+        directory = self._contract_dir(address)
+        if not os.path.isdir(directory):
+            return []
+        found = []
+        for name in os.listdir(directory):
+            match = _PARTITION.match(name)
+            if match:
+                seq, start, end = (int(x) for x in match.groups())
+                found.append((seq, start, end, os.path.join(directory, name)))
+
+        return sorted(found)
+
+    def append(self, address, start, end, logs, topics=None):
+        """
+        Save all logs of blocks [start, end] as a new partition and advance
+        the contract's last synced block to end
+        """
+        directory = self._contract_dir(address)
+        os.makedirs(directory, exist_ok=True)
+        existing = self.partitions(address)
+        seq = existing[-1][0] + 1 if existing else 0
+        path = os.path.join(directory, "{:06d}_{}_{}.jsonl".format(seq, start, end))
+        _write_atomic(path, "".join(json.dumps(raw_log(x)) + "\n" for x in logs))
+
+        state = self.state(address) or {}
+        state["last_block"] = max(end, state.get("last_block", end))
+        if topics is not None:
+            state["topics"] = list(topics)
+        _write_atomic(os.path.join(directory, "state.json"), json.dumps(state))
+
+    def read(self, address, from_block=None, to_block=None):
+        """
+        Stored logs of a contract, newest partition winning where they overlap
+
+        Returns
+        -------
+        logs : list
+            formatted like w3.eth.get_logs results, sorted by blockNumber
+            then logIndex.
+        """
+        logs = []
+        seen = set()
+        #Block ranges of the partitions already read (newer ones), merged
+        covered = []
+        for _, start, end, path in reversed(self.partitions(address)):
+            lo = start if from_block is None else max(start, from_block)
+            hi = end if to_block is None else min(end, to_block)
+            #Blocks of this partition no newer one has, skipped if none
+            ranges = _uncovered(lo, hi, covered)
+            if ranges:
+                starts = [x[0] for x in ranges]
+                with open(path) as f:
+                    for line in f:
+                        raw = json.loads(line)
+                        block = int(raw["blockNumber"], 16)
+                        i = bisect.bisect_right(starts, block) - 1
+                        if i < 0 or block > ranges[i][1]:
+                            continue
+                        key = (raw["transactionHash"], raw["logIndex"])
+                        if key in seen:
+                            continue
+                        seen.add(key)
+                        logs.append(formatted_log(raw))
+            covered = _cover(covered, start, end)
+        logs.sort(key=lambda x: (x["blockNumber"], x["logIndex"]))
+
+        return logs
+
+    def sync(self, w3, address, topics, start_block=None, head=None, fetcher=None):
+        """
+        Fetch and save the logs since the last sync
+
+        Parameters
+        ----------
+        start_block : int, optional
+            first block of the very first sync (e.g. the deployment block).
+        head : int, optional
+            last block to sync, the chain head by default.
+        fetcher : LogFetcher, optional
+
+        Partitions are compacted into one once there are more than
+        max_partitions of them.
+
+        Returns
+        -------
+        n_logs : int
+            logs fetched, including the re-fetched reorg window.
+        """
+        state = self.state(address)
+        if state is not None and state.get("topics") not in (None, list(topics)):
+            raise ValueError("{} was synced with topics {}, not {}".format(address, state["topics"], list(topics)))
+        if head is None:
+            head = w3.eth.block_number
+        if state is None:
+            start = start_block or 0
+        else:
+            start = max(start_block or 0, state["last_block"] - self.reorg_depth + 1)
+        if start > head:
+            return 0
+        if fetcher is None:
+            fetcher = LogFetcher(w3)
+        logs = fetcher.fetch(address, topics, start, head)
+        self.append(address, start, head, logs, topics=topics)
+        if len(self.partitions(address)) > self.max_partitions:
+            self.compact(address)
+
+        return len(logs)
+
+    def compact(self, address):
+        """Rewrite all partitions of a contract as one"""
+        partitions = self.partitions(address)
+        if len(partitions) < 2:
+            return
+        logs = self.read(address)
+        start = min(x[1] for x in partitions)
+        end = max(x[2] for x in partitions)
+        self.append(address, start, end, logs)
+        for _, _, _, path in partitions:
+            os.remove(path)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Plotly figure builder for ego networks
+
+Edge and node coordinates are assembled in preallocated numpy arrays
+(NaN between edge segments, serialized as null) and rounded before they
+go into the figure, which keeps the JSON sent to the browser small. Large
+ego networks switch to WebGL traces and drop the text labels, and can be
+decimated to the best-followed neighbours.
+"""
+
+import numpy as np
+import plotly.graph_objs as go
+
+#Above this many nodes traces are drawn with WebGL and without labels
+WEBGL_NODE_THRESHOLD = 1000
+#Decimals kept in coordinates, the plot is in [-1, 1]
+COORD_DECIMALS = 3
+#Above this many neighbours only the top DECIMATE_TOP_K are shown
+DECIMATE_ABOVE = 2000
+DECIMATE_TOP_K = 1000
+
+def decimate(ego_nodes, followers, top_k):
+    """
+    Keep the hub and its top_k neighbours by followers
+
+    Parameters
+    ----------
+    ego_nodes : array of int
+        node IDs, hub first.
+    followers : array
+        follower count of each node in ego_nodes.
+
+    Returns
+    -------
+    kept : array of int
+        hub first, then kept neighbours in their original order.
+    hidden : int
+        number of neighbours left out.
+    """
+    n_neighbours = len(ego_nodes) - 1
+    if top_k is None or n_neighbours <= top_k:
+        return ego_nodes, 0
+    top = np.argpartition(-np.asarray(followers[1:]), top_k)[:top_k] + 1
+    top.sort()
+    kept = np.concatenate([ego_nodes[:1], ego_nodes[top]])
+
+    return kept, n_neighbours - top_k
+
+def edge_coordinates(pos, edge_u, edge_v):
+    """x and y of every edge as (start, end, NaN) triplets"""
+    n_edges = len(edge_u)
+    x = np.full(3*n_edges, np.nan)
+    y = np.full(3*n_edges, np.nan)
+    x[0::3] = pos[edge_u, 0]
+    x[1::3] = pos[edge_v, 0]
+    y[0::3] = pos[edge_u, 1]
+    y[1::3] = pos[edge_v, 1]
+
+    return x, y
+
+def build_network_figure(sr_user, hub_degree, pos, edge_u, edge_v, attrs, note=None, webgl_threshold=WEBGL_NODE_THRESHOLD):
+    """
+    Figure of one ego network
+
+    Parameters
+    ----------
+    sr_user : str
+        hub username.
+    hub_degree : int
+        number of connections of the hub, shown on hover.
+    pos : ndarray, shape (n, 2)
+        positions, hub first.
+    edge_u, edge_v : arrays of int
+        edges as indices into pos.
+    attrs : dict of arrays
+        NodeIndex.gather of the non-hub nodes.
+    note : str, optional
+        appended to the title, e.g. what decimation left out.
+
+    Returns
+    -------
+    fig : plotly Figure
+    """
+    ## with help from https://plotly.com/python/network-graphs/ ##
+    pos = np.round(pos, COORD_DECIMALS)
+    n_nodes = len(pos)
+    webgl = n_nodes > webgl_threshold
+    scatter = go.Scattergl if webgl else go.Scatter
+    mode_ = "markers" if webgl else "markers+text"
+
+    #Edges
+    Xed, Yed = edge_coordinates(pos, edge_u, edge_v)
+    trace3=scatter(x=Xed,
+                   y=Yed,
+                   mode='lines',
+                   line=dict(color='rgb(200,200,200)', width=1),
+                   hoverinfo='none'
+                   )
+
+    profile = "https://superrare.co/{}".format(sr_user)
+    title_graph = "SR users connected to {}: <a href='{}'> {}</a>".format(sr_user,profile,profile)
+    if note:
+        title_graph += " ({})".format(note)
+
+    #Nodes
+    trace4=scatter(x=pos[1:, 0],
+                   y=pos[1:, 1],
+                   mode=mode_,
+                   name='net',
+    marker=dict(
+        showscale=True,
+        colorscale='Viridis',
+        reversescale=False,
+        color=attrs["followers"],
+        size=8,
+        colorbar=dict(
+            thickness=15,
+            title='Number of Followers',
+            xanchor='left',
+            titleside='right'
+        ),line_width=2),
+                   text=None if webgl else attrs["names"],
+                   hovertext=attrs["hover"],
+                   hoverinfo='text',
+                   textposition="bottom center",
+                   )
+
+    #SR user node
+    trace5=go.Scatter(x=pos[:1, 0],
+                      y=pos[:1, 1],
+                   mode="markers+text",
+                   name='net',
+                   marker=dict(symbol='circle-dot',
+                                 size=20,
+                                 color='red',
+                                 line=dict(color='rgb(50,50,50)', width=0.5)
+                                 ),
+                   text=[sr_user],
+                   hovertext=["{}\nDegree:{}".format(sr_user,hub_degree)],
+                   hoverinfo='text'
+                   )
+
+    data1=[trace3, trace4, trace5]
+    fig1=go.Figure(data=data1,layout=go.Layout(
+                    title='<br>{}'.format(title_graph),
+                    titlefont_size=16,
+                    showlegend=False,
+                    hovermode='closest',
+                    margin=dict(b=20,l=5,r=5,t=40),
+                    xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+                    yaxis=dict(showgrid=False, zeroline=False, showticklabels=False))
+                    )
+    fig1.update_layout(transition_duration=500)
+
+    return fig1
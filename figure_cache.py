@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+LRU cache of rendered ego-network figures
+
+Entries are serialized figure JSON keyed by (sr_user, radius, layout mode,
+dataset version). The in-process cache is bounded by entry count and by
+total JSON size. An optional on-disk backend (one file per entry under a
+per-version directory) lets gunicorn workers on the same machine share
+rendered figures. Files written are counted in memory and the directory
+is only listed and swept, down to 90% of max_disk_entries, when the count
+goes over the limit. Changing the dataset version drops every entry of
+the old version, in memory and on disk.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+class FigureCache:
+    """
+    Parameters
+    ----------
+    max_entries : int
+        figures kept in memory.
+    max_bytes : int
+        total size of the JSON kept in memory.
+    directory : str, optional
+        enables the shared on-disk backend.
+    max_disk_entries : int
+        files kept per dataset version on disk, oldest removed first.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64*1024*1024, directory=None, max_disk_entries=4096):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.version = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        #Files in the version directory, as far as this process knows
+        self._disk_entries = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def set_version(self, version):
+        """Switch to a new dataset version, dropping entries of any other"""
+        with self._lock:
+            if version == self.version:
+                return
+            self.version = version
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            if self.directory is not None:
+                os.makedirs(self._version_dir(), exist_ok=True)
+                for name in os.listdir(self.directory):
+                    if name != str(version):
+                        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                self._disk_entries = len(os.listdir(self._version_dir()))
+
+    def get(self, key):
+        """Figure JSON for key, or None"""
+        with self._lock:
+            if key[-1] != self.version:
+                self.misses += 1
+                return None
+            fig_json = self._entries.get(key)
+            if fig_json is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fig_json
+        fig_json = self._read_disk(key)
+        with self._lock:
+            if fig_json is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, fig_json)
+        return fig_json
+
+    def put(self, key, fig_json):
+        """Store figure JSON for key. Keys of another dataset version are ignored"""
+        with self._lock:
+            if key[-1] != self.version:
+                return
+            self._insert(key, fig_json)
+        self._write_disk(key, fig_json)
+
+    def stats(self):
+        """Counters and current size"""
+        with self._lock:
+            return {"version": self.version,
+                    "entries": len(self._entries),
+                    "bytes": self._bytes,
+                    "hits": self.hits,
+                    "disk_hits": self.disk_hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+    def _insert(self, key, fig_json):
+        """Add to the in-memory LRU, evicting least recently used. Lock held"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = fig_json
+        self._bytes += len(fig_json)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _version_dir(self):
+        return os.path.join(self.directory, str(self.version))
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self._version_dir(), digest + ".json")
+
+    def _read_disk(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_disk(self, key, fig_json):
+        if self.directory is None:
+            return
+        version_dir = self._version_dir()
+        try:
+            #Write then rename so other workers never read a partial file
+            fd, tmp = tempfile.mkstemp(dir=version_dir, suffix=".tmp")
+        except OSError:
+            #The disk cache is best effort; the in-memory entry is enough
+            return
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(fig_json)
+            os.replace(tmp, self._path(key))
+            tmp = None
+        except OSError:
+            return
+        finally:
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_entries += 1
+            full = self._disk_entries > self.max_disk_entries
+        if full:
+            self._sweep_disk(version_dir)
+
+    def _sweep_disk(self, version_dir):
+        """Remove the oldest files of version_dir down to 90% of max_disk_entries"""
+        keep = self.max_disk_entries*9//10
+        removed = 0
+        try:
+            files = [os.path.join(version_dir, x) for x in os.listdir(version_dir) if x.endswith(".json")]
+            if len(files) > keep:
+                files.sort(key=os.path.getmtime)
+                for path in files[:len(files) - keep]:
+                    os.remove(path)
+                    removed += 1
+        except OSError:
+            #Files removed by another worker meanwhile; counted again on the next sweep
+            return
+        with self._lock:
+            self._disk_entries = len(files) - removed
+            self.evictions += removed
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Integer-coded graph engine for ego-network queries
+
+Usernames are dictionary-encoded to int32 node IDs (see node_index.py) and
+the undirected artist/collector graph is stored as CSR arrays: the
+neighbours of node i are indices[indptr[i]:indptr[i+1]], sorted. Ego
+networks, degrees and induced-subgraph edge lists are answered with
+vectorized slicing over those two arrays. networkx is only used, through
+to_networkx, for algorithms the engine does not implement.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import networkx as nx
+
+#Result of CSRGraph.ego_budget
+#truncated: {"fanout": neighbours never examined because of fan-out caps,
+#            "nodes": nodes found but left out by the node budget,
+#            "edges": edges left out by the edge budget}
+EgoSample = namedtuple("EgoSample", ["nodes", "hops", "edge_u", "edge_v", "truncated"])
+
+class CSRGraph:
+    """
+    Undirected simple graph in compressed sparse row form
+
+    Parameters
+    ----------
+    indptr : ndarray of int64, length n_nodes + 1
+    indices : ndarray of int32
+        concatenated neighbour lists, sorted by ID (or by priority for a
+        graph returned by ranked).
+    """
+
+    def __init__(self, indptr, indices):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.indices) // 2
+
+    @classmethod
+    def from_edges(cls, src, dst, n_nodes):
+        """
+        Build the graph from an edge list of node IDs
+
+        Direction, duplicate edges, self loops and edges with an unknown
+        (negative) endpoint are dropped.
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        keep = (src != dst) & (src >= 0) & (dst >= 0)
+        src, dst = src[keep], dst[keep]
+
+        #Both directions, deduplicated through a single int64 key
+        lo = np.minimum(src, dst)
+        hi = np.maximum(src, dst)
+        key = np.unique(lo * n_nodes + hi)
+        lo, hi = key // n_nodes, key % n_nodes
+        rows = np.concatenate([lo, hi])
+        cols = np.concatenate([hi, lo])
+
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+
+        return cls(indptr, cols)
+
+    def degree(self, nodes=None):
+        """Degree of every node, or of the given node IDs"""
+        deg = np.diff(self.indptr)
+        if nodes is None:
+            return deg
+        return deg[nodes]
+
+    def neighbors(self, node):
+        """Neighbour IDs of one node (a view, do not modify)"""
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbors_of(self, nodes):
+        """
+        Concatenated neighbour lists of many nodes
+
+        Returns
+        -------
+        src : ndarray
+            the node each neighbour belongs to, repeated per neighbour.
+        dst : ndarray of int32
+            neighbour IDs.
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = self.indptr[nodes]
+        lengths = self.indptr[nodes + 1] - starts
+        total = lengths.sum()
+        #Position of each output element inside self.indices
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(total)
+
+        return np.repeat(nodes, lengths), self.indices[positions]
+
+    def ego(self, node, radius=1):
+        """
+        Node IDs within radius hops of node
+
+        Returns
+        -------
+        ndarray of int32
+            node first, then nodes at distance 1, 2, ... each sorted by ID.
+        """
+        seen = np.zeros(self.n_nodes, dtype=bool)
+        seen[node] = True
+        levels = [np.array([node], dtype=np.int32)]
+        frontier = levels[0]
+        for _ in range(radius):
+            _, nbrs = self.neighbors_of(frontier)
+            nbrs = np.unique(nbrs)
+            frontier = nbrs[~seen[nbrs]]
+            if len(frontier) == 0:
+                break
+            seen[frontier] = True
+            levels.append(frontier)
+
+        return np.concatenate(levels).astype(np.int32)
+
+    def induced_edges(self, nodes):
+        """
+        Edges of the subgraph induced by nodes, each listed once (u < v)
+
+        Returns
+        -------
+        u, v : ndarray of int32
+        """
+        nodes = np.asarray(nodes)
+        member = np.zeros(self.n_nodes, dtype=bool)
+        member[nodes] = True
+        src, dst = self.neighbors_of(nodes)
+        keep = member[dst] & (src < dst)
+
+        return src[keep].astype(np.int32), dst[keep]
+
+    def local_edges(self, nodes):
+        """
+        Induced edges of nodes, numbered by position in nodes
+
+        Returns
+        -------
+        u, v : ndarray of int64
+            indices into nodes, each edge listed once.
+        """
+        u, v = self.induced_edges(nodes)
+        return localize(nodes, u, v)
+
+    def ranked(self, priority):
+        """
+        Same graph with every neighbour list ordered by descending priority
+
+        Ties are broken by node ID. Used by ego_budget so a capped fan-out
+        is just the head of each neighbour list.
+        """
+        priority = np.asarray(priority)
+        rows = np.repeat(np.arange(self.n_nodes), np.diff(self.indptr))
+        order = np.lexsort((self.indices, -priority[self.indices], rows))
+
+        return CSRGraph(self.indptr, self.indices[order])
+
+    def ego_budget(self, node, radius=2, max_nodes=1000, max_edges=5000, fanout=(None, 25), priority=None):
+        """
+        Multi-hop ego network under a node and edge budget
+
+        Expands hop by hop. From every frontier node only the first
+        fanout[hop] neighbours are examined (None means up to the
+        remaining node budget; the last cap is reused for deeper hops),
+        so on a graph from ranked these are its best neighbours. New
+        nodes are admitted while the node budget lasts, those linked from
+        the most frontier nodes first, then by priority. Edges are the
+        links seen during expansion between admitted nodes, in discovery
+        order, cut at max_edges.
+
+        Ranking is per node only: the graph keeps one unweighted edge per
+        artist/collector pair, so the number of tokens a pair shares is
+        not taken into account (the count of frontier links stands in for
+        it).
+
+        The work done is proportional to the budget and fan-out caps,
+        not to the size of the graph.
+
+        Parameters
+        ----------
+        priority : array, optional
+            per-node score, higher is better. Degree by default.
+
+        Returns
+        -------
+        EgoSample
+            nodes (hub first, then by hop), hop of each node, edges as
+            global node IDs and a dict of truncation counts.
+        """
+        if priority is None:
+            priority = self.degree()
+        truncated = {"fanout": 0, "nodes": 0, "edges": 0}
+        levels = [np.array([node], dtype=np.int64)]
+        selected = levels[0]
+        seen_u, seen_v = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        frontier = levels[0]
+        budget = max_nodes - 1
+        for hop in range(radius):
+            if budget <= 0:
+                break
+            cap = fanout[min(hop, len(fanout) - 1)]
+            #No node can admit more than the remaining budget
+            cap = budget if cap is None else min(cap, budget)
+            starts = self.indptr[frontier]
+            degree = self.indptr[frontier + 1] - starts
+            take = np.minimum(degree, cap)
+            truncated["fanout"] += int((degree - take).sum())
+            offsets = np.repeat(starts - np.cumsum(take) + take, take)
+            src = np.repeat(frontier, take)
+            dst = self.indices[offsets + np.arange(take.sum())].astype(np.int64)
+
+            known = np.isin(dst, selected)
+            seen_u.append(src[known])
+            seen_v.append(dst[known])
+            src, dst = src[~known], dst[~known]
+
+            candidates, links = np.unique(dst, return_counts=True)
+            order = np.lexsort((candidates, -priority[candidates], -links))
+            admitted = candidates[order[:budget]]
+            truncated["nodes"] += len(candidates) - len(admitted)
+            budget -= len(admitted)
+
+            keep = np.isin(dst, admitted)
+            seen_u.append(src[keep])
+            seen_v.append(dst[keep])
+            if len(admitted) == 0:
+                break
+            levels.append(admitted)
+            selected = np.concatenate([selected, admitted])
+            frontier = admitted
+
+        #Each edge once, in the order it was first seen
+        u = np.concatenate(seen_u)
+        v = np.concatenate(seen_v)
+        lo, hi = np.minimum(u, v), np.maximum(u, v)
+        _, first = np.unique(lo*self.n_nodes + hi, return_index=True)
+        first.sort()
+        truncated["edges"] = max(len(first) - max_edges, 0)
+        first = first[:max_edges]
+
+        nodes = np.concatenate(levels).astype(np.int32)
+        hops = np.repeat(np.arange(len(levels)), [len(x) for x in levels])
+
+        return EgoSample(nodes, hops, u[first].astype(np.int32), v[first].astype(np.int32), truncated)
+
+    def to_networkx(self, nodes=None):
+        """networkx.Graph of the whole graph, or of the subgraph induced by nodes"""
+        if nodes is None:
+            nodes = np.arange(self.n_nodes)
+        u, v = self.induced_edges(nodes)
+        G = nx.Graph()
+        G.add_nodes_from(np.asarray(nodes).tolist())
+        G.add_edges_from(zip(u.tolist(), v.tolist()))
+
+        return G
+
+def localize(nodes, u, v):
+    """Renumber edges between node IDs as indices into nodes"""
+    nodes = np.asarray(nodes)
+    order = np.argsort(nodes)
+    sorted_nodes = nodes[order]
+
+    return order[np.searchsorted(sorted_nodes, u)], order[np.searchsorted(sorted_nodes, v)]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Parallel transfer ingestion across the registered contracts
+
+Every contract is synced and decoded in its own worker process, with its
+own web3 connection and its own directory of the event store, so several
+platforms are scanned at once instead of one whole-chain scan after the
+other. Workers send back a TransferBatch (int codes and a small address
+table), which the parent interns into one AddressBook and merges into a
+single transfer table tagged with platform and contract.
+
+    summaries = sync_contracts(get_contracts(), endpoint, "transfer_events")
+    book, df_transfers = load_transfers(get_contracts(), "transfer_events")
+
+endpoint is an RPC url, or a picklable callable returning a web3
+provider (e.g. functools.partial(RecordedLogProvider.from_file, path)).
+RPC calls of the workers are counted (metrics.instrument_provider) and
+added to metrics.REGISTRY of the parent, under the stage running there.
+"""
+
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from eth_utils import to_checksum_address
+from web3 import Web3
+
+import metrics
+from address_book import AddressBook
+from event_store import EventStore
+from log_fetcher import LogFetcher, find_deployment_block
+from transfer_decoder import decode_transfer_logs, TRANSFER_TOPIC_HEX
+
+def connect(endpoint):
+    """Web3 connection to an RPC url or to the provider a callable returns, with its calls counted"""
+    provider = endpoint() if callable(endpoint) else Web3.HTTPProvider(endpoint)
+    return Web3(metrics.instrument_provider(provider))
+
+def log_digest(logs):
+    """Hash of the (block, txhash, logIndex) of logs, to tell whether they changed"""
+    digest = hashlib.sha256()
+    for event in logs:
+        tx = event["transactionHash"]
+        digest.update("{}:{}:{};".format(event["blockNumber"], tx if isinstance(tx, str) else bytes.hex(bytes(tx)),
+                                         event["logIndex"]).encode("ascii"))
+    return digest.hexdigest()
+
+def sync_contract(contract, endpoint, store_dir, window=100000, max_workers=4):
+    """
+    Sync the Transfer logs of one contract into the event store
+
+    Returns
+    -------
+    dict
+        name, address, rows (logs stored) and digest of the logs.
+    """
+    w3 = connect(endpoint)
+    store = EventStore(store_dir)
+    head = w3.eth.block_number
+    address = to_checksum_address(contract.address)
+    start = contract.deployment_block
+    if start is None and store.last_block(address) is None:
+        start = find_deployment_block(w3, address, hi=head)
+    fetcher = LogFetcher(w3, max_workers=max_workers, window=window)
+    store.sync(w3, address, [TRANSFER_TOPIC_HEX], start_block=start, head=head, fetcher=fetcher)
+    logs = store.read(address)
+
+    return {"name": contract.name, "address": contract.address, "rows": len(logs), "digest": log_digest(logs)}
+
+def decode_contract(contract, store_dir):
+    """TransferBatch of the stored Transfer logs of one contract"""
+    logs = EventStore(store_dir).read(contract.address)
+    return decode_transfer_logs(logs, token_id_in=contract.token_id_in)
+
+def _sync_worker(contract, endpoint, store_dir, window):
+    """sync_contract in a worker process, with the metrics of this call only"""
+    metrics.REGISTRY.reset()
+    summary = sync_contract(contract, endpoint, store_dir, window)
+    return summary, metrics.REGISTRY.snapshot()
+
+def sync_contracts(contracts, endpoint, store_dir, max_workers=None, window=100000):
+    """sync_contract for several contracts, one worker process each"""
+    labels = {"stage": metrics.current_stage()} if metrics.current_stage() else {}
+    summaries = []
+    with ProcessPoolExecutor(max_workers=max_workers or len(contracts) or 1) as pool:
+        futures = [pool.submit(_sync_worker, c, endpoint, store_dir, window) for c in contracts]
+        for future in futures:
+            summary, snapshot = future.result()
+            metrics.REGISTRY.merge(snapshot, **labels)
+            summaries.append(summary)
+    return summaries
+
+def load_transfers(contracts, store_dir, book=None, max_workers=None):
+    """
+    Stored transfers of several contracts as one table, decoded in parallel
+
+    Returns
+    -------
+    book : AddressBook
+    df_transfers : DataFrame
+        columns of TransferBatch.to_frame with from/to as book codes, plus
+        contract_address (book code) and Platform.
+    """
+    book = book if book is not None else AddressBook()
+    with ProcessPoolExecutor(max_workers=max_workers or len(contracts) or 1) as pool:
+        batches = list(pool.map(decode_contract, contracts, [store_dir]*len(contracts)))
+
+    frames = []
+    for contract, batch in zip(contracts, batches):
+        #Worker address table -> shared codes
+        codes = book.intern(batch.addresses) if len(batch.addresses) else np.zeros(0, dtype=np.int32)
+        batch.from_code, batch.to_code = codes[batch.from_code], codes[batch.to_code]
+        batch.addresses, batch.book = None, book
+        df = batch.to_frame()
+        df["contract_address"] = np.int32(book.add(contract.address))
+        df["Platform"] = contract.platform
+        frames.append(df)
+    df_transfers = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    return book, df_transfers
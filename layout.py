@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Layouts for ego networks
+
+All layouts work on a local numbering of the ego network: node 0 is the
+hub, nodes 1..n-1 are the rest of the ego, and edges are given as two
+arrays of local indices (see CSRGraph.local_edges). They return an
+(n, 2) float array of positions and are deterministic for a given seed,
+so re-rendering the same user gives the same picture.
+
+Layouts are looked up by name in LAYOUTS; "auto" picks one from the size
+of the ego network (choose_layout). Positions for the whole graph can also
+be computed offline (precompute_layout.py) and sliced per ego network with
+slice_layout.
+"""
+
+import time
+
+import numpy as np
+import networkx as nx
+
+from node_index import ROLE_ARTIST, ROLE_COLLECTOR, ROLE_BOTH
+
+#Above this many nodes the force layout uses the grid approximation
+EXACT_REPULSION_MAX = 200
+#Above this many nodes "auto" switches from force-directed to concentric
+FORCE_LAYOUT_MAX = 300
+
+def hop_distance(n_nodes, u, v, root=0):
+    """Hop distance of each local node from root (n_nodes if unreachable)"""
+    dist = np.full(n_nodes, n_nodes, dtype=np.int64)
+    dist[root] = 0
+    a = np.concatenate([u, v])
+    b = np.concatenate([v, u])
+    d = 0
+    while True:
+        step = (dist[a] == d) & (dist[b] > d + 1)
+        if not step.any():
+            return dist
+        dist[b[step]] = d + 1
+        d += 1
+
+def concentric_layout(rings, order=None):
+    """
+    Place nodes on concentric circles
+
+    Parameters
+    ----------
+    rings : array of int
+        ring of each node, 0 is the centre. Empty rings leave no gap.
+    order : array, optional
+        nodes are spread around their ring in increasing order of this key
+        (node index by default).
+
+    Returns
+    -------
+    pos : ndarray, shape (n, 2)
+    """
+    rings = np.asarray(rings)
+    n = len(rings)
+    if order is None:
+        order = np.arange(n)
+    order = np.asarray(order)
+    pos = np.zeros((n, 2))
+    outer = np.unique(rings[rings > 0])
+    for rank, ring in enumerate(outer, 1):
+        members = np.flatnonzero(rings == ring)
+        members = members[np.argsort(order[members], kind="mergesort")]
+        radius = rank/len(outer)
+        #Offset alternate rings by half a step so spokes don't line up
+        theta = 2*np.pi*(np.arange(len(members)) + 0.5*(rank % 2))/len(members)
+        pos[members, 0] = radius*np.cos(theta)
+        pos[members, 1] = radius*np.sin(theta)
+
+    return pos
+
+def radial_layout(n_nodes, u, v, roles=None, order=None, seed=0):
+    """Hub in the centre, one ring per hop distance"""
+    return concentric_layout(hop_distance(n_nodes, u, v), order)
+
+#Ring of each role inside one hop distance
+_ROLE_RING = {ROLE_ARTIST: 0, ROLE_BOTH: 1, ROLE_COLLECTOR: 2}
+
+def role_concentric_layout(n_nodes, u, v, roles=None, order=None, seed=0):
+    """
+    Hub in the centre, neighbours grouped into rings by role
+
+    Within each hop distance, artists go on the inner ring, artists who
+    also collect in the middle and collectors on the outer ring.
+    """
+    if roles is None:
+        return radial_layout(n_nodes, u, v, order=order)
+    hops = hop_distance(n_nodes, u, v)
+    role_ring = np.vectorize(lambda r: _ROLE_RING.get(r, 2), otypes=[np.int64])(roles)
+    rings = np.where(hops == 0, 0, (hops - 1)*3 + role_ring + 1)
+
+    return concentric_layout(rings, order)
+
+def _grid_repulsion(pos, k2, n_cells):
+    """
+    Approximate all-pairs repulsion using cell centroids of a grid
+
+    Each node is pushed away from the centroid of every grid cell, weighted
+    by the number of nodes in it. The node itself is removed from its own
+    cell first.
+    """
+    lo = pos.min(axis=0)
+    span = np.maximum(pos.max(axis=0) - lo, 1e-9)
+    cell_xy = np.minimum((pos - lo)/span*n_cells, n_cells - 1).astype(np.int64)
+    cell = cell_xy[:, 0]*n_cells + cell_xy[:, 1]
+    n_total = n_cells*n_cells
+    mass = np.bincount(cell, minlength=n_total).astype(float)
+    sum_x = np.bincount(cell, weights=pos[:, 0], minlength=n_total)
+    sum_y = np.bincount(cell, weights=pos[:, 1], minlength=n_total)
+    occupied = np.flatnonzero(mass)
+    mass, sum_x, sum_y = mass[occupied], sum_x[occupied], sum_y[occupied]
+    centroid = np.stack([sum_x/mass, sum_y/mass], axis=1)
+
+    dx = pos[:, 0, None] - centroid[None, :, 0]
+    dy = pos[:, 1, None] - centroid[None, :, 1]
+    weight = np.broadcast_to(mass, dx.shape).copy()
+
+    #Own cell without the node itself
+    own = np.searchsorted(occupied, cell)
+    rows = np.arange(len(pos))
+    own_mass = mass[own] - 1
+    own_sum = np.stack([sum_x[own], sum_y[own]], axis=1) - pos
+    own_delta = np.where((own_mass > 0)[:, None], pos - own_sum/np.maximum(own_mass, 1)[:, None], 0.0)
+    dx[rows, own] = own_delta[:, 0]
+    dy[rows, own] = own_delta[:, 1]
+    weight[rows, own] = own_mass
+
+    scale = weight*k2/np.maximum(dx*dx + dy*dy, 1e-6)
+    return np.stack([(dx*scale).sum(axis=1), (dy*scale).sum(axis=1)], axis=1)
+
+def _exact_repulsion(pos, k2):
+    """All-pairs repulsion, O(n^2) memory"""
+    dx = pos[:, 0, None] - pos[None, :, 0]
+    dy = pos[:, 1, None] - pos[None, :, 1]
+    dist2 = np.maximum(dx*dx + dy*dy, 1e-6)
+    np.fill_diagonal(dist2, np.inf)
+    scale = k2/dist2
+    return np.stack([(dx*scale).sum(axis=1), (dy*scale).sum(axis=1)], axis=1)
+
+def force_layout(n_nodes, u, v, roles=None, order=None, seed=0, iterations=50, time_budget=0.25, init=None):
+    """
+    Fruchterman-Reingold force-directed layout, vectorized with numpy
+
+    Repulsion is exact up to EXACT_REPULSION_MAX nodes and uses a grid
+    (cell centroid) approximation above that. The run stops after
+    iterations steps or time_budget seconds (None for no limit),
+    whichever comes first.
+
+    Parameters
+    ----------
+    init : ndarray, optional
+        starting positions. Random (from seed) by default.
+    """
+    rs = np.random.RandomState(seed)
+    if init is None:
+        pos = rs.uniform(-1, 1, size=(n_nodes, 2))
+    else:
+        pos = np.array(init, dtype=float)
+    if n_nodes <= 1:
+        return np.zeros((n_nodes, 2))
+    u = np.asarray(u, dtype=np.int64)
+    v = np.asarray(v, dtype=np.int64)
+
+    k = 1.0/np.sqrt(n_nodes)
+    k2 = k*k
+    n_cells = int(min(16, max(4, np.sqrt(n_nodes)/4)))
+    temperature = 0.1
+    cooling = temperature/(iterations + 1)
+    deadline = time.perf_counter() + (np.inf if time_budget is None else time_budget)
+    for _ in range(iterations):
+        if n_nodes <= EXACT_REPULSION_MAX:
+            disp = _exact_repulsion(pos, k2)
+        else:
+            disp = _grid_repulsion(pos, k2, n_cells)
+
+        #Attraction along edges
+        delta = pos[u] - pos[v]
+        dist = np.sqrt(np.maximum((delta**2).sum(axis=1), 1e-12))
+        pull = delta*(dist/k)[:, None]
+        np.add.at(disp, u, -pull)
+        np.add.at(disp, v, pull)
+
+        length = np.sqrt(np.maximum((disp**2).sum(axis=1), 1e-12))
+        pos += disp*(np.minimum(length, temperature)/length)[:, None]
+        temperature -= cooling
+        if time.perf_counter() > deadline:
+            break
+
+    return _normalize(pos - pos[0])
+
+def spring_layout(n_nodes, u, v, roles=None, order=None, seed=0):
+    """networkx spring_layout, kept as a fallback"""
+    G = nx.Graph()
+    G.add_nodes_from(range(n_nodes))
+    G.add_edges_from(zip(np.asarray(u).tolist(), np.asarray(v).tolist()))
+    pos = nx.spring_layout(G, seed=seed)
+
+    return np.array([pos[i] for i in range(n_nodes)])
+
+def _normalize(pos):
+    """Scale positions into [-1, 1] keeping the aspect ratio"""
+    scale = np.abs(pos).max()
+    if scale > 0:
+        pos = pos/scale
+    return pos
+
+LAYOUTS = {
+    "force": force_layout,
+    "radial": radial_layout,
+    "concentric": role_concentric_layout,
+    "spring": spring_layout,
+}
+
+def choose_layout(n_nodes, n_edges):
+    """Layout name used by "auto" for an ego network of this size"""
+    if n_nodes <= FORCE_LAYOUT_MAX:
+        return "force"
+    return "concentric"
+
+def compute_layout(mode, n_nodes, u, v, roles=None, order=None, seed=0):
+    """
+    Positions for a local ego network
+
+    Parameters
+    ----------
+    mode : str
+        a key of LAYOUTS, or "auto".
+
+    Returns
+    -------
+    pos : ndarray, shape (n_nodes, 2)
+    mode : str
+        the layout actually used.
+    """
+    if mode == "auto":
+        mode = choose_layout(n_nodes, len(u))
+    pos = LAYOUTS[mode](n_nodes, u, v, roles=roles, order=order, seed=seed)
+
+    return pos, mode
+
+def save_positions(path, names, pos, fingerprint=""):
+    """Save a global layout as an .npz of node names and x/y coordinates"""
+    np.savez(path, names=np.asarray(names, dtype=str), x=pos[:, 0], y=pos[:, 1],
+             fingerprint=np.array(fingerprint))
+
+def load_positions(path, node_index):
+    """
+    Load a global layout and align it with the node IDs of node_index
+
+    Positions are matched by username, so a file computed for an older
+    snapshot still covers every node the two snapshots share.
+
+    Returns
+    -------
+    pos : ndarray, shape (len(node_index), 2)
+        NaN for nodes missing from the file.
+    fingerprint : str
+        dataset fingerprint stored with the layout.
+    """
+    with np.load(path) as saved:
+        ids = node_index.encode(saved["names"].astype(object))
+        found = ids >= 0
+        pos = np.full((len(node_index), 2), np.nan)
+        pos[ids[found], 0] = saved["x"][found]
+        pos[ids[found], 1] = saved["y"][found]
+        fingerprint = str(saved["fingerprint"])
+
+    return pos, fingerprint
+
+def slice_layout(positions, nodes, recenter=True):
+    """
+    Positions of an ego network cut out of a global layout
+
+    Parameters
+    ----------
+    positions : ndarray, shape (n_nodes, 2)
+        global layout indexed by node ID, NaN where unknown.
+    nodes : array of int
+        ego node IDs, hub first.
+    recenter : bool
+        move the hub to the origin and scale the ego into [-1, 1].
+
+    Returns
+    -------
+    pos : ndarray, shape (len(nodes), 2), or None if any node has no position
+    """
+    pos = positions[nodes]
+    if np.isnan(pos).any():
+        return None
+    if recenter:
+        pos = _normalize(pos - pos[0])
+
+    return pos
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, adaptive eth_getLogs scheduler
+
+A block range is cut into windows that are fetched by a thread pool. The
+window size adapts to the data: when the provider rejects a window as too
+large (result count or response size limit) the window is split in two
+and both halves are queued again, and when a window comes back sparse the
+next windows are made twice as big. Failed calls are retried with
+exponential backoff and jitter. Windows never overlap, so no log is
+returned twice.
+
+    fetcher = LogFetcher(w3, max_workers=8)
+    logs = fetcher.fetch(address, [transfer_topic], start_block, w3.eth.block_number)
+"""
+
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from eth_utils import to_checksum_address
+
+#Provider messages meaning the window has to get smaller (Infura, Alchemy, geth, erigon...)
+TOO_LARGE_MESSAGES = ("query returned more than",
+                      "more than 10000 results",
+                      "log response size exceeded",
+                      "response size exceeded",
+                      "block range is too large",
+                      "block range too large",
+                      "exceed maximum block range",
+                      "too many results")
+
+def is_too_large(exc):
+    """True if a provider error means the requested block range returns too much"""
+    message = str(exc).lower()
+    return any(x in message for x in TOO_LARGE_MESSAGES)
+
+def find_deployment_block(w3, address, lo=0, hi=None):
+    """
+    First block at which a contract has code
+
+    Binary search over eth_getCode, about 25 calls on mainnet. Needs a
+    node that serves historical state (Infura and Alchemy do).
+
+    Returns
+    -------
+    block : int
+        deployment block, or hi + 1 if there is no code at hi.
+    """
+    address = to_checksum_address(address)
+    if hi is None:
+        hi = w3.eth.block_number
+    if len(w3.eth.get_code(address, block_identifier=hi)) == 0:
+        return hi + 1
+    while lo < hi:
+        mid = (lo + hi)//2
+        if len(w3.eth.get_code(address, block_identifier=mid)) > 0:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return lo
+
+class LogFetcher:
+    """
+    Parameters
+    ----------
+    w3 : Web3
+        connection, shared by the worker threads.
+    max_workers : int
+        getLogs calls in flight at once.
+    window : int
+        initial blocks per call.
+    min_window, max_window : int
+        bounds of the adaptive window size.
+    sparse_logs : int
+        a window returning fewer logs than this doubles the window size.
+    max_retries : int
+        attempts per window on errors other than too-large, before giving up.
+    backoff : float
+        seconds before the first retry, doubled on every further one.
+    verbose : bool
+        print every completed window.
+    """
+
+    def __init__(self, w3, max_workers=4, window=100000, min_window=1, max_window=1000000,
+                 sparse_logs=1000, max_retries=5, backoff=0.5, verbose=False):
+        self.w3 = w3
+        self.max_workers = max_workers
+        self.window = window
+        self.min_window = min_window
+        self.max_window = max_window
+        self.sparse_logs = sparse_logs
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.verbose = verbose
+        self.calls = 0
+        self.splits = 0
+        self.retries = 0
+        self.grows = 0
+
+    def _get_logs(self, address, topics, start, end, attempt):
+        if attempt:
+            time.sleep(self.backoff*2**(attempt - 1)*random.uniform(0.5, 1.5))
+        return self.w3.eth.get_logs({"fromBlock": start,
+                                     "toBlock": end,
+                                     "address": address,
+                                     "topics": topics})
+
+    def fetch(self, address, topics, from_block, to_block):
+        """
+        All logs of address matching topics in [from_block, to_block]
+
+        Returns
+        -------
+        logs : list
+            sorted by blockNumber, then logIndex.
+        """
+        address = to_checksum_address(address)
+        logs = []
+        next_block = from_block
+        #Windows to (re)fetch before new ones: (start, end, attempt)
+        queue = deque()
+        pending = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while next_block <= to_block or queue or pending:
+                while len(pending) < self.max_workers:
+                    if queue:
+                        start, end, attempt = queue.popleft()
+                    elif next_block <= to_block:
+                        start, end, attempt = next_block, min(next_block + self.window - 1, to_block), 0
+                        next_block = end + 1
+                    else:
+                        break
+                    self.calls += 1
+                    pending[pool.submit(self._get_logs, address, topics, start, end, attempt)] = (start, end, attempt)
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end, attempt = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        if is_too_large(exc) and end > start:
+                            mid = (start + end)//2
+                            queue.appendleft((mid + 1, end, 0))
+                            queue.appendleft((start, mid, 0))
+                            self.window = max(self.min_window, min(self.window, mid - start + 1))
+                            self.splits += 1
+                            continue
+                        if attempt >= self.max_retries:
+                            raise
+                        queue.append((start, end, attempt + 1))
+                        self.retries += 1
+                        continue
+                    logs.extend(result)
+                    if self.verbose:
+                        print(start, end, len(result))
+                    if len(result) < self.sparse_logs and end - start + 1 >= self.window and self.window < self.max_window:
+                        self.window = min(self.max_window, self.window*2)
+                        self.grows += 1
+
+        logs.sort(key=lambda x: (x["blockNumber"], x["logIndex"]))
+
+        return logs
+
+    def stats(self):
+        """Call, split, retry and grow counters and the current window size"""
+        return {"calls": self.calls, "splits": self.splits, "retries": self.retries,
+                "grows": self.grows, "window": self.window}
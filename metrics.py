@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+In-process timers, counters and latency histograms
+
+REGISTRY aggregates counters and fixed-bucket histograms keyed by metric
+name and labels, cheap enough for hot paths (one lock, a dict lookup and
+a bucket bisect per observation), and renders them in the Prometheus
+text format for app.py's /metrics.
+
+    with REGISTRY.timer("sr_get_network_phase_seconds", phase="layout"):
+        ...
+    REGISTRY.inc("sr_figure_cache_total", result="hit")
+
+RPC traffic is counted by wrapping the provider (instrument_provider),
+which also sees the JSON-RPC batches ReceiptService and BlockTimeIndex
+send past web3; receipt_service.batch_request counts the batches it posts
+itself, for providers without make_batch_request. Calls are labelled with the pipeline stage running in the
+thread (see stage), so each stage of query_SR_data reports its own calls
+and seconds; worker processes send theirs back with snapshot/merge.
+
+SlowRequestProfiler samples the stack of a request's thread while it
+runs and, when the request turns out slow, writes the samples as folded
+stacks (one "frame;frame;frame count" line each, for flamegraph tools).
+"""
+
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs) + "}"
+
+class Histogram:
+    """Counts of observations per bucket (upper bounds), with their sum"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0]*(len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts, total, count):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.sum += total
+        self.count += count
+
+class MetricsRegistry:
+    """
+    Parameters
+    ----------
+    buckets : tuple of float
+        histogram bucket upper bounds, in seconds for timers.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Add an observation to a histogram"""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the seconds spent in the with block, exceptions included"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    def total(self, name, **labels):
+        """Sum of a counter over the series with at least these labels"""
+        wanted = set(_labels_key(labels))
+        with self._lock:
+            return sum(v for (n, k), v in self._counters.items() if n == name and wanted <= set(k))
+
+    def summary(self, name, **labels):
+        """Observation count and sum of a histogram over the series with at least these labels"""
+        wanted = set(_labels_key(labels))
+        with self._lock:
+            found = [h for (n, k), h in self._histograms.items() if n == name and wanted <= set(k)]
+            return sum(h.count for h in found), sum(h.sum for h in found)
+
+    def snapshot(self):
+        """Picklable copy of all series, see merge"""
+        with self._lock:
+            return {"counters": dict(self._counters),
+                    "histograms": {k: (list(h.counts), h.sum, h.count) for k, h in self._histograms.items()}}
+
+    def merge(self, snapshot, **labels):
+        """Add a snapshot (e.g. from a worker process), with extra labels on every series"""
+        def relabel(key):
+            name, series = key
+            return name, _labels_key(dict(dict(series), **{k: v for k, v in labels.items() if k not in dict(series)}))
+        with self._lock:
+            for key, value in snapshot["counters"].items():
+                key = relabel(key)
+                self._counters[key] = self._counters.get(key, 0) + value
+            for key, (counts, total, count) in snapshot["histograms"].items():
+                key = relabel(key)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.buckets)
+                histogram.merge(counts, total, count)
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def render(self):
+        """All series in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda x: x[0])
+            histograms = [(k, list(h.counts), h.sum, h.count, h.buckets) for k, h in histograms]
+        name = None
+        for (metric, labels), value in counters:
+            if metric != name:
+                name = metric
+                lines.append("# TYPE {} counter".format(name))
+            lines.append("{}{} {}".format(metric, _format_labels(labels), value))
+        name = None
+        for (metric, labels), counts, total, count, buckets in histograms:
+            if metric != name:
+                name = metric
+                lines.append("# TYPE {} histogram".format(name))
+            cumulative = 0
+            for bound, n in zip(list(buckets) + ["+Inf"], counts):
+                cumulative += n
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append("{}_bucket{} {}".format(metric, _format_labels(labels, [("le", le)]), cumulative))
+            lines.append("{}_sum{} {}".format(metric, _format_labels(labels), total))
+            lines.append("{}_count{} {}".format(metric, _format_labels(labels), count))
+
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+#Pipeline stage of the current thread, added to RPC series
+_context = threading.local()
+
+@contextmanager
+def stage(name):
+    """Label the RPC calls made by this thread in the with block with stage=name"""
+    previous = getattr(_context, "stage", None)
+    _context.stage = name
+    try:
+        yield
+    finally:
+        _context.stage = previous
+
+def current_stage():
+    return getattr(_context, "stage", None)
+
+def _stage_labels():
+    name = current_stage()
+    return {} if name is None else {"stage": name}
+
+def record_batch(calls, responses, seconds, registry=REGISTRY):
+    """Count a JSON-RPC batch of (method, params) and its responses, as instrument_provider does"""
+    labels = _stage_labels()
+    registry.observe("sr_rpc_seconds", seconds, method="batch", **labels)
+    for (method, _), response in zip(calls, responses):
+        registry.inc("sr_rpc_calls_total", method=method, **labels)
+        if isinstance(response, dict) and response.get("error"):
+            registry.inc("sr_rpc_errors_total", method=method, **labels)
+
+def instrument_provider(provider, registry=REGISTRY):
+    """
+    Count and time every JSON-RPC call going through a web3 provider
+
+    sr_rpc_calls_total{method} counts calls (each call of a batch too),
+    sr_rpc_seconds{method} times requests (method="batch" for a batch),
+    sr_rpc_errors_total{method} counts error responses.
+
+    Returns
+    -------
+    the provider, instrumented once even if called again
+    """
+    if getattr(provider, "_sr_instrumented", False):
+        return provider
+    make_request = provider.make_request
+
+    def counted_request(method, params):
+        labels = _stage_labels()
+        with registry.timer("sr_rpc_seconds", method=method, **labels):
+            response = make_request(method, params)
+        registry.inc("sr_rpc_calls_total", method=method, **labels)
+        if isinstance(response, dict) and response.get("error"):
+            registry.inc("sr_rpc_errors_total", method=method, **labels)
+        return response
+    provider.make_request = counted_request
+
+    if hasattr(provider, "make_batch_request"):
+        make_batch_request = provider.make_batch_request
+
+        def counted_batch(calls):
+            t0 = time.perf_counter()
+            try:
+                responses = make_batch_request(calls)
+            except Exception:
+                registry.observe("sr_rpc_seconds", time.perf_counter() - t0, method="batch", **_stage_labels())
+                raise
+            record_batch(calls, responses, time.perf_counter() - t0, registry)
+            return responses
+        provider.make_batch_request = counted_batch
+    provider._sr_instrumented = True
+
+    return provider
+
+class SlowRequestProfiler:
+    """
+    Parameters
+    ----------
+    threshold : float
+        seconds above which a request's samples are written.
+    directory : str
+        where the .folded files go, created if missing.
+    interval : float
+        seconds between stack samples.
+    max_dumps : int
+        files kept at most, oldest removed first.
+    """
+
+    def __init__(self, threshold=1.0, directory="slow_requests", interval=0.005, max_dumps=100, registry=REGISTRY):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self.max_dumps = max_dumps
+        self.registry = registry
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, name):
+        """Sample the calling thread during the with block"""
+        thread_id = threading.get_ident()
+        samples = Counter()
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.interval):
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append("{}:{}".format(os.path.basename(frame.f_code.co_filename), frame.f_code.co_name))
+                    frame = frame.f_back
+                samples[";".join(reversed(stack))] += 1
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            done.set()
+            sampler.join()
+            elapsed = time.perf_counter() - t0
+            if elapsed >= self.threshold:
+                self._dump(name, elapsed, samples)
+
+    def _dump(self, name, elapsed, samples):
+        self.registry.inc("sr_slow_requests_total")
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name))[:60]
+        path = os.path.join(self.directory, "{}_{}_{:.0f}ms.folded".format(time.strftime("%Y%m%d-%H%M%S"), safe, elapsed*1e3))
+        with open(path, "w") as f:
+            for stack, n in samples.most_common():
+                f.write("{} {}\n".format(stack, n))
+        dumps = sorted(x for x in os.listdir(self.directory) if x.endswith(".folded"))
+        for old in dumps[:max(0, len(dumps) - self.max_dumps)]:
+            os.remove(os.path.join(self.directory, old))
+
+PROFILER = None
+
+def configure_profiler(threshold, directory="slow_requests", interval=0.005):
+    """Turn on slow request dumps for profiled blocks"""
+    global PROFILER
+    PROFILER = SlowRequestProfiler(threshold, directory, interval)
+    return PROFILER
+
+@contextmanager
+def profiled(name):
+    """PROFILER.profile(name) if the profiler is on, nothing otherwise"""
+    if PROFILER is None:
+        yield
+    else:
+        with PROFILER.profile(name):
+            yield
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent, rate-limited and cached address -> SuperRare username lookups
+
+NameResolver answers from a sqlite cache of address -> (name, followers,
+fetched_at) and only fetches the addresses that are missing or older than
+the TTL. Fetches run on a bounded worker pool behind a token bucket, so
+the site sees at most `rate` requests per second whatever the pool size.
+
+The fetcher is pluggable, any callable address -> (name, followers):
+
+- HTTPProfileFetcher: requests + BeautifulSoup on the profile page
+- BrowserFetcher: headless Chrome through selenium, one browser per worker
+- StubFetcher: answers from a dict, for running offline
+
+    resolver = NameResolver(BrowserFetcher(), "superrare_names.sqlite")
+    df_address_usernames = resolver.resolve(addresses)
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+
+profile_url = "https://superrare.com/{}"
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    Parameters
+    ----------
+    rate : float
+        tokens added per second.
+    capacity : float
+        most tokens held, i.e. the largest burst.
+    """
+
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, waiting until there is one"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated)*self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens)/self.rate
+            time.sleep(wait)
+
+class HTTPProfileFetcher:
+    """Username and followers from the server-rendered profile page"""
+
+    def __init__(self, url=profile_url, timeout=20):
+        self.url = url
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self, address):
+        from bs4 import BeautifulSoup
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        response = session.get(self.url.format(address), timeout=self.timeout)
+        response.raise_for_status()
+        soup = BeautifulSoup(response.text, "html.parser")
+        title = soup.find("meta", {"property": "og:title"})
+        if title is None or not title.get("content"):
+            raise ValueError("No profile for {}".format(address))
+        followers = re.search(r"Followers:?\s*([\d,]+)", soup.get_text(" "))
+        return title["content"].strip(), int(followers.group(1).replace(",", "")) if followers else np.nan
+
+class BrowserFetcher:
+    """
+    Username and followers from the rendered profile page, headless Chrome
+
+    Parameters
+    ----------
+    chromedriver_path : str, optional
+        CHROMEDRIVER_PATH from the environment, or chromedriver on PATH.
+    wait : float
+        seconds for the page to render.
+    """
+
+    def __init__(self, chromedriver_path=None, wait=1.0, url=profile_url):
+        self.chromedriver_path = chromedriver_path or os.environ.get("CHROMEDRIVER_PATH")
+        self.wait = wait
+        self.url = url
+        self._local = threading.local()
+        self._browsers = []
+        self._lock = threading.Lock()
+
+    def _browser(self):
+        browser = getattr(self._local, "browser", None)
+        if browser is None:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+            opts = Options()
+            opts.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36")
+            opts.add_argument("--headless")
+            if self.chromedriver_path:
+                browser = webdriver.Chrome(executable_path=self.chromedriver_path, chrome_options=opts)
+            else:
+                browser = webdriver.Chrome(chrome_options=opts)
+            self._local.browser = browser
+            with self._lock:
+                self._browsers.append(browser)
+        return browser
+
+    def __call__(self, address):
+        browser = self._browser()
+        browser.get(self.url.format(address))
+        time.sleep(self.wait)
+        username = browser.find_element_by_xpath('//*[@id="root"]/div/div/div[3]/div/div[2]/div/span').text
+        followers = browser.find_element_by_xpath('//*[@id="root"]/div/div/div[3]/div/div[1]/div[2]/p[1]').text
+        return username, int(followers.replace("Followers: ", ""))
+
+    def close(self):
+        with self._lock:
+            for browser in self._browsers:
+                browser.quit()
+            self._browsers = []
+
+class StubFetcher:
+    """
+    Answers from a dict address -> (name, followers); unknown addresses fail
+
+    calls counts fetches, to check what the cache saved.
+    """
+
+    def __init__(self, profiles, latency=0.0):
+        self.profiles = {k.lower(): v for k, v in profiles.items()}
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, address):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if address.lower() not in self.profiles:
+            raise KeyError(address)
+        return self.profiles[address.lower()]
+
+class NameResolver:
+    """
+    Parameters
+    ----------
+    fetcher : callable
+        address -> (name, followers), raising if the profile can't be read.
+    cache_path : str
+        sqlite file, created if missing.
+    ttl : float
+        seconds a cached profile stays fresh, a week by default.
+    max_workers : int
+        fetches in flight at once.
+    rate : float
+        fetches started per second, across all workers.
+    burst : float
+        fetches that may start at once after an idle period.
+    """
+
+    def __init__(self, fetcher, cache_path="superrare_names.sqlite", ttl=7*24*3600, max_workers=4, rate=2.0, burst=4):
+        self.fetcher = fetcher
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self.bucket = TokenBucket(rate, burst)
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS names (address TEXT PRIMARY KEY, name TEXT, followers REAL, fetched_at REAL NOT NULL)")
+        self._db.commit()
+        self.cache_hits = 0
+        self.fetched = 0
+        self.failed = 0
+
+    def cached(self, addresses):
+        """Cached (name, followers, fetched_at) of addresses, stale ones included"""
+        found = {}
+        for i in range(0, len(addresses), 500):
+            chunk = addresses[i:i + 500]
+            rows = self._db.execute("SELECT address, name, followers, fetched_at FROM names WHERE address IN ({})".format(",".join("?"*len(chunk))), chunk)
+            for address, name, followers, fetched_at in rows:
+                found[address] = (name, np.nan if followers is None else followers, fetched_at)
+        return found
+
+    def _fetch(self, address):
+        self.bucket.acquire()
+        try:
+            name, followers = self.fetcher(address)
+        except Exception:
+            return address, None
+        return address, (name, followers, time.time())
+
+    def resolve(self, addresses, refresh=False):
+        """
+        Username and followers of addresses
+
+        Parameters
+        ----------
+        addresses : iterable of str
+        refresh : bool
+            fetch every address, even the fresh ones.
+
+        Returns
+        -------
+        DataFrame indexed by address with Username and Followers, as
+        get_superrare_account_name. Addresses that couldn't be read have
+        their address as Username and NaN Followers, and are tried again
+        next time.
+        """
+        #Cached under the lowercase address, returned under the address given
+        addresses = list(dict.fromkeys(addresses))
+        keys = [x.lower() for x in addresses]
+        profiles = self.cached(list(set(keys)))
+        now = time.time()
+        todo = [x for x in dict.fromkeys(keys) if refresh or x not in profiles or now - profiles[x][2] > self.ttl]
+        self.cache_hits += len(set(keys)) - len(todo)
+
+        fetched = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for address, profile in pool.map(self._fetch, todo):
+                if profile is None:
+                    self.failed += 1
+                    continue
+                profiles[address] = profile
+                fetched.append((address, profile[0], None if pd.isnull(profile[1]) else float(profile[1]), profile[2]))
+        if fetched:
+            self._db.executemany("INSERT OR REPLACE INTO names VALUES (?, ?, ?, ?)", fetched)
+            self._db.commit()
+        self.fetched += len(fetched)
+
+        names = [profiles[k][0] if k in profiles else x for x, k in zip(addresses, keys)]
+        followers = [profiles[k][1] if k in profiles else np.nan for k in keys]
+        return pd.DataFrame({"Username": names, "Followers": followers}, index=pd.Index(addresses))
+
+    def stats(self):
+        return {"cache_hits": self.cache_hits, "fetched": self.fetched, "failed": self.failed}
+
+    def close(self):
+        self._db.close()
+        if hasattr(self.fetcher, "close"):
+            self.fetcher.close()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Loading and cleaning of the artist/collector pairs table used by the viewer
+"""
+
+import hashlib
+
+import pandas as pd
+import numpy as np
+
+from node_index import NodeIndex
+from graph_engine import CSRGraph
+
+url_github_SR_data = "https://github.com/kylejwaters/SuperRare-Network/blob/main/superrare%20top%20artists%20and%20collectors_2021-08-29.csv?raw=True"
+
+def clean_collector_artist_pairs(df_collector_artist_pairs):
+    """
+    Clean usernames in the artist/collector pairs table
+
+    Parameters
+    ----------
+    df_collector_artist_pairs : pandas dataframe
+        one row per token with ArtistName, CollectorName, ArtistFollowers
+        and CollectorFollowers columns.
+
+    Returns
+    -------
+    df_collector_artist_pairs : pandas dataframe
+        same table with "@" stripped and unresolved (address) collector
+        names shortened to 0x123...abcde.
+
+    """
+    df_collector_artist_pairs["ArtistName"]=df_collector_artist_pairs["ArtistName"].str.replace("@","")
+    df_collector_artist_pairs["CollectorName"]=df_collector_artist_pairs["CollectorName"].str.replace("@","")
+    long_name = df_collector_artist_pairs["CollectorName"].str.len() > 40
+    df_collector_artist_pairs["CollectorName"] = np.where(long_name,df_collector_artist_pairs["CollectorName"].str[:5]+"..."+df_collector_artist_pairs["CollectorName"].str[-5:],df_collector_artist_pairs["CollectorName"])
+
+    return df_collector_artist_pairs
+
+def get_pairs(df_collector_artist_pairs):
+    """
+    Unique artist -> collector edges, without self-collected tokens
+
+    Returns
+    -------
+    df_pairs : pandas dataframe
+        From is artist, To is collector.
+
+    """
+    df_pairs = pd.DataFrame()
+    df_pairs["From"] = df_collector_artist_pairs["ArtistName"]
+    df_pairs["To"] = df_collector_artist_pairs["CollectorName"]
+
+    #Remove duplicates
+    df_pairs.drop_duplicates(inplace=True)
+    #Remove cases where the artist is connected to him/herself
+    df_pairs = df_pairs[df_pairs.From != df_pairs.To].copy()
+
+    return df_pairs
+
+def load_collector_artist_pairs(path):
+    """Read a pairs csv (local path or url) and clean the usernames"""
+    df_collector_artist_pairs = pd.read_csv(path)
+
+    return clean_collector_artist_pairs(df_collector_artist_pairs)
+
+def load_network(path):
+    """
+    Load a pairs csv and build the node index and graph over it
+
+    Returns
+    -------
+    df_collector_artist_pairs : cleaned pairs dataframe
+    node_index : NodeIndex
+    graph : CSRGraph
+        undirected artist/collector graph over the node index IDs.
+
+    """
+    df_collector_artist_pairs = load_collector_artist_pairs(path)
+    df_pairs = get_pairs(df_collector_artist_pairs)
+    node_index = NodeIndex.from_pairs(df_collector_artist_pairs)
+    graph = CSRGraph.from_edges(node_index.encode(df_pairs["From"]), node_index.encode(df_pairs["To"]), len(node_index))
+
+    return df_collector_artist_pairs, node_index, graph
+
+def dataset_fingerprint(node_index, graph):
+    """Short hash identifying a dataset: its node names and edges"""
+    h = hashlib.sha1()
+    h.update("\n".join(node_index.names.astype(str)).encode("utf-8"))
+    h.update(graph.indptr.tobytes())
+    h.update(graph.indices.tobytes())
+    return h.hexdigest()[:12]
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Array-backed node attribute store for the SuperRare network viewer
+
+Every username in the pairs table gets an integer node ID. Attributes are
+kept in numpy arrays indexed by that ID so a whole ego network can be
+coloured and labelled with one fancy-indexing gather instead of scanning
+the pairs table once per neighbour.
+"""
+
+import numpy as np
+import pandas as pd
+
+ROLE_ARTIST = 1
+ROLE_COLLECTOR = 2
+ROLE_BOTH = ROLE_ARTIST | ROLE_COLLECTOR
+
+ROLE_NAMES = {0: "", ROLE_ARTIST: "Artist", ROLE_COLLECTOR: "Collector", ROLE_BOTH: "Artist & Collector"}
+
+def _first_value(codes, values, n_nodes):
+    """Value of the first row of each code. NaN for codes with no rows"""
+    out = np.full(n_nodes, np.nan)
+    uniq, first = np.unique(codes, return_index=True)
+    out[uniq] = values[first]
+    return out
+
+class NodeIndex:
+    """
+    Node attributes keyed by integer node ID
+
+    Attributes
+    ----------
+    names : ndarray of object
+        username (display label) of each node.
+    followers : ndarray of int64
+        SuperRare follower count, 0 if unknown.
+    roles : ndarray of int8
+        ROLE_ARTIST / ROLE_COLLECTOR bit flags.
+    tokens_created, tokens_collected : ndarray of int32
+        number of tokens in the pairs table created / currently owned.
+    hover : ndarray of object
+        precomputed hover text, "name Followers:n".
+    """
+
+    def __init__(self, names, followers, roles, tokens_created, tokens_collected):
+        self.names = np.asarray(names, dtype=object)
+        self.followers = np.asarray(followers, dtype=np.int64)
+        self.roles = np.asarray(roles, dtype=np.int8)
+        self.tokens_created = np.asarray(tokens_created, dtype=np.int32)
+        self.tokens_collected = np.asarray(tokens_collected, dtype=np.int32)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        self._lookup = pd.Index(self.names)
+        self.hover = np.array(["{} Followers:{}".format(x, f) for x, f in zip(self.names, self.followers)], dtype=object)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    @classmethod
+    def from_codes(cls, names, artist_codes, collector_codes, artist_followers, collector_followers):
+        """
+        Build the index from a dictionary-encoded pairs table
+
+        Parameters
+        ----------
+        names : array of str
+            node dictionary, position is the node ID.
+        artist_codes, collector_codes : array of int
+            node ID of the artist / collector of each row.
+        artist_followers, collector_followers : array of float
+            follower counts per row, NaN if unknown.
+
+        Follower count is taken from the node's first row as an artist and,
+        if that is missing, its first row as a collector (same rule the
+        viewer has always used).
+        """
+        n_nodes = len(names)
+        artist_codes = np.asarray(artist_codes)
+        collector_codes = np.asarray(collector_codes)
+
+        artist_followers = np.asarray(artist_followers, dtype=float)
+        collector_followers = np.asarray(collector_followers, dtype=float)
+        #Rows with a missing name are encoded as -1
+        has_artist = artist_codes >= 0
+        has_collector = collector_codes >= 0
+
+        followers = _first_value(artist_codes[has_artist], artist_followers[has_artist], n_nodes)
+        as_collector = _first_value(collector_codes[has_collector], collector_followers[has_collector], n_nodes)
+        followers = np.where(np.isnan(followers), as_collector, followers)
+        followers = np.nan_to_num(followers).astype(np.int64)
+
+        tokens_created = np.bincount(artist_codes[has_artist], minlength=n_nodes)
+        tokens_collected = np.bincount(collector_codes[has_collector], minlength=n_nodes)
+        roles = np.where(tokens_created > 0, ROLE_ARTIST, 0) | np.where(tokens_collected > 0, ROLE_COLLECTOR, 0)
+
+        return cls(names, followers, roles, tokens_created, tokens_collected)
+
+    @classmethod
+    def from_pairs(cls, df_collector_artist_pairs):
+        """Build the index from a cleaned pairs dataframe"""
+        artist = df_collector_artist_pairs["ArtistName"]
+        collector = df_collector_artist_pairs["CollectorName"]
+        codes, names = pd.factorize(pd.concat([artist, collector], ignore_index=True))
+        n_rows = len(df_collector_artist_pairs)
+
+        return cls.from_codes(np.asarray(names, dtype=object),
+                              codes[:n_rows], codes[n_rows:],
+                              df_collector_artist_pairs["ArtistFollowers"].values,
+                              df_collector_artist_pairs["CollectorFollowers"].values)
+
+    def node_id(self, name):
+        """Node ID of a username, None if it is not in the dataset"""
+        return self.ids.get(name)
+
+    def encode(self, names):
+        """Node IDs for an array of usernames, -1 for unknown names (which gather rejects)"""
+        return self._lookup.get_indexer(list(names)).astype(np.int32)
+
+    def gather(self, node_ids):
+        """
+        Attributes for many nodes at once
+
+        Returns
+        -------
+        dict of arrays
+            names, followers, roles, tokens_created, tokens_collected and
+            hover, each aligned with node_ids.
+
+        Raises
+        ------
+        IndexError
+            for negative IDs, e.g. the -1 encode gives unknown names,
+            which would otherwise silently select the last node.
+        """
+        node_ids = np.asarray(node_ids, dtype=np.intp)
+        if node_ids.size and node_ids.min() < 0:
+            raise IndexError("Unknown node IDs: {} negative".format(int((node_ids < 0).sum())))
+        return {"names": self.names[node_ids],
+                "followers": self.followers[node_ids],
+                "roles": self.roles[node_ids],
+                "tokens_created": self.tokens_created[node_ids],
+                "tokens_collected": self.tokens_collected[node_ids],
+                "hover": self.hover[node_ids]}
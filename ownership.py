@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental ERC-721 ownership state
+
+OwnershipEngine keeps one row per token (contract, token ID) in parallel
+arrays: creator, current owner, the position (block, transaction index,
+log index) of the earliest and latest transfer seen, and whether the
+token is burned. Addresses are interned to int codes in an
+address_book.AddressBook, shared with the rest of the pipeline when one
+is given (transfer frames may then already carry codes). A batch of
+transfers is applied in O(batch log batch): it is sorted once, its first
+and last transfer per token are compared with the stored ones, and only
+tokens where the batch is earlier or later are updated. Batches can come
+in any order, e.g. a backfill after a tail sync.
+
+sync_engine keeps the state in a file between runs (next to the event
+store in the pipeline) and applies only the transfers after the saved
+position, replaying the whole table when the history below it changed.
+
+The creator of a token is the recipient of its earliest transfer when
+that transfer is a mint (from the zero address), as in
+get_creator_owners.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from address_book import AddressBook
+
+MINTING_ADDRESS = "0x0000000000000000000000000000000000000000"
+BURN_ADDRESS = "0x000000000000000000000000000000000000dead"
+#Position of a transfer as one sortable int64: block | transaction index | log index
+_TX_BITS = 16
+_LOG_BITS = 16
+
+def transfer_position(block_number, transaction_index, log_index=None):
+    """Sortable int64 position of transfers in the chain"""
+    position = (np.asarray(block_number, dtype=np.int64) << (_TX_BITS + _LOG_BITS)) | (np.asarray(transaction_index, dtype=np.int64) << _LOG_BITS)
+    if log_index is not None:
+        position |= np.asarray(log_index, dtype=np.int64)
+    return position
+
+class OwnershipEngine:
+    """
+    Parameters
+    ----------
+    capacity : int
+        tokens preallocated, arrays grow by doubling.
+    book : AddressBook, optional
+        address codes, a new book by default.
+    """
+
+    def __init__(self, capacity=1024, book=None):
+        self.book = book if book is not None else AddressBook()
+        self._token_slots = {}
+        self.n_tokens = 0
+        self.contract = np.zeros(capacity, dtype=np.int32)
+        self.token_id = np.zeros(capacity, dtype=object)
+        self.creator = np.full(capacity, -1, dtype=np.int32)
+        self.owner = np.full(capacity, -1, dtype=np.int32)
+        self.first_position = np.full(capacity, np.iinfo(np.int64).max, dtype=np.int64)
+        self.last_position = np.full(capacity, -1, dtype=np.int64)
+        self.burned = np.zeros(capacity, dtype=bool)
+        self.n_transfers = 0
+        #Latest position applied, see sync_engine
+        self.position = -1
+
+    def _grow(self, needed):
+        capacity = len(self.owner)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        extra = capacity - len(self.owner)
+        self.contract = np.concatenate([self.contract, np.zeros(extra, dtype=np.int32)])
+        self.token_id = np.concatenate([self.token_id, np.zeros(extra, dtype=object)])
+        self.creator = np.concatenate([self.creator, np.full(extra, -1, dtype=np.int32)])
+        self.owner = np.concatenate([self.owner, np.full(extra, -1, dtype=np.int32)])
+        self.first_position = np.concatenate([self.first_position, np.full(extra, np.iinfo(np.int64).max, dtype=np.int64)])
+        self.last_position = np.concatenate([self.last_position, np.full(extra, -1, dtype=np.int64)])
+        self.burned = np.concatenate([self.burned, np.zeros(extra, dtype=bool)])
+
+    def _intern(self, values):
+        """Address codes of an array of addresses (or codes), adding new ones"""
+        return self.book.intern(values)
+
+    def _slots(self, contracts, token_ids):
+        """Token slots of (contract code, token ID) pairs, adding new tokens"""
+        token_codes, token_uniques = pd.factorize(token_ids)
+        contract_codes, contract_uniques = pd.factorize(contracts)
+        codes, pairs = pd.factorize(contract_codes.astype(np.int64)*len(token_uniques) + token_codes)
+        keys = zip(contract_uniques[pairs//len(token_uniques)].tolist(), token_uniques[pairs % len(token_uniques)].tolist())
+        mapping = np.empty(len(pairs), dtype=np.int64)
+        new = []
+        for i, key in enumerate(keys):
+            slot = self._token_slots.get(key)
+            if slot is None:
+                slot = self._token_slots[key] = self.n_tokens + len(new)
+                new.append(key)
+            mapping[i] = slot
+        if new:
+            self._grow(self.n_tokens + len(new))
+            first = self.n_tokens
+            self.contract[first:first + len(new)] = [x[0] for x in new]
+            self.token_id[first:first + len(new)] = [x[1] for x in new]
+            self.n_tokens += len(new)
+        return mapping[codes]
+
+    def apply(self, df_transfers):
+        """
+        Apply a batch of transfers
+
+        Parameters
+        ----------
+        df_transfers : DataFrame
+            from, to, tokenID, blockNumber, transactionIndex and optionally
+            logIndex and contract_address (tokens of different contracts
+            are kept apart). Addresses as strings or as book codes.
+        """
+        n = len(df_transfers)
+        if n == 0:
+            return
+        if "contract_address" in df_transfers:
+            contracts = self._intern(df_transfers["contract_address"].values)
+        else:
+            contracts = np.full(n, -1, dtype=np.int32)
+        slots = self._slots(contracts, df_transfers["tokenID"].values)
+        sender = self._intern(df_transfers["from"].values)
+        recipient = self._intern(df_transfers["to"].values)
+        position = transfer_position(df_transfers["blockNumber"].values,
+                                     df_transfers["transactionIndex"].values,
+                                     df_transfers["logIndex"].values if "logIndex" in df_transfers else None)
+
+        #Batch order by token then position, rows of equal position keep their order
+        order = np.lexsort((position, slots))
+        slots, position, sender, recipient = slots[order], position[order], sender[order], recipient[order]
+        starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+        ends = np.r_[starts[1:], n] - 1
+        tokens = slots[starts]
+
+        #Earliest transfer of the token so far: decides the creator
+        earlier = position[starts] < self.first_position[tokens]
+        first = starts[earlier]
+        updated = tokens[earlier]
+        self.first_position[updated] = position[first]
+        minting = self.book.code(MINTING_ADDRESS)
+        self.creator[updated] = np.where((sender[first] == minting) & (minting >= 0), recipient[first], -1)
+
+        #Latest transfer so far: decides the owner
+        later = position[ends] >= self.last_position[tokens]
+        last = ends[later]
+        updated = tokens[later]
+        self.last_position[updated] = position[last]
+        self.owner[updated] = recipient[last]
+        burn = [c for c in (self.book.code(BURN_ADDRESS), minting) if c >= 0]
+        self.burned[updated] = np.isin(recipient[last], burn)
+        self.n_transfers += n
+        self.position = max(self.position, int(position.max()))
+
+    def creator_owners(self, contract_addresses, other_addresses=None, codes=False):
+        """
+        Creator/current owner pairs and tokens per owner, as get_creator_owners
+
+        Addresses come out as lowercase 0x strings, or as book codes (-1
+        for a token without creator) with codes=True.
+
+        Returns
+        -------
+        numtokensby_address : Series
+            Number of tokens held by each eth address
+        df_creators_owners_noburn : DataFrame
+            Creator, CurrentOwner, tokenID and contract_address of every
+            token not burned and not held by the contracts or other_addresses
+            (one address or a list)
+        """
+        n = self.n_tokens
+        owner = self.owner[:n]
+        if isinstance(other_addresses, (str, int, np.integer)):
+            other_addresses = [other_addresses]
+        excluded = self.book.lookup(list(contract_addresses) + list(other_addresses or []))
+        keep = ~self.burned[:n] & ~np.isin(owner, excluded[excluded >= 0])
+        addresses = (lambda x: x) if codes else self.book.hex
+
+        token_id = self.token_id[:n][keep]
+        df_creators_owners_noburn = pd.DataFrame({"Creator": addresses(self.creator[:n][keep]),
+                                                  "CurrentOwner": addresses(owner[keep]),
+                                                  "tokenID": token_id,
+                                                  "contract_address": addresses(self.contract[:n][keep])},
+                                                 index=pd.Index(token_id, name="tokenID"))
+        numtokensby_address = df_creators_owners_noburn.groupby("CurrentOwner").tokenID.count()
+
+        return numtokensby_address, df_creators_owners_noburn
+
+    def save(self, path):
+        """Write the state to an .npz file"""
+        n = self.n_tokens
+        tmp = path + ".tmp.npz"
+        np.savez(tmp,
+                 addresses=self.book.raw[:len(self.book)],
+                 contract=self.contract[:n],
+                 token_id=self.token_id[:n].astype(str),
+                 creator=self.creator[:n],
+                 owner=self.owner[:n],
+                 first_position=self.first_position[:n],
+                 last_position=self.last_position[:n],
+                 burned=self.burned[:n],
+                 n_transfers=np.int64(self.n_transfers),
+                 position=np.int64(self.position))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, book=None):
+        """
+        Engine saved with save
+
+        With a book, the saved addresses are interned in it and the state
+        comes back in its codes; otherwise the engine gets its own book.
+        """
+        with np.load(path) as data:
+            n = len(data["owner"])
+            if book is None:
+                book = AddressBook.from_raw(data["addresses"])
+                codes = np.append(np.arange(len(data["addresses"]), dtype=np.int32), np.int32(-1))
+            else:
+                codes = book.intern(np.array([x.tobytes() for x in data["addresses"]] + [None], dtype=object))
+            engine = cls(capacity=max(n, 1), book=book)
+            #codes[-1] is -1: no creator, no contract column
+            engine.contract[:n] = codes[data["contract"]]
+            engine.token_id[:n] = [int(x) for x in data["token_id"]]
+            engine.creator[:n] = codes[data["creator"]]
+            engine.owner[:n] = codes[data["owner"]]
+            engine.first_position[:n] = data["first_position"]
+            engine.last_position[:n] = data["last_position"]
+            engine.burned[:n] = data["burned"]
+            engine.n_transfers = int(data["n_transfers"])
+            engine.position = int(data["position"]) if "position" in data else -1
+        engine.n_tokens = n
+        engine._token_slots = {(int(c), t): i for i, (c, t) in enumerate(zip(engine.contract[:n], engine.token_id[:n]))}
+
+        return engine
+
+def sync_engine(path, df_transfers, book=None):
+    """
+    Engine saved at path brought up to date with a transfer table, saved back
+
+    Only the transfers after the saved position are applied. If the table
+    has not exactly the n_transfers transfers the engine applied up to that
+    position (a backfill, a reorg, another set of contracts), it is
+    replayed whole into a new engine instead.
+
+    Parameters
+    ----------
+    path : str
+        .npz state, created on the first run.
+    df_transfers : DataFrame
+        the full transfer history, as for OwnershipEngine.apply.
+    book : AddressBook, optional
+        codes of the table's addresses, and of the engine's.
+    """
+    position = transfer_position(df_transfers["blockNumber"].values,
+                                 df_transfers["transactionIndex"].values,
+                                 df_transfers["logIndex"].values if "logIndex" in df_transfers else None)
+    engine = None
+    if os.path.exists(path):
+        engine = OwnershipEngine.load(path, book)
+        applied = position <= engine.position
+        if applied.sum() != engine.n_transfers:
+            engine = None
+    if engine is None:
+        engine = OwnershipEngine(book=book)
+        applied = np.zeros(len(df_transfers), dtype=bool)
+    engine.apply(df_transfers[~applied])
+    engine.save(path)
+
+    return engine
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Point-in-time token ownership from the transfer log
+
+OwnershipHistory keeps every ownership run (token, start block, owner)
+sorted by token then chain position, with the runs of one token
+contiguous. Each run is also encoded as one int64 key, token slot << 32 |
+start block (or start time), so the owner of any number of tokens at a
+block or date is a single searchsorted over the keys: the last run of the
+token starting at or before the query.
+
+    history = OwnershipHistory(df_transfers)
+    history.owner_at(contract, token_id, 9000000)
+    history.tokens_held_by("0xabc...", 9000000)
+    numtokens, pairs = history.creator_owners("2021-02-20", contract_addresses, auction_address)
+
+Dates need a blocktime column in the transfers (query_SR_data.add_block_times).
+"""
+
+import numpy as np
+import pandas as pd
+
+from address_book import AddressBook
+from ownership import MINTING_ADDRESS, BURN_ADDRESS, transfer_position
+
+_EPOCH = pd.Timestamp(0, tz="UTC")
+
+def _seconds(at):
+    """Unix seconds of a date string, datetime or Timestamp (naive means UTC)"""
+    ts = pd.Timestamp(at)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return int((ts - _EPOCH)//pd.Timedelta(seconds=1))
+
+class OwnershipHistory:
+    """
+    Parameters
+    ----------
+    df_transfers : DataFrame
+        from, to, tokenID, blockNumber, transactionIndex and optionally
+        logIndex, contract_address and blocktime. Addresses as strings or
+        as book codes.
+    book : AddressBook, optional
+        address codes, a new book by default.
+    """
+
+    def __init__(self, df_transfers, book=None):
+        self.book = book if book is not None else AddressBook()
+        n = len(df_transfers)
+        if "contract_address" in df_transfers:
+            contracts = self.book.intern(df_transfers["contract_address"].values)
+        else:
+            contracts = np.full(n, -1, dtype=np.int32)
+        sender = self.book.intern(df_transfers["from"].values)
+        recipient = self.book.intern(df_transfers["to"].values)
+
+        #Token slots, in (contract, token ID) order
+        keys = pd.MultiIndex.from_arrays([contracts, df_transfers["tokenID"].values])
+        slots, token_keys = pd.factorize(keys, sort=True)
+        self.contract = np.asarray(token_keys.get_level_values(0), dtype=np.int32)
+        self.token_id = np.asarray(token_keys.get_level_values(1))
+        self._token_slots = {key: i for i, key in enumerate(zip(self.contract.tolist(), self.token_id.tolist()))}
+        self.n_tokens = len(token_keys)
+
+        position = transfer_position(df_transfers["blockNumber"].values,
+                                     df_transfers["transactionIndex"].values,
+                                     df_transfers["logIndex"].values if "logIndex" in df_transfers else None)
+        order = np.lexsort((position, slots))
+        self.run_token = slots[order].astype(np.int64)
+        self.run_block = df_transfers["blockNumber"].values[order].astype(np.int64)
+        self.run_owner = recipient[order]
+        self.block_keys = (self.run_token << 32) | self.run_block
+        self.time_keys = None
+        if "blocktime" in df_transfers:
+            times = pd.to_datetime(df_transfers["blocktime"].values[order], utc=True)
+            seconds = np.asarray((times - _EPOCH)//pd.Timedelta(seconds=1), dtype=np.int64)
+            self.time_keys = (self.run_token << 32) | seconds
+
+        #Creator: recipient of the first transfer if it is a mint
+        first = np.flatnonzero(np.r_[True, self.run_token[1:] != self.run_token[:-1]])
+        minting = self.book.code(MINTING_ADDRESS)
+        self.creator = np.where((sender[order][first] == minting) & (minting >= 0), self.run_owner[first], -1).astype(np.int32)
+        self.n_runs = n
+
+    def _keys(self, at):
+        """Sorted run keys and query value for a block number or a date"""
+        if isinstance(at, (int, np.integer)):
+            return self.block_keys, int(at)
+        if self.time_keys is None:
+            raise ValueError("Dates need a blocktime column in the transfers, see query_SR_data.add_block_times")
+        return self.time_keys, _seconds(at)
+
+    def _owners(self, slots, at):
+        """Owner codes of token slots at a block or date, -1 if not minted yet"""
+        keys, value = self._keys(at)
+        slots = np.asarray(slots, dtype=np.int64)
+        run = np.searchsorted(keys, (slots << 32) | value, side="right") - 1
+        exists = run >= 0
+        exists[exists] = self.run_token[run[exists]] == slots[exists]
+        return np.where(exists, self.run_owner[np.maximum(run, 0)], -1)
+
+    def owner_at(self, contract, token_id, at):
+        """
+        Owner of one token after a block (int) or at a date
+
+        Returns
+        -------
+        str, or None if the token didn't exist yet
+        """
+        slot = self._token_slots.get((-1 if contract is None else self.book.code(contract), token_id))
+        if slot is None:
+            return None
+        code = self._owners([slot], at)[0]
+        return None if code < 0 else self.book.hex([code])[0]
+
+    def owners_at(self, at):
+        """Owner address of every token (self.contract, self.token_id order), NaN if not minted yet"""
+        return self.book.hex(self._owners(np.arange(self.n_tokens), at))
+
+    def tokens_held_by(self, address, at):
+        """
+        Tokens an address held after a block (int) or at a date
+
+        Returns
+        -------
+        DataFrame with contract_address and tokenID
+        """
+        code = self.book.code(address)
+        held = (self._owners(np.arange(self.n_tokens), at) == code) & (code >= 0)
+        return pd.DataFrame({"contract_address": self.book.hex(self.contract[held]), "tokenID": self.token_id[held]})
+
+    def creator_owners(self, at, contract_addresses, other_addresses=None, codes=False):
+        """
+        Creator/owner pairs and tokens per owner as of a block (int) or date,
+        in the form of get_creator_owners (book codes with codes=True)
+
+        Returns
+        -------
+        numtokensby_address : Series
+        df_creators_owners_noburn : DataFrame
+        """
+        owner = self._owners(np.arange(self.n_tokens), at)
+        if isinstance(other_addresses, (str, int, np.integer)):
+            other_addresses = [other_addresses]
+        excluded = self.book.lookup(list(contract_addresses) + list(other_addresses or []) + [BURN_ADDRESS, MINTING_ADDRESS])
+        keep = (owner >= 0) & ~np.isin(owner, excluded[excluded >= 0])
+        addresses = (lambda x: x) if codes else self.book.hex
+
+        token_id = self.token_id[keep]
+        df_creators_owners_noburn = pd.DataFrame({"Creator": addresses(self.creator[keep]),
+                                                  "CurrentOwner": addresses(owner[keep]),
+                                                  "tokenID": token_id,
+                                                  "contract_address": addresses(self.contract[keep])},
+                                                 index=pd.Index(token_id, name="tokenID"))
+        numtokensby_address = df_creators_owners_noburn.groupby("CurrentOwner").tokenID.count()
+
+        return numtokensby_address, df_creators_owners_noburn
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Staged pipeline with cached artifacts
+
+A Pipeline is a list of named Stages, each a function of the artifacts of
+the stages it depends on and of its parameters. The output of every stage
+is pickled to the cache directory under a key hashing the stage name, its
+version, its parameters and the content hash of every input artifact. A
+stage whose key has an artifact already is skipped and its artifact read
+back only if a stage that runs needs it, so a failure late in the run
+(e.g. scraping) keeps all the work before it.
+
+Volatile stages read the outside world (the chain) and always run; their
+artifact is still hashed, so the stages after them are skipped when it
+came out the same. Stages whose inputs are ready run in parallel, each
+timed in metrics.REGISTRY (sr_stage_seconds) and labelling the RPC calls
+it makes, which the report shows per stage.
+
+    pipeline = Pipeline([Stage("a", load), Stage("b", build, inputs=["a"], params={"n": 3})])
+    artifacts = pipeline.run(context)
+    pipeline.print_report()
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+import metrics
+
+def _rows(artifact):
+    """Row count of an artifact for the report, None if it has none"""
+    if isinstance(artifact, pd.DataFrame):
+        return len(artifact)
+    if isinstance(artifact, dict) and "rows" in artifact:
+        return artifact["rows"]
+    if isinstance(artifact, tuple) and artifact:
+        return _rows(artifact[-1])
+    return None
+
+def _rpc_usage(name):
+    """RPC calls and seconds of a stage so far"""
+    return (metrics.REGISTRY.total("sr_rpc_calls_total", stage=name),
+            metrics.REGISTRY.summary("sr_rpc_seconds", stage=name)[1])
+
+class Stage:
+    """
+    Parameters
+    ----------
+    name : str
+    func : callable
+        func(context, *input artifacts, **params) -> artifact (picklable).
+    inputs : list of str
+        names of the stages whose artifacts func takes, in order.
+    params : dict, optional
+        keyword arguments of func, JSON-serializable, part of the key.
+    volatile : bool
+        run every time, for stages reading outside data.
+    version : int
+        bump to invalidate cached artifacts when func changes.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, volatile=False, version=1):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.volatile = volatile
+        self.version = version
+
+    def key(self, input_hashes):
+        """Cache key of the stage given the content hashes of its inputs"""
+        spec = json.dumps({"name": self.name, "version": self.version, "params": self.params,
+                           "inputs": input_hashes}, sort_keys=True, default=str)
+        return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:16]
+
+class Pipeline:
+    """
+    Parameters
+    ----------
+    stages : list of Stage
+        in any order, inputs must name stages of the list.
+    cache_dir : str
+        artifacts and their manifests, created if missing.
+    max_workers : int
+        stages run at once.
+    """
+
+    def __init__(self, stages, cache_dir="pipeline_cache", max_workers=2):
+        self.stages = {s.name: s for s in stages}
+        for stage in stages:
+            for name in stage.inputs:
+                if name not in self.stages:
+                    raise ValueError("Stage {} needs unknown stage {}".format(stage.name, name))
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.report = []
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, name, key, ext):
+        return os.path.join(self.cache_dir, "{}-{}.{}".format(name, key, ext))
+
+    def _manifest(self, name, key):
+        path = self._path(name, key, "json")
+        if not os.path.exists(path) or not os.path.exists(self._path(name, key, "pkl")):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _store(self, name, key, artifact, seconds):
+        """Pickle an artifact, then its manifest: an artifact without manifest is ignored"""
+        blob = pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp = self._path(name, key, "pkl.tmp")
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, self._path(name, key, "pkl"))
+        manifest = {"stage": name, "key": key, "hash": hashlib.sha256(blob).hexdigest(),
+                    "rows": _rows(artifact), "seconds": seconds, "created": time.time()}
+        with open(self._path(name, key, "json"), "w") as f:
+            json.dump(manifest, f)
+        return manifest
+
+    def _load(self, name, key):
+        with open(self._path(name, key, "pkl"), "rb") as f:
+            return pickle.load(f)
+
+    def _needed(self, targets):
+        """Targets and everything they depend on"""
+        needed = set()
+        todo = list(targets)
+        while todo:
+            name = todo.pop()
+            if name not in needed:
+                needed.add(name)
+                todo.extend(self.stages[name].inputs)
+        return needed
+
+    def run(self, context=None, targets=None, force=()):
+        """
+        Run the stages not cached yet
+
+        Parameters
+        ----------
+        context : object
+            passed to every stage function, not part of any key (e.g. the
+            web3 connection).
+        targets : list of str, optional
+            stages wanted, with everything they depend on. All by default.
+        force : list of str
+            stages to run even if cached.
+
+        Returns
+        -------
+        dict
+            stage name -> artifact of the targets
+        """
+        targets = list(targets or self.stages)
+        unknown = (set(targets) | set(force)) - set(self.stages)
+        if unknown:
+            raise ValueError("Unknown stages: {}".format(", ".join(sorted(unknown))))
+        needed = self._needed(targets)
+        hashes, keys, artifacts = {}, {}, {}
+        self.report = []
+
+        def artifact(name):
+            if name not in artifacts:
+                artifacts[name] = self._load(name, keys[name])
+            return artifacts[name]
+
+        def execute(stage, key, inputs):
+            calls, rpc_time = _rpc_usage(stage.name)
+            t0 = time.perf_counter()
+            with metrics.stage(stage.name), metrics.REGISTRY.timer("sr_stage_seconds", stage=stage.name):
+                result = stage.func(context, *inputs, **stage.params)
+            seconds = time.perf_counter() - t0
+            calls_after, rpc_time_after = _rpc_usage(stage.name)
+            return result, self._store(stage.name, key, result, seconds), calls_after - calls, rpc_time_after - rpc_time
+
+        pending = set(needed)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                #Settle every stage whose inputs are hashed: skip it or start it
+                ready = True
+                while ready:
+                    ready = [x for x in sorted(pending) if all(y in hashes for y in self.stages[x].inputs)]
+                    for name in ready:
+                        stage = self.stages[name]
+                        pending.discard(name)
+                        key = keys[name] = stage.key([hashes[x] for x in stage.inputs])
+                        manifest = self._manifest(name, key)
+                        if manifest is not None and not stage.volatile and name not in force:
+                            hashes[name] = manifest["hash"]
+                            self.report.append({"stage": name, "status": "cached", "seconds": 0.0, "rows": manifest["rows"],
+                                                "rpc_calls": 0, "rpc_seconds": 0.0})
+                            continue
+                        inputs = [artifact(x) for x in stage.inputs]
+                        running[pool.submit(execute, stage, key, inputs)] = name
+                if not running:
+                    if pending:
+                        raise ValueError("Stages with unresolvable inputs: {}".format(", ".join(sorted(pending))))
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result, manifest, calls, rpc_time = future.result()
+                    artifacts[name] = result
+                    hashes[name] = manifest["hash"]
+                    self.report.append({"stage": name, "status": "ran", "seconds": manifest["seconds"], "rows": manifest["rows"],
+                                        "rpc_calls": calls, "rpc_seconds": rpc_time})
+
+        return {name: artifact(name) for name in targets}
+
+    def print_report(self):
+        print("{:<18}{:>8}{:>12}{:>12}{:>12}{:>12}".format("stage", "status", "time (s)", "rows", "rpc calls", "rpc (s)"))
+        for line in self.report:
+            print("{:<18}{:>8}{:>12.1f}{:>12}{:>12}{:>12.1f}".format(line["stage"], line["status"], line["seconds"],
+                                                                     "" if line["rows"] is None else line["rows"],
+                                                                     line["rpc_calls"], line["rpc_seconds"]))
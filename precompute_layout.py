@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Offline layout stage for the network viewer
+
+Computes one force-directed layout of the whole artist/collector graph and
+saves the coordinates of every node, so the app can cut ego networks out
+of it instead of laying them out per request. Re-run it whenever a new
+snapshot csv is published:
+
+    python precompute_layout.py [pairs csv or url] [layout_positions.npz]
+
+Nodes missing from the file (new users since the last run) fall back to an
+on-the-fly layout in the app.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from network_data import load_network, dataset_fingerprint, url_github_SR_data
+from layout import force_layout, save_positions
+
+default_layout_path = "layout_positions.npz"
+
+def precompute_layout(path=url_github_SR_data, out_path=default_layout_path, iterations=300, seed=0):
+    """
+    Lay out the full graph and save node positions
+
+    Parameters
+    ----------
+    path : str
+        pairs csv (local path or url).
+    out_path : str
+        .npz written with save_positions.
+    iterations : int
+        force layout iterations. There is no time budget offline.
+
+    Returns
+    -------
+    pos : ndarray, shape (n_nodes, 2)
+    """
+    t0 = time.perf_counter()
+    _, node_index, graph = load_network(path)
+    u, v = graph.induced_edges(np.arange(graph.n_nodes))
+    pos = force_layout(graph.n_nodes, u, v, seed=seed, iterations=iterations, time_budget=None)
+    save_positions(out_path, node_index.names, pos, dataset_fingerprint(node_index, graph))
+    print("Laid out {} nodes / {} edges in {:.1f}s -> {}".format(graph.n_nodes, graph.n_edges, time.perf_counter() - t0, out_path))
+
+    return pos
+
+if __name__ == '__main__':
+    precompute_layout(*sys.argv[1:3])
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Prefix index over node names for username autocomplete
+
+Names are lowercased and kept in one sorted array, so the names starting
+with a prefix are a contiguous range found with two binary searches.
+Matches are ranked by follower count, then degree.
+"""
+
+import numpy as np
+
+class PrefixIndex:
+    """
+    Parameters
+    ----------
+    names : array of str
+        node names, position is the node ID.
+    followers : array of int
+        primary ranking key, higher first.
+    degree : array of int, optional
+        tie-break ranking key, higher first.
+    """
+
+    def __init__(self, names, followers, degree=None):
+        names = np.asarray(names, dtype=object)
+        if degree is None:
+            degree = np.zeros(len(names), dtype=np.int64)
+        keys = np.array([str(x).lower() for x in names], dtype=object)
+        order = np.argsort(keys, kind="mergesort")
+        self.keys = keys[order]
+        self.node_ids = order.astype(np.int32)
+        self.names = names
+        #Rank of every node, 0 is the best match
+        by_score = np.lexsort((-np.asarray(degree), -np.asarray(followers)))
+        rank = np.empty(len(names), dtype=np.int64)
+        rank[by_score] = np.arange(len(names))
+        self.rank = rank
+
+    def _range(self, prefix):
+        prefix = prefix.lower()
+        lo = np.searchsorted(self.keys, prefix, side="left")
+        hi = np.searchsorted(self.keys, prefix + "\U0010ffff", side="left")
+        return lo, hi
+
+    def count(self, prefix):
+        """Number of names starting with prefix (case-insensitive)"""
+        lo, hi = self._range(prefix)
+        return int(hi - lo)
+
+    def suggest(self, prefix, limit=10):
+        """
+        Best-ranked names starting with prefix (case-insensitive)
+
+        Returns
+        -------
+        list of str
+            at most limit names, best first.
+        """
+        if not prefix or limit <= 0:
+            return []
+        lo, hi = self._range(prefix)
+        ids = self.node_ids[lo:hi]
+        if len(ids) > limit:
+            ids = ids[np.argpartition(self.rank[ids], limit)[:limit]]
+        ids = ids[np.argsort(self.rank[ids])]
+
+        return self.names[ids].tolist()
+
+    def lookup(self, name):
+        """
+        Node ID of the name matching case-insensitively, None if there is
+        no match or more than one
+        """
+        key = name.lower()
+        lo = np.searchsorted(self.keys, key, side="left")
+        hi = np.searchsorted(self.keys, key, side="right")
+        if hi - lo != 1:
+            return None
+        return int(self.node_ids[lo])
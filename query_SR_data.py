@@ -10,18 +10,26 @@ import numpy as np
 from datetime import datetime, timedelta, date, timezone
 import time
 from web3 import Web3
+from eth_utils import to_checksum_address
 import json 
 import requests
 import os
-from selenium import webdriver
-from selenium.webdriver import Chrome
-from selenium.webdriver.chrome.options import Options
+import argparse
 from bs4 import BeautifulSoup
-from tqdm import tqdm
+from log_fetcher import LogFetcher, find_deployment_block
+from transfer_decoder import decode_transfer_logs, TRANSFER_TOPIC_HEX
+from sale_decoders import decode_sale
+from ownership import OwnershipEngine, sync_engine
+from ownership_history import OwnershipHistory
+from name_resolver import NameResolver, BrowserFetcher
+from pipeline import Pipeline, Stage
+from contracts import get_contracts, excluded_addresses, platforms
+from ingest import sync_contracts, load_transfers
+from metrics import instrument_provider
 
 def connect_mainnet(PROJECTID):
     """Connect to Eth mainnet using infura"""     
-    w3 = Web3(Web3.HTTPProvider('https://mainnet.infura.io/v3/{}'.format(PROJECTID)))
+    w3 = Web3(instrument_provider(Web3.HTTPProvider('https://mainnet.infura.io/v3/{}'.format(PROJECTID))))
     return w3
 
 def get_transfer_events(w3, block_start, block_end, contract, token_contract_address, ABI):
@@ -71,16 +79,20 @@ def decode_event_logs(logs,w3):
     Returns Dictionary
     -------
     indexed by: txHash + tknid
-    with: From, to, tokenID, blockNumber, transactionIndex
+    with: From, to, tokenID, blockNumber, transactionIndex, logIndex
+    
+    The txHash + tknid key can collide and drop events, get_transfer_data
+    uses transfer_decoder.decode_transfer_logs instead
 
     """
     event_data = {}
+    transfer_topic = w3.sha3(text="Transfer(address,address,uint256)").hex()
     for i,event in enumerate(logs):    
         
         topic = Web3.toHex(event["topics"][0])
         
         #TRANSFERS
-        if topic == w3.sha3(text="Transfer(address,address,uint256)").hex():
+        if topic == transfer_topic:
         
             from_ = "0x" + Web3.toHex(event["topics"][1])[26:]
             to_   = "0x" + Web3.toHex(event["topics"][2])[26:]
@@ -94,7 +106,8 @@ def decode_event_logs(logs,w3):
             txhash = event["transactionHash"]
             blocknum = event["blockNumber"]
             transaction_index = event["transactionIndex"]    
-            event_data[Web3.toInt(txhash)+tknid] = {"txhash":txhash, "from":from_,"to":to_,"tokenID":tknid,'blockNumber':blocknum,'transactionIndex':transaction_index}
+            log_index = event["logIndex"]
+            event_data[Web3.toInt(txhash)+tknid] = {"txhash":txhash, "from":from_,"to":to_,"tokenID":tknid,'blockNumber':blocknum,'transactionIndex':transaction_index,'logIndex':log_index}
         
     return event_data
 
@@ -118,7 +131,52 @@ def get_block_time(w3, block_num):
     
     return blocktime
 
-def get_transfer_data(w3, token_contract_address, ABI, block_increment):
+def add_block_times(w3, df_transfers, index):
+    """
+    Add a UTC blocktime column to a transfers dataframe
+
+    Parameters
+    ----------
+    df_transfers : pandas dataframe with a blockNumber column
+    index : BlockTimeIndex
+        timestamps of blocks it doesn't know yet are fetched in batches,
+        each distinct block once
+
+    """
+    df_transfers["blocktime"] = index.datetimes(df_transfers["blockNumber"].values, w3)
+    
+    return df_transfers
+
+def get_transfer_logs(w3, token_contract_address, block_increment, max_workers=4, start_block=None, store=None):
+    """
+    Raw ERC-721 Transfer logs of a contract, see get_transfer_data
+    
+    Returns
+    -------
+    logs in the form of w3.eth.get_logs, in chain order
+
+    """
+    current_block = w3.eth.block_number
+        
+    #Get contract
+    token_contract_address = to_checksum_address(token_contract_address)
+    
+    #Nothing to find before the contract existed
+    if start_block is None and (store is None or store.last_block(token_contract_address) is None):
+        start_block = find_deployment_block(w3, token_contract_address, hi=current_block)
+    
+    #Get transfer events, windows split when too dense and grow when sparse
+    fetcher = LogFetcher(w3, max_workers=max_workers, window=block_increment)
+    if store is None:
+        logs = fetcher.fetch(token_contract_address, [TRANSFER_TOPIC_HEX], start_block, current_block)
+    else:
+        store.sync(w3, token_contract_address, [TRANSFER_TOPIC_HEX], start_block=start_block, head=current_block, fetcher=fetcher)
+        logs = store.read(token_contract_address)
+    print(fetcher.stats())
+    
+    return logs
+
+def get_transfer_data(w3, token_contract_address, ABI, block_increment, max_workers=4, start_block=None, store=None, book=None):
     """
     Get Data on ERC-721 Transfers 
     
@@ -128,45 +186,27 @@ def get_transfer_data(w3, token_contract_address, ABI, block_increment):
     w3 - connection to mainnet 
     token_contract - address for platform
     ABI - 
-    block_increment - how many blocks to search over
+    block_increment - initial number of blocks per getLogs call, adapted while scanning
+    max_workers - getLogs calls in flight at once
+    start_block - first block to scan, the contract's deployment block by default
+    store - optional EventStore; only blocks after its last sync (plus a reorg
+            margin) are fetched, and all transfers are read back from it
+    book - optional AddressBook; from/to are then int32 codes in it
     
     Returns all ERC-721 Transfers decoded 
     -------
-    indexed by: txHash + tknid
-    with: From, to, tokenID, blockNumber, transactionIndex
+    one row per transfer (txhash, logIndex)
+    with: txhash, from, to, tokenID, blockNumber, transactionIndex, logIndex
 
     """
-    dfs = []
-    current_block = w3.eth.blockNumber
-        
-    #Get contract
-    token_contract_address = Web3.toChecksumAddress(token_contract_address)
-    contract = w3.eth.contract(token_contract_address, abi=ABI)
-            
-    i=0
-    while i < current_block:
-        block_start = i 
-        block_end = i + block_increment
-        if block_end > current_block:
-            block_end = current_block
-        print(block_start, block_end)
-        i += block_increment
-         
-        #Get transfer events
-        #event_signature = w3.sha3(text="Transfer(address,address,uint256)").hex()
-        logs = get_transfer_events(w3,block_start, block_end,contract,token_contract_address,ABI)
-        #Process log
-        event_data = decode_event_logs(logs,w3)
-        
-        #Get dataframe of transfer events
-        df_transfers = pd.DataFrame(event_data).transpose()
-        dfs.append(df_transfers)
-
-    df_transfers_all = pd.concat(dfs)
+    logs = get_transfer_logs(w3, token_contract_address, block_increment, max_workers, start_block, store)
+    
+    #Decode straight into columns, one row per (txhash, logIndex)
+    df_transfers_all = decode_transfer_logs(logs, book).to_frame()
 
     return df_transfers_all
 
-def get_creator_owners(df_transfers, contract_addresses, other_addresses=None):
+def get_creator_owners(df_transfers, contract_addresses, other_addresses=None, book=None, state_path=None):
     """
     Return cleaned data on transfers and creator/owner pairs
     Find current owner of each token and calculate number of tokens by address
@@ -176,6 +216,9 @@ def get_creator_owners(df_transfers, contract_addresses, other_addresses=None):
     df_transfers : pandas dataframe of ERC-721 transfers
     contract_addresses: contract addresses 
     other_addresses : optional, auction addresses etc. The default is None.
+    book : optional AddressBook; addresses are then returned as its int32 codes
+    state_path : optional .npz file keeping the ownership state between runs;
+                 only the transfers added since the last run are applied
 
     Returns
     -------
@@ -184,39 +227,38 @@ def get_creator_owners(df_transfers, contract_addresses, other_addresses=None):
     df_creators_owners_noburn : df
         Creator/Current Owner (eth addresses) pairs for each token
     """
-    #Sort on blocknumber and transaction index
-    df_transfers = df_transfers.sort_values(["tokenID","blockNumber","transactionIndex"])
+    #Per-token creator/owner state, see ownership.OwnershipEngine
+    #Tokens are keyed by (contract_address, tokenID) when the column is there
+    if state_path:
+        engine = sync_engine(state_path, df_transfers, book)
+    else:
+        engine = OwnershipEngine(book=book)
+        engine.apply(df_transfers)
+    numtokensby_address, df_creators_owners_noburn = engine.creator_owners(contract_addresses, other_addresses, codes=book is not None)
     
-    #For each token, get the original creator and current owner
-    minting_address = "0x0000000000000000000000000000000000000000"
-    df_transfers["Creator"] = np.where(df_transfers["from"] == minting_address, df_transfers["to"], np.nan)
-    df_transfers["CurrentOwner"] = df_transfers.groupby("tokenID")["to"].transform("last")
- 
-    #Only creators and owners
-    df_transfers["Creator"] = df_transfers.groupby("tokenID")["Creator"].ffill()    
-    df_creators_owners = df_transfers.drop_duplicates("tokenID")
-    df_creators_owners.index = df_creators_owners.tokenID
-
-    #Remove burned tokens 
-    burn_address = "0x000000000000000000000000000000000000dead"
-    df_creators_owners_noburn = df_creators_owners[df_creators_owners.CurrentOwner != burn_address]
+    return numtokensby_address, df_creators_owners_noburn
 
-    #Remove tokens held by the contract  
-    not_contract = (~df_creators_owners_noburn.CurrentOwner.isin(contract_addresses))
-    df_creators_owners_noburn = df_creators_owners_noburn[not_contract][["Creator","CurrentOwner","tokenID","contract_address"]]
-    
-    #Not owned by auction address or minting address
-    df_creators_owners_noburn = df_creators_owners_noburn[df_creators_owners_noburn.CurrentOwner != other_addresses]
-    df_creators_owners_noburn = df_creators_owners_noburn[df_creators_owners_noburn.CurrentOwner != minting_address]
-    
-    #Remove tokens held by the creator still (?)
-    #not_creator_owned = (df_creators_owners_noburn.Creator != df_creators_owners_noburn.CurrentOwner)
-    #df_creators_owners_noburn = df_creators_owners_noburn[not_creator_owned]
+def get_creator_owners_as_of(df_transfers, contract_addresses, at, other_addresses=None, book=None):
+    """
+    Creator/owner pairs as they were at a past block or date
     
-    #Number of tokens by address
-    numtokensby_address = df_creators_owners_noburn.groupby("CurrentOwner").tokenID.count()
+    Parameters
+    ----------
+    df_transfers : pandas dataframe of ERC-721 transfers, with a blocktime
+        column (add_block_times) to query by date
+    contract_addresses: contract addresses 
+    at : int block number, or date (str, datetime)
+    other_addresses : optional, auction addresses etc. The default is None.
+    book : optional AddressBook; addresses are then returned as its int32 codes
+
+    Returns
+    -------
+    numtokensby_address, df_creators_owners_noburn : as get_creator_owners
+        for the network at that point, e.g. to rebuild a dated snapshot csv
+    """
+    history = OwnershipHistory(df_transfers, book=book)
     
-    return numtokensby_address, df_creators_owners_noburn
+    return history.creator_owners(at, contract_addresses, other_addresses, codes=book is not None)
 
 def get_opensea_account_name(ETH_ADDRESS):
     """
@@ -247,51 +289,33 @@ def get_opensea_account_name(ETH_ADDRESS):
         
     return adr_acct_name
     
-def get_superrare_account_name(unique_eth_addresses):
+def get_superrare_account_name(unique_eth_addresses, resolver=None):
     """
-    Query for account info on Ethereum address
+    Query for account info on Ethereum addresses
     
     Parameters
     ----------
-    ETH_ADDRESS : str
-        Ethereum address to query OpenSea API
+    unique_eth_addresses : list of str
+        Ethereum addresses to look up on SuperRare
+    resolver : NameResolver, optional
+        lookups and cache to use, by default headless Chrome (CHROMEDRIVER_PATH
+        or chromedriver on PATH) cached in superrare_names.sqlite
 
     Returns
     -------
-    adr_acct_name : str
-        name of account associated with ETH ADDRESS
+    df_address_usernames : DataFrame
+        Username and Followers indexed by address; the address is the
+        Username of accounts that couldn't be read
 
     """
+    if resolver is not None:
+        return resolver.resolve(unique_eth_addresses)
     
-    #get all unique eth addresses
-    #unique_eth_addresses = list(set(superrare_creator_owners["Creator"].unique().tolist() + superrare_creator_owners["CurrentOwner"].unique().tolist()))
-    
-    #set up browser
-    p_chromedriver = r"C:\Users\kylej\Downloads\chromedriver.exe"
-    opts = Options()
-    opts.add_argument("user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36")
-    opts.add_argument("--headless")  
-    
-    #Start Selenium Webdriver - Change Path as Needed 
-    browser = webdriver.Chrome(executable_path = p_chromedriver, chrome_options=opts)
-    
-    #Usernames / addresses 
-    df_address_usernames = pd.DataFrame()
-    for ETH_ADDRESS in tqdm(unique_eth_addresses):
-        
-        #go to url
-        url = "https://superrare.com/{}".format(ETH_ADDRESS)    
-        try:
-            browser.get(url)
-            time.sleep(1)  
-            username=browser.find_element_by_xpath('//*[@id="root"]/div/div/div[3]/div/div[2]/div/span').text
-            followers=browser.find_element_by_xpath('//*[@id="root"]/div/div/div[3]/div/div[1]/div[2]/p[1]').text  
-            
-            df_address_usernames.loc[ETH_ADDRESS,"Username"] = username
-            df_address_usernames.loc[ETH_ADDRESS,"Followers"] = int(followers.replace("Followers: ",""))
-            
-        except:  
-            df_address_usernames.loc[ETH_ADDRESS,"Username"] = ETH_ADDRESS                        
+    resolver = NameResolver(BrowserFetcher(), "superrare_names.sqlite")
+    try:
+        df_address_usernames = resolver.resolve(unique_eth_addresses)
+    finally:
+        resolver.close()
                              
     return df_address_usernames
 
@@ -319,9 +343,9 @@ def get_eth_balance(w3, ETH_ADDRESS):
 
     return eth_bal
 
-def get_tx_value(w3, txhash, platform):
+def get_tx_value(w3, txhash, platform, receipts=None):
     """
-    Get value of last transaction of coins currently owned by that address
+    Get the sale made in a transaction
 
     Parameters
     ----------
@@ -329,96 +353,30 @@ def get_tx_value(w3, txhash, platform):
         
     txhash: str
         transaction hash
+    receipts: ReceiptService, optional
+        cached receipts, fetched from w3 directly by default
 
     Returns
     -------
-    tx_value : float
-        total value of ERC-721 transfer transaction
+    sale : SaleRecord or None
+        price (ETH), buyer, seller, token_id, platform and event of the last
+        sale event in the transaction, None if there is none. Marketplaces
+        are added with sale_decoders.register
 
     """
     
-    eth_total=np.nan
-    tx = w3.eth.getTransactionReceipt(txhash)
+    sale = None
+    if receipts is None:
+        tx = w3.eth.getTransactionReceipt(txhash)
+    else:
+        tx = receipts.get_receipt(txhash)
     gas_used = tx["gasUsed"]
     
+    #One dict lookup per log, see sale_decoders for the supported events
     for event in tx["logs"]:    
-        topic = w3.toHex(event["topics"][0])
-    
-        ######## SuperRare ########
-        #Sold(index_topic_1 address _buyer, index_topic_2 address _seller, uint256 _amount, index_topic_3 uint256 _tokenId)
-        if topic == w3.sha3(text="Sold(address,address,uint256,uint256)").hex():    
-            from_ = "0x" + Web3.toHex(event["topics"][1])[26:]
-            to_   = "0x" + Web3.toHex(event["topics"][2])[26:]
-            tknid = Web3.toInt(event["topics"][3])
-            eth_total = int(event["data"][:66],16)/1e18
-        
-        #AcceptBid (index_topic_1 address _bidder, index_topic_2 address _seller, uint256 _amount, index_topic_3 uint256 _tokenId)
-        elif topic == "0xd6deddb2e105b46d4644d24aac8c58493a0f107e7973b2fe8d8fa7931a2912be":
-            eth_total = int(event["data"],16)/1e18
-        
-        #Auction Won
-        elif topic == "0xea6d16c6bfcad11577aef5cc6728231c9f069ac78393828f8ca96847405902a9": 
-            from_ = "0x" + Web3.toHex(event["topics"][1])[26:]
-            to_   = "0x" + Web3.toHex(event["topics"][2])[26:]
-            tknid = Web3.toInt(event["topics"][3])
-            eth_total = int(event["data"][66:],16)/1e18
-        
-        #Bought from
-        elif topic == "0x5764dbcef91eb6f946584f4ea671217c686fa7e858ce4f9f42d08422b86556a9": 
-            from_ = "0x" + Web3.toHex(event["topics"][3])[26:]
-            to_   = "0x" + Web3.toHex(event["topics"][2])[26:]
-            eth_total = int(event["data"][:66],16)/1e18
-            tknid     = int(event["data"][66:],16)
-        
-        #Accepted an offer
-        elif topic == "0x2a9d06eec42acd217a17785dbec90b8b4f01a93ecd8c127edd36bfccf239f8b6": 
-            from_ = "0x" + Web3.toHex(event["topics"][3])[26:]
-            to_   = "0x" + Web3.toHex(event["topics"][2])[26:]
-            tknid     = int(event["data"][66:],16)
-            eth_total = int(event["data"][:66],16)/1e18
-         
-        ######## Foundation
-        #Foundation - auction settled on primary market (ACTUAL VALUE FROM IS 1.15x BECAUSE OF FND FEES)
-        #ReserveAuctionFinalized (index_topic_1 uint256 auctionId, index_topic_2 address seller, index_topic_3 address bidder, uint256 f8nFee, uint256 creatorFee, uint256 ownerRev)
-        elif topic==w3.sha3(text="ReserveAuctionFinalized(uint256,address,address,uint256,uint256,uint256)").hex():
-            from_ = "0x" + Web3.toHex(event["topics"][2])[26:]
-            to_   = "0x" + Web3.toHex(event["topics"][3])[26:]
-            tknid     = None
-            eth_total = (int(event["data"][66*2:],16)/1e18 )/0.85
-        
-        ######## KnownOrigin
-        #Purchase (index_topic_1 uint256 _tokenId, index_topic_2 uint256 _editionNumber, index_topic_3 address _buyer, uint256 _priceInWei)
-        elif topic==w3.sha3(text="Purchase(uint256,uint256,address,uint256)").hex():
-            eth_total = int(event["data"],16)/1e18
-        
-        #Bid Accepted
-        #BidAccepted (index_topic_1 address _bidder, index_topic_2 uint256 _editionNumber, index_topic_3 uint256 _tokenId, uint256 _amount)
-        elif topic==w3.sha3(text="BidAccepted(address,uint256,uint256,uint256)").hex():
-            eth_total = int(event["data"],16)/1e18
-        
-        #Secondary Market - token purchased 
-        #TokenPurchased(index_topic_1 uint256 _tokenId, index_topic_2 address _buyer, index_topic_3 address _seller, uint256 _price)
-        elif topic==w3.sha3(text="TokenPurchased(uint256,address,address,uint256)").hex():
-            eth_total = int(event["data"],16)/1e18
-        
-        ######## MakersPlace
-        
-        elif topic == "0xfc8d57c890a29ac7508080b26d7187224039062b525f377f0c7746193c59baa8":
-            eth_total = int(event["data"][194:194+64],16)/1e18
-       
-        ######## ASYNC
-        #TokenSale (uint256 tokenId, uint256 salePrice, address buyer)
-        elif topic==w3.sha3(text="TokenSale(uint256,uint256,address)").hex():
-            eth_total = int(event["data"][66:66*2-2],16)/1e18
-        
-        ###########################
-        #Orders matched - OpenSea
-        #OrdersMatched (bytes32 buyHash, bytes32 sellHash, index_topic_1 address maker, index_topic_2 address taker, uint256 price, index_topic_3 bytes32 metadata)
-        elif topic==w3.sha3(text="OrdersMatched(bytes32,bytes32,address,address,uint256,bytes32)").hex():
-            from_ = "0x" + Web3.toHex(event["topics"][1])[26:]
-            to_   = "0x" + Web3.toHex(event["topics"][2])[26:]
-            tknid     = None
-            eth_total = int(event["data"][66*2:],16)/1e18 
+        record = decode_sale(event, txhash)
+        if record is not None:
+            sale = record
         
     #Get gas price of transaction
     #tx_transaction = w3.eth.getTransaction(txhash)
@@ -426,73 +384,174 @@ def get_tx_value(w3, txhash, platform):
     #gas_price_eth = Web3.fromWei(gas_price, 'ether')
     #total_gas_value = gas_used*gas_price_eth
     
-    return eth_total
-
-def main():
-    
-    #Initialize
-    PROJECTID = "92cdded0532248a580b662b97e2d51f2"    
-    w3 = connect_mainnet(PROJECTID)
-    
-    #####################################
-    ### SUPERRARE 
-    #####################################   
-    
-    ### ERC-721 TRANSFER EVENTS #########
-    for version in [1,2]:
-        if version == 1: 
-            token_contract_address = '0x41a322b28d0ff354040e2cbc676f0320d8c8850d'
-            ABI = json.loads('[{"constant":false,"inputs":[{"name":"_uri","type":"string"},{"name":"_editions","type":"uint256"},{"name":"_salePrice","type":"uint256"}],"name":"addNewTokenWithEditions","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"},{"name":"_salePrice","type":"uint256"}],"name":"setSalePrice","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"name","outputs":[{"name":"_name","type":"string"}],"payable":false,"stateMutability":"pure","type":"function"},{"constant":false,"inputs":[{"name":"_to","type":"address"},{"name":"_tokenId","type":"uint256"}],"name":"approve","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"totalSupply","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"currentBidDetailsOfToken","outputs":[{"name":"","type":"uint256"},{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"approvedFor","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"acceptBid","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"_creator","type":"address"}],"name":"isWhitelisted","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"bid","outputs":[],"payable":true,"stateMutability":"payable","type":"function"},{"constant":true,"inputs":[{"name":"_owner","type":"address"}],"name":"tokensOf","outputs":[{"name":"","type":"uint256[]"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_percentage","type":"uint256"}],"name":"setMaintainerPercentage","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_creator","type":"address"}],"name":"whitelistCreator","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"ownerOf","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_uri","type":"string"}],"name":"originalTokenOfUri","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_owner","type":"address"}],"name":"balanceOf","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"owner","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"symbol","outputs":[{"name":"_symbol","type":"string"}],"payable":false,"stateMutability":"pure","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"cancelBid","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"salePriceOfToken","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_to","type":"address"},{"name":"_tokenId","type":"uint256"}],"name":"transfer","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"takeOwnership","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_percentage","type":"uint256"}],"name":"setCreatorPercentage","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"tokenURI","outputs":[{"name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"creatorOfToken","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"buy","outputs":[],"payable":true,"stateMutability":"payable","type":"function"},{"constant":false,"inputs":[{"name":"_uri","type":"string"}],"name":"addNewToken","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"creatorPercentage","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"maintainerPercentage","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"newOwner","type":"address"}],"name":"transferOwnership","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_creator","type":"address"}],"name":"WhitelistCreator","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_bidder","type":"address"},{"indexed":true,"name":"_amount","type":"uint256"},{"indexed":true,"name":"_tokenId","type":"uint256"}],"name":"Bid","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_bidder","type":"address"},{"indexed":true,"name":"_seller","type":"address"},{"indexed":false,"name":"_amount","type":"uint256"},{"indexed":true,"name":"_tokenId","type":"uint256"}],"name":"AcceptBid","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_bidder","type":"address"},{"indexed":true,"name":"_amount","type":"uint256"},{"indexed":true,"name":"_tokenId","type":"uint256"}],"name":"CancelBid","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_buyer","type":"address"},{"indexed":true,"name":"_seller","type":"address"},{"indexed":false,"name":"_amount","type":"uint256"},{"indexed":true,"name":"_tokenId","type":"uint256"}],"name":"Sold","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_tokenId","type":"uint256"},{"indexed":true,"name":"_price","type":"uint256"}],"name":"SalePriceSet","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"previousOwner","type":"address"},{"indexed":true,"name":"newOwner","type":"address"}],"name":"OwnershipTransferred","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_from","type":"address"},{"indexed":true,"name":"_to","type":"address"},{"indexed":false,"name":"_tokenId","type":"uint256"}],"name":"Transfer","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_owner","type":"address"},{"indexed":true,"name":"_approved","type":"address"},{"indexed":false,"name":"_tokenId","type":"uint256"}],"name":"Approval","type":"event"}]') 
-            df_transfers_SR_V1 = get_transfer_data(w3, token_contract_address, ABI, block_increment=100000)
-            df_transfers_SR_V1["contract_address"] = token_contract_address 
-            
-        elif version == 2:
-            token_contract_address = '0xb932a70a57673d89f4acffbe830e8ed7f75fb9e0'
-            ABI = json.loads('[{"constant":true,"inputs":[{"name":"interfaceId","type":"bytes4"}],"name":"supportsInterface","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_enabled","type":"bool"}],"name":"enableWhitelist","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"name","outputs":[{"name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"tokenId","type":"uint256"}],"name":"getApproved","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"to","type":"address"},{"name":"tokenId","type":"uint256"}],"name":"approve","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"totalSupply","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"from","type":"address"},{"name":"to","type":"address"},{"name":"tokenId","type":"uint256"}],"name":"transferFrom","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"},{"name":"_uri","type":"string"}],"name":"updateTokenMetadata","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"owner","type":"address"},{"name":"index","type":"uint256"}],"name":"tokenOfOwnerByIndex","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_address","type":"address"}],"name":"isWhitelisted","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"tokenCreator","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"from","type":"address"},{"name":"to","type":"address"},{"name":"tokenId","type":"uint256"}],"name":"safeTransferFrom","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"index","type":"uint256"}],"name":"tokenByIndex","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_tokenId","type":"uint256"}],"name":"deleteToken","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"tokenId","type":"uint256"}],"name":"ownerOf","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"owner","type":"address"}],"name":"balanceOf","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[],"name":"renounceOwnership","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_removedAddress","type":"address"}],"name":"removeFromWhitelist","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"owner","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"isOwner","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"symbol","outputs":[{"name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"to","type":"address"},{"name":"approved","type":"bool"}],"name":"setApprovalForAll","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_whitelistees","type":"address[]"}],"name":"initWhitelist","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"from","type":"address"},{"name":"to","type":"address"},{"name":"tokenId","type":"uint256"},{"name":"_data","type":"bytes"}],"name":"safeTransferFrom","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"tokenId","type":"uint256"}],"name":"tokenURI","outputs":[{"name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"_uri","type":"string"}],"name":"addNewToken","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"_newAddress","type":"address"}],"name":"addToWhitelist","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"owner","type":"address"},{"name":"operator","type":"address"}],"name":"isApprovedForAll","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"newOwner","type":"address"}],"name":"transferOwnership","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"inputs":[{"name":"_name","type":"string"},{"name":"_symbol","type":"string"},{"name":"_oldSuperRare","type":"address"}],"payable":false,"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_tokenId","type":"uint256"},{"indexed":false,"name":"_uri","type":"string"}],"name":"TokenURIUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_newAddress","type":"address"}],"name":"AddToWhitelist","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"_removedAddress","type":"address"}],"name":"RemoveFromWhitelist","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"previousOwner","type":"address"},{"indexed":true,"name":"newOwner","type":"address"}],"name":"OwnershipTransferred","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"from","type":"address"},{"indexed":true,"name":"to","type":"address"},{"indexed":true,"name":"tokenId","type":"uint256"}],"name":"Transfer","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":true,"name":"approved","type":"address"},{"indexed":true,"name":"tokenId","type":"uint256"}],"name":"Approval","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":true,"name":"operator","type":"address"},{"indexed":false,"name":"approved","type":"bool"}],"name":"ApprovalForAll","type":"event"}]')
-            df_transfers_SR_V2 = get_transfer_data(w3, token_contract_address, ABI, block_increment=100000)
-            df_transfers_SR_V2["contract_address"] = token_contract_address
-            
-    df_transfers_SR = pd.concat([df_transfers_SR_V1,df_transfers_SR_V2])
-    df_transfers_SR["Platform"]="SuperRare"
-    
-    #SuperRare addresses 
-    contract_addresses = ["0x41a322b28d0ff354040e2cbc676f0320d8c8850d","0xb932a70a57673d89f4acffbe830e8ed7f75fb9e0"]
-    auction_address = "0x8c9f364bf7a56ed058fc63ef81c6cf09c833e656"
-    #Get current owners 
-    superrare_numtokens_byadr, superrare_creator_owners = get_creator_owners(df_transfers_SR, contract_addresses, other_addresses=auction_address)
-    #Get number owned / created by address
-    superrare_creator_owners["NumTokensOwned"] = superrare_creator_owners.groupby("CurrentOwner").tokenID.transform('count')
-    superrare_creator_owners["NumTokensCreated"] = superrare_creator_owners.groupby("Creator").tokenID.transform('count') 
-    
-    #load previous mapping 
-    address_name_mapping = pd.read_csv(r"C:\Users\kylej\Documents\GitHub\SuperRare-Network\superrare_username_to_address_2021-08-22.csv")
-    superrare_creator_owners2 = pd.merge(superrare_creator_owners,address_name_mapping,left_on="Creator",right_on="Address",how='left')
-    superrare_creator_owners3 = pd.merge(superrare_creator_owners2,address_name_mapping,left_on="CurrentOwner",right_on="Address",how='left')
-    superrare_creator_owners3.drop(["Address_x","Address_y"],axis=1,inplace=True)
-    superrare_creator_owners3.columns =  ['ArtistAdr', 'CollectorAdr', 'tokenID', 'contract_address',
-       'NumTokensOwnedCollector', 'NumTokensCreatedArtist', 'ArtistName', 'ArtistFollowers',
-       'CollectorName', 'CollectorFollowers']
-  
-    #get new artists/collectors 
-    no_name_artists = superrare_creator_owners3[(superrare_creator_owners3.ArtistName.isnull())]["ArtistAdr"].unique().tolist()
-    no_name_collectors = superrare_creator_owners3[(superrare_creator_owners3.CollectorName.isnull())]["CollectorAdr"].unique().tolist()
-    addresses_ = no_name_artists+no_name_collectors
-    new_address_names = get_superrare_account_name(addresses_)
-    new_address_names["Address"] = new_address_names.index
-    new_address_names.rename(columns={"Username":"Name"},inplace=True)
+    return sale
+
+def get_tx_values(txhashes, receipts):
+    """
+    Sales of many transactions, receipts fetched in batches and cached
+
+    Parameters
+    ----------
+    txhashes : iterable of str
+        transaction hashes, e.g. df_transfers.txhash.unique()
+    receipts : ReceiptService
+
+    Returns
+    -------
+    sales : dict
+        lowercase tx hash -> SaleRecord, transactions without a sale left out
+
+    """
+    sales = {}
+    for key, tx in receipts.get_receipts(txhashes).items():
+        for event in tx["logs"]:
+            record = decode_sale(event, key)
+            if record is not None:
+                sales[key] = record
+                
+    return sales
+
+#####################################
+### PIPELINE STAGES
+#####################################
+
+def stage_fetch(context, contracts):
+    """
+    Sync the transfer logs of the registered contracts into the event
+    store, one worker process per contract
     
-    #add new collectors / artists 
-    address_name_mapping2 = pd.concat([address_name_mapping,new_address_names])
+    The logs stay in the store; the artifact is their count and a digest
+    per contract, so decoding only reruns when logs were added or replaced.
+    """
+    summaries = sync_contracts(get_contracts(names=contracts), context["endpoint"], context["events"])
+    
+    return {"contracts": summaries, "rows": sum(x["rows"] for x in summaries)}
+
+def stage_decode(context, fetched, contracts):
+    """Transfers of the contracts in one platform-tagged frame, addresses as codes of one book"""
     
-    #merge on
-    superrare_creator_owners2 = pd.merge(superrare_creator_owners,address_name_mapping2,left_on="Creator",right_on="Address",how='left')
-    superrare_creator_owners3 = pd.merge(superrare_creator_owners2,address_name_mapping2,left_on="CurrentOwner",right_on="Address",how='left')
+    return load_transfers(get_contracts(names=contracts), context["events"])
+
+def stage_ownership(context, decoded, contracts):
+    """Creator/owner pairs with tokens owned and created per address, as codes"""
+    book, df_transfers = decoded
+    #Tokens held by the contracts or their auction houses/markets have no owner
+    excluded = excluded_addresses(get_contracts(names=contracts))
+    #State kept with the event store: a run applies the transfers synced since the last one
+    state_path = os.path.join(context["events"], "ownership.npz")
+    _, df_creators_owners = get_creator_owners(df_transfers, excluded, book=book, state_path=state_path)
+    df_creators_owners["NumTokensOwned"] = df_creators_owners.groupby("CurrentOwner").tokenID.transform('count')
+    df_creators_owners["NumTokensCreated"] = df_creators_owners.groupby("Creator").tokenID.transform('count')
     
-    superrare_creator_owners3.drop(["Address_x","Address_y"],axis=1,inplace=True)
-    superrare_creator_owners3.columns =  ['ArtistAdr', 'CollectorAdr', 'tokenID', 'contract_address',
-       'NumTokensOwnedCollector', 'NumTokensCreatedArtist', 'ArtistName', 'ArtistFollowers',
-       'CollectorName', 'CollectorFollowers']
+    return df_creators_owners
+
+def stage_resolve_names(context, decoded, creators_owners, names_csv, names_cache="superrare_names.sqlite"):
+    """
+    Name and followers of every address of the book
     
-    p_out = r"C:\Users\kylej\Documents\GitHub\SuperRare-Network"  
-    superrare_creator_owners3.to_csv(os.path.join(p_out, "superrare top artists and collectors_2021-08-29.csv"),index=False)
+    Names come from names_csv first; artists and collectors without one
+    are looked up on SuperRare (see get_superrare_account_name), with
+    context["name_fetcher"] if set, headless Chrome otherwise.
     
+    Returns
+    -------
+    DataFrame with Name and Followers, row i for address code i
+    """
+    book, _ = decoded
+    address_name_mapping = pd.read_csv(names_csv)
+    mapped = book.lookup(address_name_mapping["Address"].values)
+    names = book.table(mapped, address_name_mapping["Name"].values)
+    followers = book.table(mapped, address_name_mapping["Followers"].values)
+    
+    #get new artists/collectors 
+    unnamed = np.unique(np.concatenate([creators_owners["Creator"].values, creators_owners["CurrentOwner"].values]))
+    unnamed = unnamed[(unnamed >= 0) & pd.isnull(names[unnamed])]
+    if len(unnamed):
+        resolver = NameResolver(context.get("name_fetcher") or BrowserFetcher(), names_cache)
+        try:
+            new_address_names = get_superrare_account_name(book.hex(unnamed).tolist(), resolver=resolver)
+        finally:
+            resolver.close()
+        names[unnamed] = new_address_names["Username"].values
+        followers[unnamed] = new_address_names["Followers"].values
+    
+    return pd.DataFrame({"Name": names[:-1], "Followers": followers[:-1]})
+
+def stage_build_pairs(context, decoded, creators_owners, address_names):
+    """Artist/collector rows of the network csv, addresses as strings only here"""
+    book, _ = decoded
+    #-1 (no creator) picks the NaN row at the end
+    names = np.append(address_names["Name"].values, np.nan)
+    followers = np.append(address_names["Followers"].values, np.nan)
+    artists = creators_owners["Creator"].values
+    collectors = creators_owners["CurrentOwner"].values
+    
+    return pd.DataFrame({"ArtistAdr": book.hex(artists),
+                         "CollectorAdr": book.hex(collectors),
+                         "tokenID": creators_owners["tokenID"].values,
+                         "contract_address": book.hex(creators_owners["contract_address"].values),
+                         "NumTokensOwnedCollector": creators_owners["NumTokensOwned"].values,
+                         "NumTokensCreatedArtist": creators_owners["NumTokensCreated"].values,
+                         "ArtistName": names[artists],
+                         "ArtistFollowers": followers[artists],
+                         "CollectorName": names[collectors],
+                         "CollectorFollowers": followers[collectors]})
+
+def stage_export(context, pairs, path):
+    """Write the network csv"""
+    pairs.to_csv(path, index=False)
+    
+    return {"path": path, "rows": len(pairs)}
+
+def network_pipeline(names_csv, out_path, platforms=("SuperRare",), names_cache="superrare_names.sqlite", cache_dir="pipeline_cache", max_workers=2):
+    """
+    The artist/collector network csv of some platforms as a staged pipeline
+    
+    fetch -> decode -> ownership -> resolve_names -> build_pairs -> export
+    
+    fetch runs every time (the event store only asks the chain for new
+    blocks); every other stage reruns only when its inputs changed. The
+    contracts of the platforms come from the registry (contracts.py) and
+    are fetched and decoded in parallel processes.
+    """
+    contracts = [c.name for c in get_contracts(platforms)]
+    stages = [Stage("fetch", stage_fetch, params={"contracts": contracts}, volatile=True),
+              Stage("decode", stage_decode, inputs=["fetch"], params={"contracts": contracts}),
+              Stage("ownership", stage_ownership, inputs=["decode"], params={"contracts": contracts}),
+              Stage("resolve_names", stage_resolve_names, inputs=["decode", "ownership"],
+                    params={"names_csv": names_csv, "names_cache": names_cache}),
+              Stage("build_pairs", stage_build_pairs, inputs=["decode", "ownership", "resolve_names"]),
+              Stage("export", stage_export, inputs=["build_pairs"], params={"path": out_path}, volatile=True)]
+    
+    return Pipeline(stages, cache_dir=cache_dir, max_workers=max_workers)
+
+def main(argv=None):
+    
+    p_here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build the artist/collector network csv")
+    parser.add_argument("--project-id", default=os.environ.get("INFURA_PROJECT_ID", "92cdded0532248a580b662b97e2d51f2"),
+                        help="Infura project id (INFURA_PROJECT_ID)")
+    parser.add_argument("--platforms", nargs="+", default=["SuperRare"], choices=platforms())
+    parser.add_argument("--out-dir", default=p_here)
+    parser.add_argument("--date", default=date.today().isoformat(), help="date in the csv file name")
+    parser.add_argument("--names-csv", default=os.path.join(p_here, "superrare_username_to_address_2021-08-22.csv"))
+    parser.add_argument("--names-cache", default="superrare_names.sqlite")
+    parser.add_argument("--events", default="transfer_events", help="event store directory")
+    parser.add_argument("--cache-dir", default="pipeline_cache")
+    parser.add_argument("--workers", type=int, default=2, help="stages run at once")
+    parser.add_argument("--only", nargs="*", help="stages to run, with what they need")
+    parser.add_argument("--force", nargs="*", default=[], help="stages to rerun even if cached")
+    args = parser.parse_args(argv)
+    
+    prefix = "superrare" if args.platforms == ["SuperRare"] else "_".join(x.lower() for x in args.platforms)
+    out_path = os.path.join(args.out_dir, "{} top artists and collectors_{}.csv".format(prefix, args.date))
+    pipeline = network_pipeline(args.names_csv, out_path, args.platforms, args.names_cache, args.cache_dir, args.workers)
+    #Transfer logs synced so far (in args.events), only new blocks are fetched
+    context = {"endpoint": "https://mainnet.infura.io/v3/{}".format(args.project_id), "events": args.events}
+    try:
+        pipeline.run(context, targets=args.only, force=args.force)
+    finally:
+        pipeline.print_report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Batched transaction receipt fetching with a persistent cache
+
+Receipts of mined transactions never change, so every receipt fetched is
+kept in a local sqlite file keyed by its transaction hash (zlib-compressed
+JSON) and never requested again. Hashes missing from the cache are sent
+as JSON-RPC batch requests of batch_size calls, max_workers batches at a
+time.
+
+Receipts are returned in raw JSON-RPC form (hex strings), which
+sale_decoders.decode_sale reads directly.
+
+    receipts = ReceiptService(w3, "receipts.sqlite")
+    by_hash = receipts.get_receipts(df_transfers.txhash.unique())
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import record_batch
+
+def batch_request(w3, calls):
+    """
+    Responses to a JSON-RPC batch of (method, params), in call order
+
+    Uses the provider's make_batch_request when it has one, otherwise
+    posts the batch to its endpoint_uri (web3 v5 HTTPProvider), counted in
+    the metrics if the provider is instrumented (see
+    metrics.instrument_provider).
+    """
+    provider = w3.provider
+    if hasattr(provider, "make_batch_request"):
+        return provider.make_batch_request(calls)
+    payload = [{"jsonrpc": "2.0", "id": i, "method": m, "params": p} for i, (m, p) in enumerate(calls)]
+    t0 = time.perf_counter()
+    response = requests.post(provider.endpoint_uri, json=payload, timeout=60)
+    response.raise_for_status()
+    responses = response.json()
+    if isinstance(responses, dict):
+        #Whole batch rejected
+        raise ValueError(responses.get("error", responses))
+    responses = sorted(responses, key=lambda x: x["id"])
+    if getattr(provider, "_sr_instrumented", False):
+        record_batch(calls, responses, time.perf_counter() - t0)
+    return responses
+
+def _key(txhash):
+    """Cache key of a tx hash given as 0x string or bytes"""
+    if isinstance(txhash, str):
+        return txhash.lower() if txhash.startswith("0x") else "0x" + txhash.lower()
+    return "0x" + bytes.hex(bytes(txhash))
+
+class ReceiptService:
+    """
+    Parameters
+    ----------
+    w3 : Web3
+        connection, see batch_request.
+    cache_path : str
+        sqlite file, created if missing. ":memory:" keeps nothing.
+    batch_size : int
+        receipts per JSON-RPC batch.
+    max_workers : int
+        batches in flight at once.
+    max_retries : int
+        attempts per batch before giving up.
+    backoff : float
+        seconds before the first retry, doubled on every further one.
+    """
+
+    def __init__(self, w3, cache_path="receipts.sqlite", batch_size=100, max_workers=4, max_retries=3, backoff=0.5):
+        self.w3 = w3
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS receipts (txhash TEXT PRIMARY KEY, receipt BLOB NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.fetched = 0
+        self.batches = 0
+
+    def _cached(self, keys):
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute("SELECT txhash, receipt FROM receipts WHERE txhash IN ({})".format(",".join("?"*len(chunk))), chunk)
+                for key, blob in rows:
+                    found[key] = json.loads(zlib.decompress(blob).decode("utf-8"))
+        return found
+
+    def _store(self, receipts):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO receipts VALUES (?, ?)",
+                                 [(k, zlib.compress(json.dumps(v).encode("utf-8"))) for k, v in receipts.items()])
+            self._db.commit()
+
+    def _fetch_batch(self, keys):
+        """Receipts of keys, retrying the calls that failed"""
+        receipts = {}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff*2**(attempt - 1)*random.uniform(0.5, 1.5))
+            try:
+                responses = batch_request(self.w3, [("eth_getTransactionReceipt", [k]) for k in keys])
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                continue
+            with self._lock:
+                self.batches += 1
+            failed = []
+            for key, response in zip(keys, responses):
+                if "error" in response:
+                    failed.append(key)
+                elif response.get("result") is not None:
+                    receipts[key] = response["result"]
+            if not failed:
+                return receipts
+            if attempt == self.max_retries:
+                raise ValueError("No receipt for {} transactions after {} attempts".format(len(failed), attempt + 1))
+            keys = failed
+
+        return receipts
+
+    def get_receipts(self, txhashes):
+        """
+        Receipts of many transactions
+
+        Returns
+        -------
+        dict
+            lowercase 0x tx hash -> receipt. Unknown or pending
+            transactions are left out.
+        """
+        keys = list(dict.fromkeys(_key(x) for x in txhashes))
+        receipts = self._cached(keys)
+        self.cache_hits += len(receipts)
+        missing = [k for k in keys if k not in receipts]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for fetched in pool.map(self._fetch_batch, batches):
+                #Only mined receipts are final
+                fetched = {k: v for k, v in fetched.items() if v.get("blockNumber") is not None}
+                self._store(fetched)
+                self.fetched += len(fetched)
+                receipts.update(fetched)
+
+        return receipts
+
+    def get_receipt(self, txhash):
+        """Receipt of one transaction, None if it is unknown or pending"""
+        return self.get_receipts([txhash]).get(_key(txhash))
+
+    def stats(self):
+        return {"cache_hits": self.cache_hits, "fetched": self.fetched, "batches": self.batches}
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of marketplace sale events, dispatched on topic0
+
+Each SaleDecoder declares where a sale event keeps its price, buyer,
+seller and token ID, as ("topic", i) for the i-th topic or ("data", k) for
+the k-th 32-byte word of the data, plus a fee adjustment for platforms
+whose event reports the seller's share rather than the price. Topic
+hashes are computed once, when a decoder is registered, and decode_sale
+finds the decoder of a log with one dict lookup.
+
+Adding a marketplace is one call:
+
+    register(SaleDecoder("MyMarket", "Bought(address,uint256,uint256)",
+                         buyer=("topic", 1), token_id=("data", 0), price=("data", 1)))
+"""
+
+from collections import namedtuple
+
+from web3 import Web3
+
+#price in ETH, buyer/seller as lowercase 0x addresses, fields the event lacks are None
+SaleRecord = namedtuple("SaleRecord", ["price", "buyer", "seller", "token_id", "platform", "event", "txhash"])
+
+def _hex(value):
+    """Hex digits of a topic or data field (HexBytes or 0x string), without 0x"""
+    if isinstance(value, str):
+        return value[2:].lower() if value.startswith("0x") else value.lower()
+    return bytes.hex(bytes(value))
+
+class SaleDecoder:
+    """
+    Parameters
+    ----------
+    platform : str
+    name : str
+        event signature, e.g. "Sold(address,address,uint256,uint256)",
+        or a label when topic is given.
+    topic : str, optional
+        topic0 as 0x hex, for events known only by their hash. Hashed
+        from name by default.
+    price : tuple
+        location of the price in wei.
+    buyer, seller, token_id : tuple, optional
+        locations of the other fields.
+    fee_divisor : float
+        the price is divided by this, e.g. 0.85 when the event reports
+        what the seller got after a 15% fee.
+    """
+
+    def __init__(self, platform, name, topic=None, price=("data", 0), buyer=None, seller=None, token_id=None, fee_divisor=1.0):
+        self.platform = platform
+        self.name = name
+        if topic is None:
+            topic = "0x" + _hex(Web3.keccak(text=name))
+        self.topic = topic.lower()
+        self.price = price
+        self.buyer = buyer
+        self.seller = seller
+        self.token_id = token_id
+        self.fee_divisor = fee_divisor
+
+    def _word(self, topics, data, location):
+        kind, i = location
+        if kind == "topic":
+            return _hex(topics[i])
+        return data[64*i:64*(i + 1)]
+
+    def _address(self, topics, data, location):
+        if location is None:
+            return None
+        return "0x" + self._word(topics, data, location)[24:]
+
+    def decode(self, event, txhash=None):
+        """SaleRecord of one log of this event"""
+        topics = event["topics"]
+        data = _hex(event["data"])
+        price = int(self._word(topics, data, self.price), 16)/1e18/self.fee_divisor
+        token_id = None if self.token_id is None else int(self._word(topics, data, self.token_id), 16)
+
+        return SaleRecord(price,
+                          self._address(topics, data, self.buyer),
+                          self._address(topics, data, self.seller),
+                          token_id,
+                          self.platform,
+                          self.name,
+                          txhash)
+
+#topic0 -> SaleDecoder
+SALE_DECODERS = {}
+
+def register(decoder):
+    """Add a decoder, replacing any other for the same topic"""
+    SALE_DECODERS[decoder.topic] = decoder
+    return decoder
+
+def decode_sale(event, txhash=None):
+    """SaleRecord of a receipt log, None if it isn't a known sale event"""
+    topics = event["topics"]
+    if not topics:
+        return None
+    decoder = SALE_DECODERS.get("0x" + _hex(topics[0]))
+    if decoder is None:
+        return None
+    return decoder.decode(event, txhash)
+
+######## SuperRare ########
+#Sold(index_topic_1 address _buyer, index_topic_2 address _seller, uint256 _amount, index_topic_3 uint256 _tokenId)
+register(SaleDecoder("SuperRare", "Sold(address,address,uint256,uint256)",
+                     price=("data", 0), buyer=("topic", 1), seller=("topic", 2), token_id=("topic", 3)))
+#AcceptBid(index_topic_1 address _bidder, index_topic_2 address _seller, uint256 _amount, index_topic_3 uint256 _tokenId)
+register(SaleDecoder("SuperRare", "AcceptBid", topic="0xd6deddb2e105b46d4644d24aac8c58493a0f107e7973b2fe8d8fa7931a2912be",
+                     price=("data", 0), buyer=("topic", 1), seller=("topic", 2), token_id=("topic", 3)))
+#Auction won
+register(SaleDecoder("SuperRare", "AuctionSettled", topic="0xea6d16c6bfcad11577aef5cc6728231c9f069ac78393828f8ca96847405902a9",
+                     price=("data", 1), seller=("topic", 1), buyer=("topic", 2), token_id=("topic", 3)))
+#Bought from
+register(SaleDecoder("SuperRare", "Sold", topic="0x5764dbcef91eb6f946584f4ea671217c686fa7e858ce4f9f42d08422b86556a9",
+                     price=("data", 0), buyer=("topic", 2), seller=("topic", 3), token_id=("data", 1)))
+#Accepted an offer
+register(SaleDecoder("SuperRare", "AcceptOffer", topic="0x2a9d06eec42acd217a17785dbec90b8b4f01a93ecd8c127edd36bfccf239f8b6",
+                     price=("data", 0), buyer=("topic", 2), seller=("topic", 3), token_id=("data", 1)))
+
+######## Foundation
+#ReserveAuctionFinalized(index_topic_1 uint256 auctionId, index_topic_2 address seller, index_topic_3 address bidder, uint256 f8nFee, uint256 creatorFee, uint256 ownerRev)
+#ownerRev is what the seller got, the price is 1/0.85 of it because of fees
+register(SaleDecoder("Foundation", "ReserveAuctionFinalized(uint256,address,address,uint256,uint256,uint256)",
+                     price=("data", 2), seller=("topic", 2), buyer=("topic", 3), fee_divisor=0.85))
+
+######## KnownOrigin
+#Purchase(index_topic_1 uint256 _tokenId, index_topic_2 uint256 _editionNumber, index_topic_3 address _buyer, uint256 _priceInWei)
+register(SaleDecoder("KnownOrigin", "Purchase(uint256,uint256,address,uint256)",
+                     price=("data", 0), buyer=("topic", 3), token_id=("topic", 1)))
+#BidAccepted(index_topic_1 address _bidder, index_topic_2 uint256 _editionNumber, index_topic_3 uint256 _tokenId, uint256 _amount)
+register(SaleDecoder("KnownOrigin", "BidAccepted(address,uint256,uint256,uint256)",
+                     price=("data", 0), buyer=("topic", 1), token_id=("topic", 3)))
+#Secondary market, TokenPurchased(index_topic_1 uint256 _tokenId, index_topic_2 address _buyer, index_topic_3 address _seller, uint256 _price)
+register(SaleDecoder("KnownOrigin", "TokenPurchased(uint256,address,address,uint256)",
+                     price=("data", 0), buyer=("topic", 2), seller=("topic", 3), token_id=("topic", 1)))
+
+######## MakersPlace
+register(SaleDecoder("MakersPlace", "Sale", topic="0xfc8d57c890a29ac7508080b26d7187224039062b525f377f0c7746193c59baa8",
+                     price=("data", 3)))
+
+######## ASYNC
+#TokenSale(uint256 tokenId, uint256 salePrice, address buyer)
+register(SaleDecoder("Async", "TokenSale(uint256,uint256,address)",
+                     price=("data", 1), buyer=("data", 2), token_id=("data", 0)))
+
+######## OpenSea
+#OrdersMatched(bytes32 buyHash, bytes32 sellHash, index_topic_1 address maker, index_topic_2 address taker, uint256 price, index_topic_3 bytes32 metadata)
+register(SaleDecoder("OpenSea", "OrdersMatched(bytes32,bytes32,address,address,uint256,bytes32)",
+                     price=("data", 2), seller=("topic", 1), buyer=("topic", 2)))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary snapshot of the viewer dataset
+
+A snapshot csv is cleaned and encoded once into a single .srnet file:
+
+    b"SRNET1\n" | header length (8 bytes, little endian) | JSON header | arrays
+
+The header lists every array's dtype, shape and byte offset; arrays are
+64-byte aligned raw little-endian data. The file holds the node dictionary
+(UTF-8 names blob + offsets), the int32 artist/collector edge list, the
+per-node attribute columns and the CSR graph, all with cleaning applied.
+
+load_snapshot memory-maps the file, so every gunicorn worker on a machine
+shares the same page-cache pages and loading takes milliseconds. Build it
+with
+
+    python snapshot.py [pairs csv or url] [superrare_network.srnet]
+"""
+
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from network_data import load_network, dataset_fingerprint, url_github_SR_data
+from node_index import NodeIndex
+from graph_engine import CSRGraph
+
+MAGIC = b"SRNET1\n"
+ALIGN = 64
+default_snapshot_path = "superrare_network.srnet"
+
+def _encode_names(names):
+    """UTF-8 blob and offsets (length n + 1) for an array of str"""
+    encoded = [str(x).encode("utf-8") for x in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(x) for x in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _decode_names(blob, offsets):
+    data = blob.tobytes()
+    return np.array([data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)], dtype=object)
+
+def write_snapshot(path, arrays, meta):
+    """
+    Write named arrays and a metadata dict to a .srnet file
+
+    The file is written next to path and renamed into place, so a running
+    app never maps a half-written snapshot.
+    """
+    header = {"meta": meta, "arrays": {}}
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        header["arrays"][name] = {"dtype": arr.dtype.newbyteorder("<").str, "shape": list(arr.shape), "offset": offset}
+        offset += -(-arr.nbytes // ALIGN)*ALIGN
+    header_bytes = json.dumps(header).encode("utf-8")
+    start = len(MAGIC) + 8 + len(header_bytes)
+    start += -start % ALIGN
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).astype(header["arrays"][name]["dtype"], copy=False).tobytes())
+        f.truncate(start + offset)
+    os.replace(tmp, path)
+
+def read_snapshot(path):
+    """
+    Memory-map a .srnet file
+
+    Returns
+    -------
+    arrays : dict of read-only ndarrays backed by the mapped file
+    meta : dict
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a network snapshot".format(path))
+        header_len, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len).decode("utf-8"))
+    start = len(MAGIC) + 8 + header_len
+    start += -start % ALIGN
+
+    buf = np.memmap(path, dtype=np.uint8, mode="r")
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"]))
+        first = start + spec["offset"]
+        arrays[name] = buf[first:first + count*dtype.itemsize].view(dtype).reshape(spec["shape"])
+
+    return arrays, header["meta"]
+
+def build_snapshot(path=url_github_SR_data, out_path=default_snapshot_path):
+    """
+    Convert a pairs csv into a .srnet snapshot
+
+    Parameters
+    ----------
+    path : str
+        pairs csv (local path or url).
+    out_path : str
+        snapshot file to write.
+
+    Returns
+    -------
+    meta : dict
+        metadata stored in the snapshot, including the dataset version.
+    """
+    df_collector_artist_pairs, node_index, graph = load_network(path)
+    names_blob, names_offsets = _encode_names(node_index.names)
+    artist_codes = node_index.encode(df_collector_artist_pairs["ArtistName"])
+    collector_codes = node_index.encode(df_collector_artist_pairs["CollectorName"])
+
+    arrays = {
+        "names_blob": names_blob,
+        "names_offsets": names_offsets,
+        "artist_codes": artist_codes,
+        "collector_codes": collector_codes,
+        "artist_followers": df_collector_artist_pairs["ArtistFollowers"].values.astype(np.float32),
+        "collector_followers": df_collector_artist_pairs["CollectorFollowers"].values.astype(np.float32),
+        "followers": node_index.followers,
+        "roles": node_index.roles,
+        "tokens_created": node_index.tokens_created,
+        "tokens_collected": node_index.tokens_collected,
+        "indptr": graph.indptr,
+        "indices": graph.indices,
+    }
+    meta = {"version": dataset_fingerprint(node_index, graph),
+            "source": path,
+            "n_nodes": len(node_index),
+            "n_edges": graph.n_edges,
+            "n_rows": len(df_collector_artist_pairs),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    write_snapshot(out_path, arrays, meta)
+
+    return meta
+
+def load_snapshot(path):
+    """
+    Node index, graph and dataset version from a .srnet snapshot
+
+    Numeric arrays stay memory-mapped; only the name dictionary is decoded.
+    """
+    arrays, meta = read_snapshot(path)
+    names = _decode_names(arrays["names_blob"], arrays["names_offsets"])
+    node_index = NodeIndex(names, arrays["followers"], arrays["roles"],
+                           arrays["tokens_created"], arrays["tokens_collected"])
+    graph = CSRGraph(arrays["indptr"], arrays["indices"])
+
+    return node_index, graph, meta["version"]
+
+def load_dataset(snapshot_path, csv_path):
+    """
+    Node index, graph and dataset version, from the snapshot if it exists
+
+    The csv (local path or url) is only read when there is no snapshot.
+    """
+    if snapshot_path and os.path.exists(snapshot_path):
+        return load_snapshot(snapshot_path)
+    print("No snapshot at {}, loading {}".format(snapshot_path, csv_path))
+    _, node_index, graph = load_network(csv_path)
+
+    return node_index, graph, dataset_fingerprint(node_index, graph)
+
+if __name__ == '__main__':
+    t0 = time.perf_counter()
+    meta = build_snapshot(*sys.argv[1:3])
+    print("Built snapshot {} ({} nodes, {} edges) in {:.1f}s".format(meta["version"], meta["n_nodes"], meta["n_edges"], time.perf_counter() - t0))
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned store of dated artist/collector snapshots
+
+All snapshots share one node dictionary (username -> int ID, growing as
+new names appear). Each snapshot's unique artist -> collector edges are
+encoded as int64 keys (artist ID << 32 | collector ID); the first loaded
+snapshot is kept in full and every later one only as the keys added and
+removed relative to the one before it, with a full keyframe every few
+dates so that materializing a date replays a bounded number of deltas.
+Snapshot csvs are read lazily, the first time a date at or after them is
+needed, or all at once by prefetch; reading happens outside the store's
+lock, so a slow download doesn't hold up requests for loaded dates.
+
+The older csvs in the repo use Artist/Collector columns, the current one
+ArtistName/CollectorName; both are accepted.
+"""
+
+import glob
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from network_data import clean_collector_artist_pairs, url_github_SR_data
+
+_LOW = np.int64(0xFFFFFFFF)
+
+def _read_pairs(path):
+    """Cleaned artist/collector name columns of a snapshot csv of either schema"""
+    df = pd.read_csv(path)
+    df = df.rename(columns={"Artist": "ArtistName", "Collector": "CollectorName"})
+    df = df[["ArtistName", "CollectorName"]].dropna()
+    df = clean_collector_artist_pairs(df)
+    return df[df.ArtistName != df.CollectorName]
+
+def default_sources(directory=None):
+    """
+    Dated snapshot csvs in the repo plus the latest one on GitHub
+
+    Returns
+    -------
+    dict of date string (YYYY-MM-DD) -> path or url
+    """
+    if directory is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+    sources = {}
+    for path in glob.glob(os.path.join(directory, "superrare top artists and collectors_*.csv")):
+        match = re.search(r"_(\d{4}-\d{2}-\d{2})\.csv$", path)
+        if match:
+            sources[match.group(1)] = path
+    sources.setdefault("2021-08-29", url_github_SR_data)
+    return sources
+
+class SnapshotStore:
+    """
+    Parameters
+    ----------
+    sources : dict
+        date string (sortable, e.g. YYYY-MM-DD) -> csv path or url.
+    keyframe_every : int
+        dates between full edge sets kept besides the deltas.
+    """
+
+    def __init__(self, sources, keyframe_every=8):
+        self.sources = dict(sources)
+        self.dates = sorted(self.sources)
+        self.keyframe_every = keyframe_every
+        self.names = []
+        self.ids = {}
+        self._base = None
+        self._deltas = {}
+        #Full edge keys of every keyframe_every-th date, by date index
+        self._keyframes = {}
+        self._loaded = 0
+        #Cleaned pairs read but not encoded yet, by date
+        self._read = {}
+        #Last materialized edge set, (date, keys)
+        self._current = (None, None)
+        self._lock = threading.Lock()
+
+    def _fetch(self, date):
+        """
+        Read a date's csv if it isn't loaded or read yet. The read runs
+        without the lock, storing it takes the lock
+
+        Raises
+        ------
+        OSError
+            the csv could not be read (e.g. the download failed); the next
+            call tries again.
+        """
+        if date in self._read or self.dates.index(date) < self._loaded:
+            return
+        try:
+            df = _read_pairs(self.sources[date])
+        except Exception as e:
+            raise OSError("Snapshot of {} unavailable: {}".format(date, e)) from e
+        #A concurrent _load_through may have encoded the date meanwhile
+        with self._lock:
+            if self.dates.index(date) >= self._loaded:
+                self._read[date] = df
+
+    def prefetch(self):
+        """
+        Read every csv now, e.g. at startup from a background thread
+
+        Returns
+        -------
+        dict of date -> error message of the csvs that could not be read
+        """
+        errors = {}
+        for date in self.dates:
+            try:
+                self._fetch(date)
+            except OSError as e:
+                errors[date] = str(e)
+        return errors
+
+    def _encode(self, names):
+        """IDs for an array of names, adding new names to the dictionary"""
+        codes, uniques = pd.factorize(names)
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, name in enumerate(uniques):
+            node = self.ids.get(name)
+            if node is None:
+                node = len(self.names)
+                self.ids[name] = node
+                self.names.append(name)
+            mapping[i] = node
+        return mapping[codes]
+
+    def _ensure(self, date):
+        """Read the csvs up to date (no lock held), then encode them"""
+        if date not in self.sources:
+            raise KeyError("No snapshot for {}".format(date))
+        for d in self.dates[:self.dates.index(date) + 1]:
+            self._fetch(d)
+        with self._lock:
+            self._load_through(date)
+
+    def _load_through(self, date):
+        """Compute deltas of the read csvs up to and including date. Lock held"""
+        target = self.dates.index(date)
+        while self._loaded <= target:
+            d = self.dates[self._loaded]
+            df = self._read.pop(d)
+            keys = np.unique((self._encode(df["ArtistName"].values) << 32) | self._encode(df["CollectorName"].values))
+            if self._base is None:
+                self._base = keys
+            else:
+                previous = self._materialize(self.dates[self._loaded - 1])
+                self._deltas[d] = (np.setdiff1d(keys, previous, assume_unique=True),
+                                   np.setdiff1d(previous, keys, assume_unique=True))
+            if self._loaded % self.keyframe_every == 0:
+                self._keyframes[self._loaded] = keys
+            self._current = (d, keys)
+            self._loaded += 1
+
+    def _materialize(self, date):
+        """Full sorted edge keys of a loaded date, from the closest keyframe or the last result. Lock held"""
+        if self._current[0] == date:
+            return self._current[1]
+        target = self.dates.index(date)
+        start = target - target % self.keyframe_every
+        keys = self._keyframes[start]
+        current = self.dates.index(self._current[0])
+        if start < current < target:
+            start, keys = current, self._current[1]
+        for d in self.dates[start + 1:target + 1]:
+            added, removed = self._deltas[d]
+            keys = np.union1d(np.setdiff1d(keys, removed, assume_unique=True), added)
+        self._current = (date, keys)
+        return keys
+
+    def edges(self, date):
+        """
+        Artist -> collector edges of one snapshot
+
+        Returns
+        -------
+        artist_ids, collector_ids : ndarray of int64
+        """
+        self._ensure(date)
+        with self._lock:
+            keys = self._materialize(date)
+        return keys >> 32, keys & _LOW
+
+    def delta(self, date):
+        """Edge keys added and removed by date relative to the snapshot before it"""
+        self._ensure(date)
+        with self._lock:
+            if date == self.dates[0]:
+                return self._base, self._base[:0]
+            return self._deltas[date]
+
+    def diff(self, user, date_from, date_to):
+        """
+        How a user's network changed between two snapshots
+
+        Returns
+        -------
+        dict
+            added_collectors / removed_collectors (people who collected the
+            user's work) and added_artists / removed_artists (artists the
+            user collected), each a sorted list of names. Empty if the user
+            is in neither snapshot.
+        """
+        before_artist, before_collector = self.edges(date_from)
+        after_artist, after_collector = self.edges(date_to)
+        result = {"user": user, "from": date_from, "to": date_to}
+        node = self.ids.get(user)
+        if node is None:
+            before_artist = before_collector = after_artist = after_collector = np.zeros(0, dtype=np.int64)
+            node = -1
+
+        def change(before, after):
+            added = np.setdiff1d(after, before)
+            removed = np.setdiff1d(before, after)
+            return sorted(self.names[i] for i in added), sorted(self.names[i] for i in removed)
+
+        result["added_collectors"], result["removed_collectors"] = change(
+            before_collector[before_artist == node], after_collector[after_artist == node])
+        result["added_artists"], result["removed_artists"] = change(
+            before_artist[before_collector == node], after_artist[after_collector == node])
+
+        return result
+
+    def memory_bytes(self):
+        """Bytes held by edge keys: keyframes (base included), deltas and the cached edge set"""
+        total = sum(keys.nbytes for keys in self._keyframes.values())
+        for added, removed in self._deltas.values():
+            total += added.nbytes + removed.nbytes
+        if self._current[1] is not None and not any(self._current[1] is keys for keys in self._keyframes.values()):
+            total += self._current[1].nbytes
+        return total
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for a JSON-RPC node that serves recorded logs
+
+RecordedLogProvider answers eth_blockNumber, eth_getLogs, eth_getCode,
+eth_getTransactionReceipt, eth_getBlockByNumber and eth_chainId from logs
+recorded with record_logs (and receipts, if given), singly or in batches,
+so the fetching code can be run and timed offline:
+
+    w3 = Web3(RecordedLogProvider.from_file("superrare_v2_logs.json", max_results=10000))
+
+Like Infura it rejects getLogs queries matching more than max_results
+logs, and it can fail a fraction of calls at random to exercise retries.
+"""
+
+import bisect
+import json
+import random
+import threading
+import time
+
+from web3.providers import BaseProvider
+
+from event_store import raw_log
+
+def record_logs(logs, path):
+    """Save logs returned by w3.eth.get_logs as raw JSON-RPC logs"""
+    with open(path, "w") as f:
+        json.dump([raw_log(x) for x in logs], f)
+
+def _block(value, latest):
+    if value in (None, "latest", "pending", "safe", "finalized"):
+        return latest
+    if value == "earliest":
+        return 0
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+class RecordedLogProvider(BaseProvider):
+    """
+    Parameters
+    ----------
+    logs : list of dict
+        raw JSON-RPC logs (hex strings), as written by record_logs.
+    latest_block : int, optional
+        reported chain head, the last log's block by default.
+    deployments : dict, optional
+        contract address -> deployment block, for eth_getCode.
+        Addresses of the recorded logs default to their first log's block.
+    max_results : int
+        getLogs queries matching more logs than this are rejected.
+    failure_rate : float
+        fraction of calls failing with a transient error.
+    latency : float
+        seconds added to every call, or batch.
+    receipts : dict, optional
+        tx hash -> raw JSON-RPC receipt.
+    block_time : callable, optional
+        block number -> unix timestamp, increasing. Mainnet's genesis
+        time plus 13 s per block by default.
+    """
+
+    def __init__(self, logs, latest_block=None, deployments=None, max_results=10000,
+                 failure_rate=0.0, latency=0.0, seed=0, receipts=None, block_time=None):
+        super().__init__()
+        self.logs = sorted(logs, key=lambda x: (int(x["blockNumber"], 16), int(x["logIndex"], 16)))
+        self.blocks = [int(x["blockNumber"], 16) for x in self.logs]
+        if latest_block is None:
+            latest_block = self.blocks[-1] if self.blocks else 0
+        self.latest_block = latest_block
+        self.deployments = {}
+        for log, block in zip(self.logs, self.blocks):
+            self.deployments.setdefault(log["address"].lower(), block)
+        self.deployments.update({k.lower(): v for k, v in (deployments or {}).items()})
+        self.max_results = max_results
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.receipts = {k.lower(): v for k, v in (receipts or {}).items()}
+        self.block_time = block_time or (lambda block: 1438269973 + 13*block)
+        #Calls per JSON-RPC method, batches count their calls
+        self.calls = {}
+        self.batches = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def is_connected(self, show_traceback=False):
+        return True
+
+    isConnected = is_connected
+
+    def make_request(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(method, params)
+
+    def make_batch_request(self, requests):
+        """Responses to a list of (method, params), in order"""
+        with self._lock:
+            self.batches += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [dict(self._answer(method, params), id=i) for i, (method, params) in enumerate(requests)]
+
+    def _answer(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            fail = self._random.random() < self.failure_rate
+        if fail:
+            return self._error(-32603, "request failed, please retry")
+        if method == "eth_blockNumber":
+            return self._result(hex(self.latest_block))
+        if method == "eth_chainId":
+            return self._result("0x1")
+        if method == "eth_getCode":
+            deployed = self.deployments.get(params[0].lower())
+            block = _block(params[1] if len(params) > 1 else None, self.latest_block)
+            return self._result("0x6080" if deployed is not None and block >= deployed else "0x")
+        if method == "eth_getLogs":
+            return self._get_logs(params[0])
+        if method == "eth_getBlockByNumber":
+            block = _block(params[0], self.latest_block)
+            if block > self.latest_block:
+                return self._result(None)
+            return self._result({"number": hex(block), "timestamp": hex(self.block_time(block))})
+        if method == "eth_getTransactionReceipt":
+            return self._result(self.receipts.get(params[0].lower()))
+        return self._error(-32601, "the method {} does not exist/is not available".format(method))
+
+    def _get_logs(self, query):
+        start = _block(query.get("fromBlock"), self.latest_block)
+        end = _block(query.get("toBlock"), self.latest_block)
+        addresses = query.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = None if addresses is None else {x.lower() for x in addresses}
+        topics = query.get("topics") or []
+
+        matches = []
+        for log in self.logs[bisect.bisect_left(self.blocks, start):bisect.bisect_right(self.blocks, end)]:
+            if addresses is not None and log["address"].lower() not in addresses:
+                continue
+            if not all(t is None or (i < len(log["topics"]) and log["topics"][i].lower() in
+                                     ([x.lower() for x in t] if isinstance(t, list) else [t.lower()]))
+                       for i, t in enumerate(topics)):
+                continue
+            matches.append(log)
+            if len(matches) > self.max_results:
+                return self._error(-32005, "query returned more than {} results".format(self.max_results))
+
+        return self._result(matches)
+
+    def _result(self, result):
+        return {"jsonrpc": "2.0", "id": 0, "result": result}
+
+    def _error(self, code, message):
+        return {"jsonrpc": "2.0", "id": 0, "error": {"code": code, "message": message}}
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+EventStore sync, read and compact against RecordedLogProvider
+"""
+
+import pytest
+from web3 import Web3
+
+from benchmarks.synthetic import CONTRACT, synthetic_chain
+from event_store import EventStore
+from log_fetcher import LogFetcher
+from stub_provider import RecordedLogProvider
+from transfer_decoder import TRANSFER_TOPIC_HEX
+
+class RecordingFetcher(LogFetcher):
+    """LogFetcher remembering the ranges it was asked for"""
+
+    def __init__(self, w3, **kwargs):
+        super().__init__(w3, backoff=0, **kwargs)
+        self.ranges = []
+
+    def fetch(self, address, topics, from_block, to_block):
+        self.ranges.append((from_block, to_block))
+        return super().fetch(address, topics, from_block, to_block)
+
+@pytest.fixture(scope="module")
+def logs():
+    return synthetic_chain(600, seed=2)[0]
+
+def blocks(logs):
+    return [int(x["blockNumber"], 16) for x in logs]
+
+def keys(logs):
+    """(block, log index, tx hash) of raw or formatted logs"""
+    out = []
+    for x in logs:
+        if isinstance(x["blockNumber"], str):
+            out.append((int(x["blockNumber"], 16), int(x["logIndex"], 16), x["transactionHash"]))
+        else:
+            out.append((x["blockNumber"], x["logIndex"], "0x" + bytes(x["transactionHash"]).hex()))
+    return sorted(out)
+
+def sync(store, logs, head, start_block=None):
+    fetcher = RecordingFetcher(Web3(RecordedLogProvider(logs)))
+    store.sync(fetcher.w3, CONTRACT, [TRANSFER_TOPIC_HEX], start_block=start_block, head=head, fetcher=fetcher)
+    return fetcher.ranges
+
+def test_sync_resumes_after_last_block(logs, tmp_path):
+    store = EventStore(str(tmp_path), reorg_depth=12)
+    first, last = min(blocks(logs)), max(blocks(logs))
+    middle = (first + last)//2
+    assert sync(store, logs, middle, start_block=first) == [(first, middle)]
+    assert store.last_block(CONTRACT) == middle
+    #Only the reorg margin and the new blocks are fetched again
+    assert sync(store, logs, last) == [(middle - 11, last)]
+    assert store.last_block(CONTRACT) == last
+    assert sync(store, logs, last) == [(last - 11, last)]
+    assert len(store.partitions(CONTRACT)) == 3
+
+def test_reorg_margin_not_duplicated(logs, tmp_path):
+    store = EventStore(str(tmp_path), reorg_depth=50)
+    first, last = min(blocks(logs)), max(blocks(logs))
+    for head in range(first + 100, last, 150):
+        sync(store, logs, head, start_block=first)
+    sync(store, logs, last)
+    assert keys(store.read(CONTRACT)) == keys(logs)
+
+def test_reorged_logs_replaced(logs, tmp_path):
+    store = EventStore(str(tmp_path), reorg_depth=20)
+    first, last = min(blocks(logs)), max(blocks(logs))
+    #A log of the reorg window that the new chain doesn't have
+    recent = [x for x in logs if int(x["blockNumber"], 16) > last - 10]
+    orphan = dict(recent[0], transactionHash="0x" + "ee"*32)
+    sync(store, logs + [orphan], last, start_block=first)
+    assert len(store.read(CONTRACT)) == len(logs) + 1
+    sync(store, logs, last)
+    assert keys(store.read(CONTRACT)) == keys(logs)
+
+def test_read_block_range(logs, tmp_path):
+    store = EventStore(str(tmp_path), reorg_depth=12)
+    first, last = min(blocks(logs)), max(blocks(logs))
+    sync(store, logs, (first + last)//2, start_block=first)
+    sync(store, logs, last)
+    lo, hi = first + 200, last - 300
+    inside = [x for x in logs if lo <= int(x["blockNumber"], 16) <= hi]
+    assert keys(store.read(CONTRACT, from_block=lo, to_block=hi)) == keys(inside)
+    assert keys(store.read(CONTRACT, from_block=lo)) == keys([x for x in logs if int(x["blockNumber"], 16) >= lo])
+    assert keys(store.read(CONTRACT, to_block=hi)) == keys([x for x in logs if int(x["blockNumber"], 16) <= hi])
+    assert store.read(CONTRACT, from_block=last + 1) == []
+
+def test_compact_keeps_logs(logs, tmp_path):
+    store = EventStore(str(tmp_path), reorg_depth=30)
+    first, last = min(blocks(logs)), max(blocks(logs))
+    for head in range(first + 100, last, 200):
+        sync(store, logs, head, start_block=first)
+    sync(store, logs, last)
+    before = store.read(CONTRACT)
+    assert len(store.partitions(CONTRACT)) > 2
+    store.compact(CONTRACT)
+    assert len(store.partitions(CONTRACT)) == 1
+    assert store.read(CONTRACT) == before
+    assert store.last_block(CONTRACT) == last
+
+def test_sync_compacts_above_max_partitions(logs, tmp_path):
+    store = EventStore(str(tmp_path), reorg_depth=5, max_partitions=3)
+    first, last = min(blocks(logs)), max(blocks(logs))
+    for head in range(first + 50, last, 100):
+        sync(store, logs, head, start_block=first)
+        assert len(store.partitions(CONTRACT)) <= 3
+    sync(store, logs, last)
+    assert keys(store.read(CONTRACT)) == keys(logs)
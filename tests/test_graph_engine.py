@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+CSRGraph.ego_budget on a small star-and-chain graph
+"""
+
+import pytest
+
+from graph_engine import CSRGraph
+
+@pytest.fixture
+def graph():
+    #Hub 0 linked to 1-4, chain 1-5-6
+    return CSRGraph.from_edges([0, 0, 0, 0, 1, 5], [1, 2, 3, 4, 5, 6], 7)
+
+@pytest.mark.parametrize("kwargs", [{"radius": 0}, {"max_nodes": 1}, {"max_nodes": 0}])
+def test_hub_alone(graph, kwargs):
+    sample = graph.ego_budget(0, **kwargs)
+    assert sample.nodes.tolist() == [0]
+    assert sample.hops.tolist() == [0]
+    assert len(sample.edge_u) == len(sample.edge_v) == 0
+
+def test_two_hops(graph):
+    sample = graph.ego_budget(0, radius=2)
+    assert sample.nodes.tolist() == [0, 1, 2, 3, 4, 5]
+    assert sample.hops.tolist() == [0, 1, 1, 1, 1, 2]
+    assert sorted(zip(sample.edge_u.tolist(), sample.edge_v.tolist())) == [(0, 1), (0, 2), (0, 3), (0, 4), (1, 5)]
+
+def test_node_budget(graph):
+    sample = graph.ego_budget(0, radius=2, max_nodes=3)
+    assert len(sample.nodes) == 3
+    assert sample.truncated["fanout"] == 2
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+LogFetcher window scheduling against RecordedLogProvider
+"""
+
+import pytest
+from web3 import Web3
+
+from benchmarks.synthetic import CONTRACT, synthetic_chain
+from log_fetcher import LogFetcher, find_deployment_block
+from stub_provider import RecordedLogProvider
+from transfer_decoder import TRANSFER_TOPIC_HEX
+
+@pytest.fixture(scope="module")
+def logs():
+    return synthetic_chain(1000, seed=1)[0]
+
+def block_range(logs):
+    return int(logs[0]["blockNumber"], 16), int(logs[-1]["blockNumber"], 16)
+
+def expected(logs):
+    return sorted(((int(x["blockNumber"], 16), int(x["logIndex"], 16), x["transactionHash"]) for x in logs))
+
+def fetched(logs):
+    return sorted((x["blockNumber"], x["logIndex"], "0x" + bytes(x["transactionHash"]).hex()) for x in logs)
+
+def test_large_window_is_split(logs):
+    w3 = Web3(RecordedLogProvider(logs, max_results=200))
+    start, end = block_range(logs)
+    fetcher = LogFetcher(w3, window=end - start + 1, backoff=0)
+    result = fetcher.fetch(CONTRACT, [TRANSFER_TOPIC_HEX], start, end)
+    assert fetched(result) == expected(logs)
+    assert fetcher.splits > 0
+    assert fetcher.window < end - start + 1
+
+def test_sparse_window_grows(logs):
+    w3 = Web3(RecordedLogProvider(logs))
+    start, end = block_range(logs)
+    fetcher = LogFetcher(w3, window=10, sparse_logs=1000, max_window=10000, backoff=0)
+    result = fetcher.fetch(CONTRACT, [TRANSFER_TOPIC_HEX], start, end)
+    assert fetched(result) == expected(logs)
+    assert fetcher.grows > 0 and fetcher.window > 10
+    #Doubling reaches the whole range in a few calls, not one call per 10 blocks
+    assert fetcher.calls < (end - start)//10
+
+def test_transient_errors_retried(logs):
+    w3 = Web3(RecordedLogProvider(logs, max_results=200, failure_rate=0.2))
+    start, end = block_range(logs)
+    fetcher = LogFetcher(w3, window=500, max_retries=10, backoff=0)
+    result = fetcher.fetch(CONTRACT, [TRANSFER_TOPIC_HEX], start, end)
+    assert fetched(result) == expected(logs)
+    assert fetcher.retries > 0
+
+def test_error_raised_after_max_retries(logs):
+    provider = RecordedLogProvider(logs, failure_rate=1.0)
+    start, end = block_range(logs)
+    fetcher = LogFetcher(Web3(provider), max_workers=1, max_retries=2, backoff=0)
+    with pytest.raises(Exception, match="request failed"):
+        fetcher.fetch(CONTRACT, [TRANSFER_TOPIC_HEX], start, end)
+    assert fetcher.retries == 2
+    assert provider.calls["eth_getLogs"] == 3
+
+def test_find_deployment_block(logs):
+    provider = RecordedLogProvider(logs, latest_block=20000000, deployments={CONTRACT: 4999990})
+    assert find_deployment_block(Web3(provider), CONTRACT) == 4999990
+    #No code at the head: one past it
+    other = "0x41a322b28d0ff354040e2cbc676f0320d8c8850d"
+    assert find_deployment_block(Web3(provider), other) == 20000001
+    #About log2(head) getCode calls
+    assert provider.calls["eth_getCode"] <= 2*27
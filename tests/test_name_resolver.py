@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+NameResolver cache, TTL and rate limit with the stub fetcher
+"""
+
+import time
+
+import numpy as np
+
+from name_resolver import NameResolver, StubFetcher, TokenBucket
+
+PROFILES = {"0x{:040x}".format(i): ("user{}".format(i), 10*i) for i in range(1, 7)}
+ADDRESSES = list(PROFILES)
+
+def make_resolver(fetcher, tmp_path, **kwargs):
+    kwargs.setdefault("rate", 1000.0)
+    return NameResolver(fetcher, str(tmp_path/"names.sqlite"), **kwargs)
+
+def test_only_missing_names_fetched(tmp_path):
+    fetcher = StubFetcher(PROFILES)
+    resolver = make_resolver(fetcher, tmp_path)
+    df = resolver.resolve(ADDRESSES[:3])
+    assert df["Username"].tolist() == ["user1", "user2", "user3"]
+    assert fetcher.calls == 3
+    #Mixed case is the same address, returned as given
+    upper = ADDRESSES[0].upper().replace("0X", "0x")
+    df = resolver.resolve([upper] + ADDRESSES[1:5])
+    assert fetcher.calls == 5
+    assert df.loc[upper, "Username"] == "user1"
+    assert resolver.stats() == {"cache_hits": 3, "fetched": 5, "failed": 0}
+
+def test_failed_names_fall_back_and_retry(tmp_path):
+    fetcher = StubFetcher(PROFILES)
+    resolver = make_resolver(fetcher, tmp_path)
+    unknown = "0x" + "f"*40
+    df = resolver.resolve([unknown, ADDRESSES[0]])
+    assert df.loc[unknown, "Username"] == unknown and np.isnan(df.loc[unknown, "Followers"])
+    resolver.resolve([unknown, ADDRESSES[0]])
+    assert fetcher.calls == 3
+    assert resolver.failed == 2
+
+def test_stale_names_refetched(tmp_path):
+    fetcher = StubFetcher(PROFILES)
+    resolver = make_resolver(fetcher, tmp_path, ttl=3600)
+    resolver.resolve(ADDRESSES[:2])
+    #Age the first profile past the TTL
+    resolver._db.execute("UPDATE names SET fetched_at = ? WHERE address = ?", (time.time() - 7200, ADDRESSES[0]))
+    resolver._db.commit()
+    fetcher.profiles[ADDRESSES[0]] = ("renamed", 99)
+    df = resolver.resolve(ADDRESSES[:2])
+    assert fetcher.calls == 3
+    assert df.loc[ADDRESSES[0], "Username"] == "renamed"
+    assert resolver.cached([ADDRESSES[0]])[ADDRESSES[0]][:2] == ("renamed", 99)
+    resolver.resolve(ADDRESSES[:2], refresh=True)
+    assert fetcher.calls == 5
+
+def test_cache_persists_across_instances(tmp_path):
+    resolver = make_resolver(StubFetcher(PROFILES), tmp_path)
+    resolver.resolve(ADDRESSES)
+    resolver.close()
+    fetcher = StubFetcher(PROFILES)
+    resolver = make_resolver(fetcher, tmp_path)
+    df = resolver.resolve(ADDRESSES)
+    assert fetcher.calls == 0
+    assert df["Followers"].tolist() == [10*i for i in range(1, 7)]
+    resolver.close()
+
+def test_fetches_rate_limited(tmp_path):
+    fetcher = StubFetcher(PROFILES)
+    resolver = make_resolver(fetcher, tmp_path, max_workers=6, rate=20.0, burst=1)
+    t0 = time.monotonic()
+    resolver.resolve(ADDRESSES)
+    #One token at start, then 20 per second for the other five
+    assert time.monotonic() - t0 >= 0.2
+    assert fetcher.calls == 6
+
+def test_token_bucket_burst():
+    bucket = TokenBucket(rate=10.0, capacity=3)
+    t0 = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - t0 < 0.05
+    bucket.acquire()
+    assert time.monotonic() - t0 >= 0.08
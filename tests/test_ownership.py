@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+OwnershipEngine against the pandas get_creator_owners it replaced
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from address_book import AddressBook
+from ownership import BURN_ADDRESS, MINTING_ADDRESS, OwnershipEngine, sync_engine
+
+CONTRACT = "0xb932a70a57673d89f4acffbe830e8ed7f75fb9e0"
+AUCTION_HOUSE = "0x8c9f364bf7a56ed058fc63ef81c6cf09c833e656"
+
+def legacy_creator_owners(df_transfers, contract_addresses, other_addresses=None):
+    """get_creator_owners as it was before OwnershipEngine"""
+    df_transfers = df_transfers.sort_values(["tokenID", "blockNumber", "transactionIndex"])
+    df_transfers["Creator"] = np.where(df_transfers["from"] == MINTING_ADDRESS, df_transfers["to"], np.nan)
+    df_transfers["CurrentOwner"] = df_transfers.groupby("tokenID")["to"].transform("last")
+    df_transfers["Creator"] = df_transfers.groupby("tokenID")["Creator"].ffill()
+    df_creators_owners = df_transfers.drop_duplicates("tokenID")
+    df_creators_owners.index = df_creators_owners.tokenID
+    df_creators_owners_noburn = df_creators_owners[df_creators_owners.CurrentOwner != BURN_ADDRESS]
+    not_contract = (~df_creators_owners_noburn.CurrentOwner.isin(contract_addresses))
+    df_creators_owners_noburn = df_creators_owners_noburn[not_contract][["Creator", "CurrentOwner", "tokenID", "contract_address"]]
+    df_creators_owners_noburn = df_creators_owners_noburn[df_creators_owners_noburn.CurrentOwner != other_addresses]
+    df_creators_owners_noburn = df_creators_owners_noburn[df_creators_owners_noburn.CurrentOwner != MINTING_ADDRESS]
+    numtokensby_address = df_creators_owners_noburn.groupby("CurrentOwner").tokenID.count()
+
+    return numtokensby_address, df_creators_owners_noburn
+
+def make_transfers(n_tokens=300, seed=0):
+    """
+    Transfers of one contract: mints, resales, burns (to the dead and the
+    zero address), tokens left with the contract or the auction house and a
+    few tokens whose mint is missing. One transfer per block.
+    """
+    rng = np.random.RandomState(seed)
+    accounts = ["0x{:040x}".format(x) for x in rng.randint(1, 2**62, 40)]
+    rows = []
+    block = 5000000
+    for token in range(n_tokens):
+        owner = accounts[rng.randint(len(accounts))]
+        if rng.rand() > 0.05:
+            rows.append((MINTING_ADDRESS, owner, token))
+        for _ in range(rng.poisson(2)):
+            buyer = [CONTRACT, AUCTION_HOUSE, accounts[rng.randint(len(accounts))]][rng.choice(3, p=[0.1, 0.2, 0.7])]
+            rows.append((owner, buyer, token))
+            owner = buyer
+        end = rng.rand()
+        if end < 0.05:
+            rows.append((owner, BURN_ADDRESS, token))
+        elif end < 0.08:
+            rows.append((owner, MINTING_ADDRESS, token))
+    df = pd.DataFrame(rows, columns=["from", "to", "tokenID"])
+    #Distinct blocks, increasing within a token, tokens interleaved
+    df["blockNumber"] = block + rng.choice(10*len(df), len(df), replace=False)
+    df["blockNumber"] = df.groupby("tokenID")["blockNumber"].transform(np.sort)
+    df["transactionIndex"] = rng.randint(0, 200, len(df))
+    df["logIndex"] = rng.randint(0, 50, len(df))
+    df["contract_address"] = CONTRACT
+
+    return df.sort_values("blockNumber").reset_index(drop=True)
+
+def pairs(df_creators_owners):
+    """Sorted (tokenID, Creator, CurrentOwner, contract_address) tuples, None for NaN"""
+    df = df_creators_owners[["tokenID", "Creator", "CurrentOwner", "contract_address"]].astype(object)
+    return sorted(tuple(None if pd.isnull(x) else x for x in row) for row in df.itertuples(index=False))
+
+def counts(numtokensby_address):
+    return {k: int(v) for k, v in numtokensby_address.items()}
+
+def assert_same(engine, df_transfers):
+    expected_counts, expected = legacy_creator_owners(df_transfers, [CONTRACT], AUCTION_HOUSE)
+    numtokensby_address, df_creators_owners = engine.creator_owners([CONTRACT], AUCTION_HOUSE)
+    assert pairs(df_creators_owners) == pairs(expected)
+    assert counts(numtokensby_address) == counts(expected_counts)
+
+@pytest.fixture
+def transfers():
+    return make_transfers()
+
+def test_fixture_has_every_case(transfers):
+    last = transfers.groupby("tokenID")["to"].last()
+    assert (last == BURN_ADDRESS).any() and (last == MINTING_ADDRESS).any()
+    assert (last == CONTRACT).any() and (last == AUCTION_HOUSE).any()
+    first = transfers.groupby("tokenID")["from"].first()
+    assert (first != MINTING_ADDRESS).any()
+
+def test_whole_table(transfers):
+    engine = OwnershipEngine()
+    engine.apply(transfers)
+    assert_same(engine, transfers)
+
+def test_burned_and_excluded_tokens_dropped(transfers):
+    engine = OwnershipEngine()
+    engine.apply(transfers)
+    _, df_creators_owners = engine.creator_owners([CONTRACT], AUCTION_HOUSE)
+    owners = set(df_creators_owners["CurrentOwner"])
+    assert not owners & {BURN_ADDRESS, MINTING_ADDRESS, CONTRACT, AUCTION_HOUSE}
+
+def test_shuffled_batches(transfers):
+    rng = np.random.RandomState(1)
+    shuffled = transfers.iloc[rng.permutation(len(transfers))]
+    engine = OwnershipEngine(capacity=8)
+    for rows in np.array_split(np.arange(len(shuffled)), 7):
+        engine.apply(shuffled.iloc[rows])
+    assert_same(engine, transfers)
+
+def test_out_of_order_batches(transfers):
+    #Block ranges applied newest first, as a backfill after a tail sync
+    engine = OwnershipEngine()
+    for rows in reversed(np.array_split(np.arange(len(transfers)), 5)):
+        engine.apply(transfers.iloc[rows])
+    assert_same(engine, transfers)
+
+def test_reapplied_batch(transfers):
+    engine = OwnershipEngine()
+    chunks = np.array_split(np.arange(len(transfers)), 4)
+    for rows in chunks:
+        engine.apply(transfers.iloc[rows])
+    engine.apply(transfers.iloc[chunks[1]])
+    engine.apply(transfers.iloc[chunks[3]])
+    assert_same(engine, transfers)
+
+def test_book_codes(transfers):
+    book = AddressBook()
+    coded = transfers.copy()
+    for column in ("from", "to", "contract_address"):
+        coded[column] = book.intern(transfers[column].values)
+    engine = OwnershipEngine(book=book)
+    engine.apply(coded)
+    numtokensby_address, df_creators_owners = engine.creator_owners([CONTRACT], AUCTION_HOUSE, codes=True)
+    expected_counts, expected = legacy_creator_owners(transfers, [CONTRACT], AUCTION_HOUSE)
+    for column in ("Creator", "CurrentOwner", "contract_address"):
+        df_creators_owners[column] = book.hex(df_creators_owners[column].values)
+    assert pairs(df_creators_owners) == pairs(expected)
+    assert dict(zip(book.hex(numtokensby_address.index.values), numtokensby_address.values)) == counts(expected_counts)
+
+def test_save_load_into_another_book(transfers, tmp_path):
+    engine = OwnershipEngine()
+    engine.apply(transfers)
+    path = str(tmp_path / "ownership.npz")
+    engine.save(path)
+    book = AddressBook()
+    book.add(AUCTION_HOUSE)
+    loaded = OwnershipEngine.load(path, book)
+    assert loaded.book is book
+    assert loaded.position == engine.position and loaded.n_transfers == len(transfers)
+    assert_same(loaded, transfers)
+    assert_same(OwnershipEngine.load(path), transfers)
+
+def test_sync_engine_applies_new_transfers_only(transfers, tmp_path):
+    path = str(tmp_path / "ownership.npz")
+    half = len(transfers)//2
+    sync_engine(path, transfers.iloc[:half])
+    engine = sync_engine(path, transfers)
+    #Loaded state plus the second half, nothing applied twice
+    assert engine.n_transfers == len(transfers)
+    assert_same(engine, transfers)
+    assert sync_engine(path, transfers).n_transfers == len(transfers)
+
+def test_sync_engine_replays_changed_history(transfers, tmp_path):
+    path = str(tmp_path / "ownership.npz")
+    late = transfers["blockNumber"] > transfers["blockNumber"].median()
+    sync_engine(path, transfers[late])
+    #Earlier blocks backfilled: the saved state is rebuilt from the table
+    engine = sync_engine(path, transfers)
+    assert engine.n_transfers == len(transfers)
+    assert_same(engine, transfers)
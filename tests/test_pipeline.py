@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline caching, volatile stages, force and parallel runs with toy stages
+"""
+
+import threading
+
+import pytest
+
+from pipeline import Pipeline, Stage
+
+class Calls:
+    """Stage functions counting their runs"""
+
+    def __init__(self):
+        self.runs = []
+        self.source = 1
+
+    def fetch(self, context):
+        self.runs.append("fetch")
+        return {"value": self.source, "rows": 1}
+
+    def double(self, context, fetched, factor=2):
+        self.runs.append("double")
+        return fetched["value"]*factor
+
+    def describe(self, context, doubled):
+        self.runs.append("describe")
+        return "value {}".format(doubled)
+
+def make_pipeline(calls, cache_dir, volatile=False, factor=2):
+    return Pipeline([Stage("describe", calls.describe, inputs=["double"]),
+                     Stage("double", calls.double, inputs=["fetch"], params={"factor": factor}),
+                     Stage("fetch", calls.fetch, volatile=volatile)], cache_dir=str(cache_dir))
+
+def statuses(pipeline):
+    return {x["stage"]: x["status"] for x in pipeline.report}
+
+def test_cached_stages_skipped(tmp_path):
+    calls = Calls()
+    assert make_pipeline(calls, tmp_path).run()["describe"] == "value 2"
+    assert calls.runs == ["fetch", "double", "describe"]
+    calls.runs = []
+    pipeline = make_pipeline(calls, tmp_path)
+    assert pipeline.run() == {"describe": "value 2", "double": 2, "fetch": {"value": 1, "rows": 1}}
+    assert calls.runs == []
+    assert statuses(pipeline) == {"fetch": "cached", "double": "cached", "describe": "cached"}
+
+def test_changed_params_rerun_downstream(tmp_path):
+    calls = Calls()
+    make_pipeline(calls, tmp_path).run()
+    calls.runs = []
+    assert make_pipeline(calls, tmp_path, factor=3).run()["describe"] == "value 3"
+    assert calls.runs == ["double", "describe"]
+
+def test_volatile_stage_reruns_and_unchanged_output_skips_the_rest(tmp_path):
+    calls = Calls()
+    make_pipeline(calls, tmp_path, volatile=True).run()
+    calls.runs = []
+    pipeline = make_pipeline(calls, tmp_path, volatile=True)
+    pipeline.run()
+    assert calls.runs == ["fetch"]
+    assert statuses(pipeline) == {"fetch": "ran", "double": "cached", "describe": "cached"}
+    #New outside data: everything after it runs again
+    calls.runs = []
+    calls.source = 5
+    assert make_pipeline(calls, tmp_path, volatile=True).run()["describe"] == "value 10"
+    assert calls.runs == ["fetch", "double", "describe"]
+
+def test_force(tmp_path):
+    calls = Calls()
+    make_pipeline(calls, tmp_path).run()
+    calls.runs = []
+    make_pipeline(calls, tmp_path).run(force=["double"])
+    #describe's input hash is unchanged, so it stays cached
+    assert calls.runs == ["double"]
+
+def test_targets_run_their_dependencies_only(tmp_path):
+    calls = Calls()
+    assert make_pipeline(calls, tmp_path).run(targets=["double"]) == {"double": 2}
+    assert calls.runs == ["fetch", "double"]
+
+def test_unknown_stage_names(tmp_path):
+    calls = Calls()
+    pipeline = make_pipeline(calls, tmp_path)
+    with pytest.raises(ValueError, match="Unknown stages: nope"):
+        pipeline.run(targets=["nope"])
+    with pytest.raises(ValueError, match="Unknown stages: nope"):
+        pipeline.run(force=["nope"])
+    with pytest.raises(ValueError, match="needs unknown stage"):
+        Pipeline([Stage("a", calls.describe, inputs=["missing"])], cache_dir=str(tmp_path))
+    assert calls.runs == []
+
+def test_unresolvable_inputs(tmp_path):
+    calls = Calls()
+    pipeline = Pipeline([Stage("fetch", calls.fetch),
+                         Stage("a", calls.describe, inputs=["b"]),
+                         Stage("b", calls.describe, inputs=["a"])], cache_dir=str(tmp_path))
+    with pytest.raises(ValueError, match="unresolvable inputs: a, b"):
+        pipeline.run()
+
+def test_independent_stages_run_in_parallel(tmp_path):
+    #Each branch waits for the other to start: only finishes if both run at once
+    barrier = threading.Barrier(2, timeout=10)
+
+    def branch(context, value):
+        barrier.wait()
+        return value
+
+    def join(context, left, right):
+        return left + right
+
+    pipeline = Pipeline([Stage("left", branch, params={"value": 1}),
+                         Stage("right", branch, params={"value": 2}),
+                         Stage("join", join, inputs=["left", "right"])], cache_dir=str(tmp_path), max_workers=2)
+    assert pipeline.run()["join"] == 3
+    assert statuses(pipeline) == {"left": "ran", "right": "ran", "join": "ran"}
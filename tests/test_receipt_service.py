@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+ReceiptService call counts against RecordedLogProvider
+"""
+
+import types
+
+import pytest
+from web3 import Web3
+
+import receipt_service
+from metrics import REGISTRY, instrument_provider
+from receipt_service import ReceiptService, batch_request
+from stub_provider import RecordedLogProvider
+
+def make_receipts(n):
+    receipts = {}
+    for i in range(n):
+        txhash = "0x{:064x}".format(i + 1)
+        receipts[txhash] = {"transactionHash": txhash, "blockNumber": hex(5000000 + i), "transactionIndex": "0x0",
+                            "status": "0x1", "logs": []}
+    return receipts
+
+class FlakyProvider(RecordedLogProvider):
+    """Fails the first receipt call of some tx hashes"""
+
+    def __init__(self, *args, flaky=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flaky = set(flaky)
+
+    def _answer(self, method, params):
+        if method == "eth_getTransactionReceipt" and params[0] in self.flaky:
+            with self._lock:
+                self.calls[method] = self.calls.get(method, 0) + 1
+                self.flaky.discard(params[0])
+            return self._error(-32603, "request failed, please retry")
+        return super()._answer(method, params)
+
+@pytest.fixture
+def receipts():
+    return make_receipts(250)
+
+def test_one_batch_per_batch_size(receipts, tmp_path):
+    provider = RecordedLogProvider([], receipts=receipts)
+    service = ReceiptService(Web3(provider), str(tmp_path / "receipts.sqlite"), batch_size=100)
+    found = service.get_receipts(list(receipts))
+    assert found == receipts
+    assert provider.batches == 3
+    assert provider.calls == {"eth_getTransactionReceipt": 250}
+    assert service.stats() == {"cache_hits": 0, "fetched": 250, "batches": 3}
+
+def test_warm_cache_makes_no_calls(receipts, tmp_path):
+    path = str(tmp_path / "receipts.sqlite")
+    ReceiptService(Web3(RecordedLogProvider([], receipts=receipts)), path).get_receipts(list(receipts))
+    provider = RecordedLogProvider([], receipts=receipts)
+    service = ReceiptService(Web3(provider), path)
+    #Hashes in any case or as bytes hit the same cache rows
+    hashes = [x.upper().replace("0X", "0x") for x in list(receipts)[:100]] + [bytes.fromhex(x[2:]) for x in list(receipts)[100:]]
+    assert service.get_receipts(hashes) == receipts
+    assert provider.batches == 0 and provider.calls == {}
+    assert service.stats()["cache_hits"] == 250
+
+def test_errored_entries_refetched_alone(receipts, tmp_path):
+    flaky = list(receipts)[::60]
+    provider = FlakyProvider([], receipts=receipts, flaky=flaky)
+    service = ReceiptService(Web3(provider), str(tmp_path / "receipts.sqlite"), batch_size=100, max_workers=1, backoff=0)
+    assert service.get_receipts(list(receipts)) == receipts
+    #Each batch with a failed entry asks again for those entries only
+    assert provider.batches == 3 + 3
+    assert provider.calls == {"eth_getTransactionReceipt": 250 + len(flaky)}
+
+def test_missing_receipts_left_out(receipts, tmp_path):
+    provider = RecordedLogProvider([], receipts=receipts)
+    service = ReceiptService(Web3(provider), str(tmp_path / "receipts.sqlite"))
+    unknown = "0x" + "ab"*32
+    assert service.get_receipt(unknown) is None
+    assert service.get_receipts([unknown, list(receipts)[0]]) == dict([list(receipts.items())[0]])
+    #Unknown transactions are not cached, they may still be mined
+    assert provider.calls["eth_getTransactionReceipt"] == 3
+
+def test_posted_batches_counted(receipts, monkeypatch):
+    #A provider without make_batch_request (web3 v5 HTTPProvider): batches are posted directly
+    stub = RecordedLogProvider([], receipts=receipts)
+    provider = types.SimpleNamespace(endpoint_uri="http://node", make_request=stub.make_request)
+    instrument_provider(provider)
+
+    class Response:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return [dict(stub.make_request(x["method"], x["params"]), id=x["id"]) for x in reversed(self.payload)]
+
+    monkeypatch.setattr(receipt_service.requests, "post", lambda url, json, timeout: Response(json))
+    REGISTRY.reset()
+    hashes = list(receipts)[:10]
+    responses = batch_request(types.SimpleNamespace(provider=provider), [("eth_getTransactionReceipt", [x]) for x in hashes])
+    assert [x["result"]["transactionHash"] for x in responses] == hashes
+    assert REGISTRY.total("sr_rpc_calls_total", method="eth_getTransactionReceipt") == 10
+    assert REGISTRY.summary("sr_rpc_seconds", method="batch")[0] == 1
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar batch decoder for ERC-721 Transfer logs
+
+decode_transfer_logs walks a list of logs once and fills preallocated
+column arrays. The Transfer topic is hashed once at import, the token ID
+location is chosen by topic count (4 topics: indexed token ID, SuperRare
+V2 and most ERC-721s; 3 topics: token ID in data, SuperRare V1) unless
+the contract registry says where it is, and from/to addresses are
+interned to int codes into one address table, or into a shared
+address_book.AddressBook when one is given. Rows are identified by
+(txhash, logIndex), which unlike txhash + tokenID cannot collide.
+
+Logs can come straight from w3.eth.get_logs (HexBytes topics) or be raw
+JSON-RPC logs (hex strings).
+"""
+
+import numpy as np
+import pandas as pd
+from web3 import Web3
+
+TRANSFER_TOPIC = bytes(Web3.keccak(text="Transfer(address,address,uint256)"))
+TRANSFER_TOPIC_HEX = "0x" + TRANSFER_TOPIC.hex()
+
+def _as_bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+def _as_int(value):
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return int(value, 16)
+    return int.from_bytes(value, "big")
+
+class TransferBatch:
+    """
+    Decoded transfers as columns
+
+    Attributes
+    ----------
+    txhash : ndarray of str
+    from_code, to_code : ndarray of int32
+        positions in addresses, or codes in book.
+    addresses : ndarray of str
+        lowercase 0x addresses, address table of from_code and to_code.
+        None when decoded into a book.
+    token_id : ndarray
+        int64, or object when a token ID doesn't fit in int64.
+    block_number : ndarray of int64
+    transaction_index, log_index : ndarray of int32
+    """
+
+    def __init__(self, txhash, from_code, to_code, addresses, token_id, block_number, transaction_index, log_index, book=None):
+        self.book = book
+        self.txhash = txhash
+        self.from_code = from_code
+        self.to_code = to_code
+        self.addresses = addresses
+        self.token_id = token_id
+        self.block_number = block_number
+        self.transaction_index = transaction_index
+        self.log_index = log_index
+
+    def __len__(self):
+        return len(self.txhash)
+
+    def to_frame(self):
+        """
+        DataFrame with the columns decode_event_logs produced: txhash, from,
+        to, tokenID, blockNumber, transactionIndex, logIndex
+
+        from and to are int32 book codes when decoded into a book.
+        """
+        if self.book is not None:
+            sender, recipient = self.from_code, self.to_code
+        else:
+            sender, recipient = self.addresses[self.from_code], self.addresses[self.to_code]
+        return pd.DataFrame({"txhash": self.txhash,
+                             "from": sender,
+                             "to": recipient,
+                             "tokenID": self.token_id,
+                             "blockNumber": self.block_number,
+                             "transactionIndex": self.transaction_index,
+                             "logIndex": self.log_index})
+
+def decode_transfer_logs(logs, book=None, token_id_in=None):
+    """
+    Decode the ERC-721 Transfer events among logs
+
+    Logs with another topic0, or fewer than 3 topics, are skipped. A log
+    repeated with the same (txhash, logIndex) is kept once. With an
+    AddressBook, from/to are interned into it and no address string is made.
+    token_id_in ("topic" or "data", see contracts.Contract) keeps only the
+    logs with the token ID there.
+
+    Returns
+    -------
+    TransferBatch
+    """
+    n = len(logs)
+    txhash = np.empty(n, dtype=object)
+    from_code = np.empty(n, dtype=np.int32)
+    to_code = np.empty(n, dtype=np.int32)
+    token_id = np.empty(n, dtype=object)
+    block_number = np.empty(n, dtype=np.int64)
+    transaction_index = np.empty(n, dtype=np.int32)
+    log_index = np.empty(n, dtype=np.int32)
+    #Raw topic (bytes or hex string) -> address code
+    codes = {}
+    addresses = []
+    seen = set()
+
+    def intern(topic):
+        code = codes.get(topic)
+        if code is None:
+            #Last 20 bytes of the 32-byte topic
+            raw = _as_bytes(topic)[12:]
+            if book is not None:
+                code = codes[topic] = book.add(raw)
+            else:
+                code = codes[topic] = len(addresses)
+                addresses.append("0x" + raw.hex())
+        return code
+
+    required = {None: None, "topic": 4, "data": 3}[token_id_in]
+    i = 0
+    for event in logs:
+        topics = event["topics"]
+        n_topics = len(topics)
+        if n_topics < 3 or (required and n_topics != required):
+            continue
+        topic0 = topics[0]
+        if topic0 != TRANSFER_TOPIC and topic0 != TRANSFER_TOPIC_HEX:
+            continue
+        tx = event["transactionHash"]
+        if not isinstance(tx, str):
+            tx = "0x" + bytes.hex(tx)
+        li = event["logIndex"]
+        if not isinstance(li, int):
+            li = int(li, 16)
+        key = (tx, li)
+        if key in seen:
+            continue
+        seen.add(key)
+        txhash[i] = tx
+        log_index[i] = li
+        from_code[i] = intern(topics[1])
+        to_code[i] = intern(topics[2])
+        #SuperRare V2 tokens in topic, V1 tokens in data
+        token_id[i] = _as_int(topics[3]) if n_topics == 4 else _as_int(event["data"])
+        block_number[i] = _as_int(event["blockNumber"])
+        transaction_index[i] = _as_int(event["transactionIndex"])
+        i += 1
+
+    token_id = token_id[:i]
+    if i and max(token_id) < 2**63:
+        token_id = token_id.astype(np.int64)
+
+    return TransferBatch(txhash[:i], from_code[:i], to_code[:i], None if book is not None else np.array(addresses, dtype=object),
+                         token_id, block_number[:i], transaction_index[:i], log_index[:i], book=book)